@@ -43,6 +43,46 @@ app.conf.beat_schedule = {
         'task': 'apps.analytics.tasks.generate_daily_snapshots',
         'schedule': crontab(hour=0, minute=0),
     },
+    # Release stock held by unpaid card/mobile-money sales every minute
+    'release-expired-reservations': {
+        'task': 'sales.tasks.release_expired_stock_reservations',
+        'schedule': 60.0,
+    },
+    # Send Paystack initializations left pending or stuck mid-call
+    'dispatch-payment-outbox': {
+        'task': 'payments.tasks.dispatch_payment_outbox',
+        'schedule': 60.0,
+    },
+    # Delete expired sale idempotency keys hourly
+    'purge-idempotency-keys': {
+        'task': 'sales.tasks.purge_expired_idempotency_keys',
+        'schedule': crontab(minute=15),
+    },
+    # Refresh the current_stock snapshot of sharded (hot) products
+    'refresh-sharded-stock': {
+        'task': 'products.tasks.refresh_sharded_stock_totals',
+        'schedule': 60.0,
+    },
+    # Resume product imports whose worker died, from their last checkpoint
+    'resume-product-imports': {
+        'task': 'products.tasks.resume_product_imports',
+        'schedule': 60.0,
+    },
+    # Keep next months' sales partitions created (no-op until partitioned)
+    'create-sale-partitions': {
+        'task': 'sales.tasks.create_sale_partitions',
+        'schedule': crontab(hour=2, minute=0),
+    },
+    # Drop cached receipt PDFs that are superseded or long unread
+    'sweep-receipt-cache': {
+        'task': 'sales.tasks.sweep_receipt_cache',
+        'schedule': crontab(hour=4, minute=0),
+    },
+    # Move sales past the retention window to the Parquet archive monthly
+    'archive-old-sales': {
+        'task': 'sales.tasks.archive_old_sales',
+        'schedule': crontab(day_of_month=1, hour=3, minute=0),
+    },
 }
 
 # Celery configuration
@@ -138,11 +138,107 @@ CORS_ALLOW_CREDENTIALS = True
 PAYSTACK_SECRET_KEY = config('PAYSTACK_SECRET_KEY', '')
 PAYSTACK_PUBLIC_KEY = config('PAYSTACK_PUBLIC_KEY', '')
 PAYSTACK_WEBHOOK_SECRET = config('PAYSTACK_WEBHOOK_SECRET', '')
+PAYSTACK_BASE_URL = config('PAYSTACK_BASE_URL', default='https://api.paystack.co')
+# Initialize card/mobile-money payments from a Celery worker (202 + polling)
+# instead of right after the sale commits in the same request
+PAYSTACK_OUTBOX_ASYNC = config('PAYSTACK_OUTBOX_ASYNC', default=False, cast=bool)
+
+# How long a sale Idempotency-Key is remembered (seconds)
+SALE_IDEMPOTENCY_KEY_TTL = config('SALE_IDEMPOTENCY_KEY_TTL', default=24 * 60 * 60, cast=int)
+
+# Offline sale sync: sales per request and sales per transaction
+SALE_SYNC_MAX_BATCH = config('SALE_SYNC_MAX_BATCH', default=1000, cast=int)
+SALE_SYNC_CHUNK_SIZE = config('SALE_SYNC_CHUNK_SIZE', default=100, cast=int)
+
+# How long a pending card/mobile-money sale holds its stock (seconds)
+SALE_RESERVATION_TTL = config('SALE_RESERVATION_TTL', default=15 * 60, cast=int)
+
+# Monthly partitions kept ready ahead of time once the sales tables are
+# partitioned (manage.py partitions convert; Postgres only)
+SALE_PARTITION_MONTHS_AHEAD = config('SALE_PARTITION_MONTHS_AHEAD', default=3, cast=int)
+
+# Completed sales older than this many months are moved out of the
+# database into Parquet files (manage.py archive_sales)
+SALE_ARCHIVE_AFTER_MONTHS = config('SALE_ARCHIVE_AFTER_MONTHS', default=24, cast=int)
+SALE_ARCHIVE_DIR = config('SALE_ARCHIVE_DIR', default=os.path.join(BASE_DIR, 'archive', 'sales'))
 
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Rendered receipt PDFs. Any Django storage backend works here, in the same
+# shape as a STORAGES entry (e.g. S3 through django-storages).
+RECEIPT_CACHE_STORAGE = {
+    'BACKEND': config(
+        'RECEIPT_CACHE_BACKEND', default='django.core.files.storage.FileSystemStorage'
+    ),
+    'OPTIONS': {
+        'location': config('RECEIPT_CACHE_LOCATION', default=os.path.join(MEDIA_ROOT, 'receipts')),
+    },
+}
+# Renderings older than this many seconds are swept daily; superseded ones
+# are never read again, live ones simply re-render on the next print
+RECEIPT_CACHE_MAX_AGE = config('RECEIPT_CACHE_MAX_AGE', default=7 * 24 * 3600, cast=int)
+
+# Bulk receipt export: sales per chunk, render processes (1 = render inline),
+# and the largest range streamed directly; bigger ones are built by Celery
+# into RECEIPT_EXPORT_STORAGE and a signed download link, valid for
+# RECEIPT_EXPORT_LINK_MAX_AGE seconds, is emailed. The archives hold customer
+# details, so they are kept outside MEDIA_ROOT and only served by that link.
+RECEIPT_EXPORT_CHUNK_SIZE = config('RECEIPT_EXPORT_CHUNK_SIZE', default=200, cast=int)
+RECEIPT_EXPORT_WORKERS = config('RECEIPT_EXPORT_WORKERS', default=min(os.cpu_count() or 1, 4), cast=int)
+RECEIPT_EXPORT_STREAM_MAX = config('RECEIPT_EXPORT_STREAM_MAX', default=5000, cast=int)
+RECEIPT_EXPORT_STORAGE = {
+    'BACKEND': config(
+        'RECEIPT_EXPORT_BACKEND', default='django.core.files.storage.FileSystemStorage'
+    ),
+    'OPTIONS': {
+        'location': config(
+            'RECEIPT_EXPORT_LOCATION', default=os.path.join(BASE_DIR, 'private', 'receipt-exports')
+        ),
+    },
+}
+RECEIPT_EXPORT_LINK_MAX_AGE = config('RECEIPT_EXPORT_LINK_MAX_AGE', default=24 * 3600, cast=int)
+
+# Uploaded product catalogs waiting to be imported by a Celery worker.
+# Shared between web and worker processes, so use a networked storage
+# (e.g. S3) when they run on different hosts.
+PRODUCT_IMPORT_STORAGE = {
+    'BACKEND': config(
+        'PRODUCT_IMPORT_BACKEND', default='django.core.files.storage.FileSystemStorage'
+    ),
+    'OPTIONS': {
+        'location': config(
+            'PRODUCT_IMPORT_LOCATION', default=os.path.join(MEDIA_ROOT, 'product-imports')
+        ),
+    },
+}
+# Import runs that may fail (worker errors, not bad rows) before a job is
+# given up; a job whose worker died resumes from its last committed chunk
+PRODUCT_IMPORT_MAX_ATTEMPTS = config('PRODUCT_IMPORT_MAX_ATTEMPTS', default=3, cast=int)
+
+# Caches. Report results (sales/inventory reports, shop KPIs) live in the
+# 'reports' cache; the local-memory default is per process, so use a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache) when several
+# web or Celery workers complete sales, or invalidations will not reach them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reports': {
+        'BACKEND': config(
+            'REPORT_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': config('REPORT_CACHE_LOCATION', default='reports'),
+        'TIMEOUT': config('REPORT_CACHE_TIMEOUT', default=3600, cast=int),
+    },
+}
+# A cached report is revalidated after this many seconds even without a
+# sale or stock change; waiters give up on a concurrent recompute after
+# REPORT_CACHE_LOCK_TIMEOUT seconds and compute it themselves
+REPORT_CACHE_MAX_AGE = config('REPORT_CACHE_MAX_AGE', default=300, cast=int)
+REPORT_CACHE_LOCK_TIMEOUT = config('REPORT_CACHE_LOCK_TIMEOUT', default=30, cast=int)
+
 # Static files
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles_build')
@@ -185,6 +281,8 @@ TEMPLATES = [
 # Frontend URL for password reset links
 FRONTEND_URL = config('FRONTEND_URL', default='http://localhost:5173')
 SITE_URL = config('SITE_URL', default='http://localhost:5173')
+# Public address of this API, for links in emails
+API_URL = config('API_URL', default='http://localhost:8000')
 
 # Email Backend Configuration
 # For DEVELOPMENT - prints emails to console (no real emails sent)
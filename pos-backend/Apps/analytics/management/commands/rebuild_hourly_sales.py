@@ -0,0 +1,26 @@
+# apps/analytics/management/commands/rebuild_hourly_sales.py
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.rollups import rebuild_hourly_sales
+
+
+class Command(BaseCommand):
+    help = "Recompute the hourly sales rollup from completed sales and the sales archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', default=None,
+                            help='First shop-local day to rebuild (YYYY-MM-DD); default all history')
+        parser.add_argument('--shop', type=int, nargs='+', default=None, help='Only these shop ids')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError("--since must be a date in YYYY-MM-DD format")
+
+        rows = rebuild_hourly_sales(shop_ids=options['shop'], since=since)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} hourly rollup rows"))
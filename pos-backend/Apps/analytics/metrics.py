@@ -1,11 +1,12 @@
 
 # apps/analytics/metrics.py
 from django.db.models import Sum, Count, Avg, F, Q
-from django.utils import timezone
+from django.db.models.functions import ExtractHour, TruncDate
 from datetime import timedelta
 from decimal import Decimal
 from sales.models import Sale, SaleItem
 from products.models import Product
+from shops.dates import local_today, shop_zone, window_q
 from .models import AnalyticsSnapshot
 
 
@@ -14,16 +15,17 @@ class AnalyticsEngine:
     
     def __init__(self, shop, date=None):
         self.shop = shop
-        self.date = date or timezone.now().date()
+        self.zone = shop_zone(shop)
+        self.date = date or local_today(self.zone)
     
     def generate_daily_snapshot(self):
         """Generate daily analytics snapshot"""
         
         # Get sales for the day
         sales = Sale.objects.filter(
+            window_q(self.date, self.date, self.zone),
             shop=self.shop,
-            status='completed',
-            created_at__date=self.date
+            status='completed'
         )
         
         # Basic metrics
@@ -36,6 +38,7 @@ class AnalyticsEngine:
         
         # Items sold
         total_items = SaleItem.objects.filter(
+            window_q(self.date, self.date, self.zone),
             sale__in=sales
         ).aggregate(total=Sum('quantity'))['total'] or 0
         
@@ -59,6 +62,7 @@ class AnalyticsEngine:
         
         # Top products
         top_products = SaleItem.objects.filter(
+            window_q(self.date, self.date, self.zone),
             sale__in=sales
         ).values(
             'product__id',
@@ -90,8 +94,8 @@ class AnalyticsEngine:
             cashier_perf[cashier_id]['revenue'] += float(sale.total_amount)
         
         # Peak hour
-        peak_hour = sales.extra(
-            select={'hour': 'EXTRACT(hour FROM created_at)'}
+        peak_hour = sales.annotate(
+            hour=ExtractHour('created_at', tzinfo=self.zone)
         ).values('hour').annotate(
             count=Count('id')
         ).order_by('-count').first()
@@ -185,12 +189,12 @@ class AnalyticsEngine:
         start_date = end_date - timedelta(days=30)
         
         sales_data = SaleItem.objects.filter(
+            window_q(start_date, end_date, self.zone),
             product_id=product_id,
             sale__shop=self.shop,
-            sale__status='completed',
-            sale__created_at__date__range=(start_date, end_date)
-        ).extra(
-            select={'date': 'DATE(sale__created_at)'}
+            sale__status='completed'
+        ).annotate(
+            date=TruncDate('created_at', tzinfo=self.zone)
         ).values('date').annotate(
             quantity=Sum('quantity')
         ).order_by('date')
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:58
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_initial'),
+        ('shops', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopHourlySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('payment_method', models.CharField(max_length=20)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('items_sold', models.PositiveIntegerField(default=0)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_sales', to='shops.shop')),
+            ],
+            options={
+                'ordering': ['shop', 'hour'],
+                'unique_together': {('shop', 'hour', 'payment_method')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 05:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_shophourlysales'),
+        ('shops', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shophourlysales',
+            index=models.Index(fields=['hour'], name='analytics_s_hour_fdf006_idx'),
+        ),
+    ]
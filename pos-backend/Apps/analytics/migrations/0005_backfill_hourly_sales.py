@@ -0,0 +1,26 @@
+# Backfill the hourly rollup for sales completed before it existed
+
+from django.db import migrations
+
+
+def backfill(apps, schema_editor):
+    ShopHourlySales = apps.get_model('analytics', 'ShopHourlySales')
+    Sale = apps.get_model('sales', 'Sale')
+    if ShopHourlySales.objects.exists() or not Sale.objects.filter(status='completed').exists():
+        return
+    # The rebuild also reads the sales archive, which only the app code knows
+    from analytics.rollups import rebuild_hourly_sales
+    rebuild_hourly_sales()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_shophourlysales_hour_index'),
+        ('sales', '0006_saleitem_created_at'),
+        ('shops', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
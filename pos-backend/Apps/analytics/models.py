@@ -100,3 +100,34 @@ class PredictiveMetric(models.Model):
             models.Index(fields=['shop', 'metric_type', 'prediction_date']),
         ]
 
+
+
+class ShopHourlySales(models.Model):
+    """Completed-sale totals per shop, shop-local hour and payment method.
+
+    Upserted as each sale completes (``analytics.rollups``), so dashboards
+    add up a few hundred rows instead of scanning sales. Archived sales
+    stay counted here.
+    """
+    
+    shop = models.ForeignKey(
+        'shops.Shop',
+        on_delete=models.CASCADE,
+        related_name='hourly_sales'
+    )
+    hour = models.DateTimeField()  # Start of the hour on the shop's wall clock
+    payment_method = models.CharField(max_length=20)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    transaction_count = models.PositiveIntegerField(default=0)
+    items_sold = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['shop', 'hour']
+        unique_together = [['shop', 'hour', 'payment_method']]
+        indexes = [
+            # All-shop reports filter on the hour range alone
+            models.Index(fields=['hour']),
+        ]
+    
+    def __str__(self):
+        return f"{self.shop_id} {self.hour:%Y-%m-%d %H:00} {self.payment_method}: {self.revenue}"
@@ -0,0 +1,195 @@
+# apps/analytics/rollups.py
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Greatest, Trunc
+
+from reports.cache import invalidate_reports
+from sales.archive import SaleArchive
+from sales.models import Sale, SaleItem
+from shops.dates import day_range_bounds, get_zone, shop_timezones, shop_zone
+from shops.models import Shop
+from .models import ShopHourlySales
+
+
+def hour_bucket(moment, zone):
+    """Start of the shop-local hour containing ``moment``"""
+    return moment.astimezone(zone).replace(minute=0, second=0, microsecond=0)
+
+
+def _upsert(totals):
+    """Add ``{(shop_id, hour, payment_method): [revenue, count, items]}`` to the rollup.
+
+    One ``INSERT ... ON CONFLICT DO UPDATE`` adds to existing rows, so
+    concurrent completions in the same hour never overwrite each other.
+    """
+    if not totals:
+        return
+    table = ShopHourlySales._meta.db_table
+    fields = [
+        ShopHourlySales._meta.get_field(name)
+        for name in ('shop', 'hour', 'payment_method', 'revenue', 'transaction_count', 'items_sold')
+    ]
+    columns = ', '.join(field.column for field in fields)
+    params = []
+    for (shop_id, hour, payment_method), values in sorted(totals.items()):
+        row = (shop_id, hour, payment_method, *values)
+        params += [field.get_db_prep_save(value, connection) for field, value in zip(fields, row)]
+    placeholders = ', '.join([f"({', '.join(['%s'] * len(fields))})"] * len(totals))
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) VALUES {placeholders} '
+            f'ON CONFLICT (shop_id, hour, payment_method) DO UPDATE SET '
+            f'revenue = {table}.revenue + excluded.revenue, '
+            f'transaction_count = {table}.transaction_count + excluded.transaction_count, '
+            f'items_sold = {table}.items_sold + excluded.items_sold',
+            params
+        )
+
+
+def _subtract(totals):
+    """Take ``{(shop_id, hour, payment_method): [revenue, count, items]}`` off the rollup.
+
+    Existing rows are decremented in place, never below zero, and rows
+    left without any sale are dropped.
+    """
+    for (shop_id, hour, payment_method), (revenue, count, units) in sorted(totals.items()):
+        ShopHourlySales.objects.filter(
+            shop_id=shop_id, hour=hour, payment_method=payment_method
+        ).update(
+            revenue=Greatest(F('revenue') - revenue, Value(Decimal('0.00'))),
+            transaction_count=Greatest(F('transaction_count') - count, Value(0)),
+            items_sold=Greatest(F('items_sold') - units, Value(0))
+        )
+    ShopHourlySales.objects.filter(
+        shop_id__in={shop_id for shop_id, _, _ in totals},
+        hour__in={hour for _, hour, _ in totals},
+        transaction_count=0
+    ).delete()
+
+
+def items_sold_by_sale(sales):
+    """``{sale id: units sold}`` read from the sales' items in one query"""
+    return dict(
+        SaleItem.objects.filter(sale__in=sales)
+        .values('sale_id')
+        .annotate(total=Sum('quantity'))
+        .values_list('sale_id', 'total')
+    )
+
+
+def _apply(sales, items_sold, apply):
+    sales = list(sales)
+    if not sales:
+        return
+    if items_sold is None:
+        items_sold = items_sold_by_sale(sales)
+
+    totals = defaultdict(lambda: [Decimal('0.00'), 0, 0])
+    for sale in sales:
+        key = (sale.shop_id, hour_bucket(sale.created_at, shop_zone(sale.shop)), sale.payment_method)
+        totals[key][0] += sale.total_amount
+        totals[key][1] += 1
+        totals[key][2] += items_sold.get(sale.id, 0)
+    apply(totals)
+    invalidate_reports({sale.shop_id for sale in sales})
+
+
+def add_completed_sales(sales, items_sold=None):
+    """Count sales that just became completed in the hourly rollup.
+
+    ``items_sold`` maps sale id to units sold; when omitted it is read
+    from the sales' items in one query. Call it in the transaction that
+    completes the sales; cached reports of their shops go stale on commit.
+    """
+    _apply(sales, items_sold, _upsert)
+
+
+def remove_completed_sales(sales, items_sold=None):
+    """Take completed sales back out of the rollup (deleted, refunded or edited).
+
+    ``sales`` carry the values they were counted with. The rollup
+    signals call this; archived sales stay counted.
+    """
+    _apply(sales, items_sold, _subtract)
+
+
+def rebuild_hourly_sales(shop_ids=None, since=None):
+    """Recompute the rollup from completed sales and the sales archive.
+
+    ``since`` is a date: rows from that shop-local day on are replaced,
+    earlier ones are kept. Returns the number of rollup rows written.
+    """
+    shops = Shop.objects.all() if shop_ids is None else Shop.objects.filter(id__in=shop_ids)
+    archive = SaleArchive()
+    written = 0
+
+    with transaction.atomic():
+        for name, ids in shop_timezones(shops).items():
+            zone = get_zone(name)
+            start = day_range_bounds(since, None, zone)[0] if since else None
+            totals = defaultdict(lambda: [Decimal('0.00'), 0, 0])
+
+            sales = Sale.objects.filter(shop_id__in=ids, status='completed')
+            items = SaleItem.objects.filter(sale__shop_id__in=ids, sale__status='completed')
+            if start is not None:
+                sales = sales.filter(created_at__gte=start)
+                items = items.filter(sale__created_at__gte=start)
+            for row in (
+                sales.annotate(bucket=Trunc('created_at', 'hour', tzinfo=zone))
+                .values('shop_id', 'bucket', 'payment_method')
+                .annotate(revenue=Sum('total_amount'), count=Count('id'))
+                .order_by()
+            ):
+                key = (row['shop_id'], row['bucket'].astimezone(dt_timezone.utc), row['payment_method'])
+                totals[key][0] += row['revenue']
+                totals[key][1] += row['count']
+            for row in (
+                items.annotate(bucket=Trunc('sale__created_at', 'hour', tzinfo=zone))
+                .values('sale__shop_id', 'bucket', 'sale__payment_method')
+                .annotate(quantity=Sum('quantity'))
+                .order_by()
+            ):
+                key = (row['sale__shop_id'], row['bucket'].astimezone(dt_timezone.utc),
+                       row['sale__payment_method'])
+                totals[key][2] += row['quantity']
+
+            # Archived sales, one shop-month at a time
+            for entry in archive.entries(ids, start):
+                first = datetime.fromisoformat(entry['start'])
+                bounds = {
+                    'shop_ids': [entry['shop_id']],
+                    'start': max(first, start) if start else first,
+                    'end': datetime.fromisoformat(entry['end']),
+                }
+                archived = archive.read(
+                    'sales', **bounds,
+                    columns=['id', 'shop_id', 'payment_method', 'total_amount', 'created_at']
+                )
+                quantities = archive.read('items', **bounds, columns=['sale_id', 'quantity'])
+                units = quantities.groupby('sale_id')['quantity'].sum().to_dict()
+                for row in archived.itertuples(index=False):
+                    bucket = hour_bucket(row.created_at.to_pydatetime(), zone).astimezone(dt_timezone.utc)
+                    key = (row.shop_id, bucket, row.payment_method)
+                    totals[key][0] += row.total_amount
+                    totals[key][1] += 1
+                    totals[key][2] += int(units.get(row.id, 0))
+
+            stale = ShopHourlySales.objects.filter(shop_id__in=ids)
+            if start is not None:
+                stale = stale.filter(hour__gte=start)
+            stale.delete()
+            ShopHourlySales.objects.bulk_create([
+                ShopHourlySales(
+                    shop_id=shop_id, hour=hour, payment_method=payment_method,
+                    revenue=revenue, transaction_count=count, items_sold=units
+                )
+                for (shop_id, hour, payment_method), (revenue, count, units) in totals.items()
+            ], batch_size=1000)
+            written += len(totals)
+            invalidate_reports(ids)
+    return written
@@ -0,0 +1,65 @@
+# apps/analytics/signals.py
+"""Keep the hourly rollup in step with completed sales that change.
+
+Sales are added to the rollup where they complete (checkout, offline
+sync, ``mark_sale_paid``). A completed sale that is later edited,
+refunded or deleted is corrected here, from the values it was loaded
+with.
+"""
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from sales.archive import archiving
+from sales.models import Sale
+from .rollups import add_completed_sales, items_sold_by_sale, remove_completed_sales
+
+ROLLUP_FIELDS = ('status', 'shop_id', 'created_at', 'payment_method', 'total_amount')
+
+
+def _rollup_state(sale):
+    """The values the rollup counts a sale by; None if some were not loaded"""
+    values = sale.__dict__
+    if any(field not in values for field in ROLLUP_FIELDS):
+        return None
+    return tuple(values[field] for field in ROLLUP_FIELDS)
+
+
+def _as_counted(sale, state):
+    """A copy of the sale holding the values it was counted with"""
+    status, shop_id, created_at, payment_method, total_amount = state
+    return Sale(
+        id=sale.id, status=status, shop_id=shop_id, created_at=created_at,
+        payment_method=payment_method, total_amount=total_amount
+    )
+
+
+@receiver(post_init, sender=Sale)
+def remember_rollup_state(sender, instance, **kwargs):
+    instance._rollup_state = _rollup_state(instance)
+
+
+@receiver(post_save, sender=Sale)
+def sale_saved(sender, instance, created, **kwargs):
+    before, after = instance._rollup_state, _rollup_state(instance)
+    instance._rollup_state = after
+    if created or before is None or before[0] != 'completed' or before == after:
+        return
+    items_sold = items_sold_by_sale([instance])
+    remove_completed_sales([_as_counted(instance, before)], items_sold)
+    if after is not None and after[0] == 'completed':
+        add_completed_sales([instance], items_sold)
+
+
+@receiver(pre_delete, sender=Sale)
+def count_deleted_items(sender, instance, **kwargs):
+    # Items are deleted before the sale; count them while they exist
+    state = instance._rollup_state
+    if state is not None and state[0] == 'completed' and not archiving.get():
+        instance._rollup_items_sold = items_sold_by_sale([instance])
+
+
+@receiver(post_delete, sender=Sale)
+def sale_deleted(sender, instance, **kwargs):
+    items_sold = getattr(instance, '_rollup_items_sold', None)
+    if items_sold is not None:
+        remove_completed_sales([_as_counted(instance, instance._rollup_state)], items_sold)
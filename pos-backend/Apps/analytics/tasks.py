@@ -1,9 +1,11 @@
 # apps/analytics/tasks.py
 from celery import shared_task
 from django.utils import timezone
+from datetime import timedelta
 from .models import AnalyticsSnapshot
 from .metrics import AnalyticsEngine
 from shops.models import Shop
+from shops.dates import local_today, shop_zone
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,12 +16,13 @@ def generate_daily_snapshots():
     """Generate daily analytics snapshots for all shops"""
     logger.info('Generating daily analytics snapshots...')
     
-    yesterday = timezone.now().date() - timedelta(days=1)
     shops = Shop.objects.filter(is_active=True)
     
     count = 0
     for shop in shops:
         try:
+            # "Yesterday" on the shop's own wall clock
+            yesterday = local_today(shop_zone(shop)) - timedelta(days=1)
             engine = AnalyticsEngine(shop, yesterday)
             engine.generate_daily_snapshot()
             count += 1
@@ -1,3 +1,131 @@
-from django.test import TestCase
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from products.models import Product
+from sales.archive import archive_sales
+from sales.checkout import CheckoutEngine
+from sales.models import Sale, SaleItem
+from sales.reservations import mark_sale_paid
+from shops.models import Shop
+from .models import ShopHourlySales
+from .rollups import rebuild_hourly_sales
+
+
+class HourlySalesRollupTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='cashier', password='pass', email='c@example.com', role='admin'
+        )
+        self.shop = Shop.objects.create(
+            name='Main', address='1 High St', phone='000', timezone='Asia/Kolkata'
+        )
+        self.product = Product.objects.create(
+            sku='TEA', name='Tea', unit_price=Decimal('1.50'), current_stock=100, shop=self.shop
+        )
+        caches['reports'].clear()
+
+    def checkout(self, quantity, payment_method='cash'):
+        with transaction.atomic():
+            engine = CheckoutEngine(self.shop, self.user)
+            basket = engine.prepare([
+                {'product_id': self.product.id, 'quantity': quantity, 'unit_price': '1.50'}
+            ])
+            return engine.checkout(
+                basket, payment_method=payment_method,
+                status='completed' if payment_method == 'cash' else 'pending'
+            )
+
+    def rollup(self):
+        return {
+            (row.hour, row.payment_method): (row.revenue, row.transaction_count, row.items_sold)
+            for row in ShopHourlySales.objects.filter(shop=self.shop)
+        }
+
+    def test_completed_sales_are_added_to_their_local_hour(self):
+        self.checkout(2)
+        self.checkout(3)
+        pending = self.checkout(4, payment_method='card')
+
+        [(hour, method)] = self.rollup()
+        self.assertEqual(method, 'cash')
+        # UTC+5:30: the bucket starts on the shop's wall-clock hour
+        self.assertEqual(hour.astimezone(ZoneInfo('Asia/Kolkata')).minute, 0)
+        self.assertEqual(hour.minute, 30)
+        self.assertEqual(self.rollup()[hour, 'cash'], (Decimal('7.50'), 2, 5))
+
+        mark_sale_paid(pending.id)
+        mark_sale_paid(pending.id)  # A repeated webhook is not counted twice
+        self.assertEqual(self.rollup()[hour, 'card'], (Decimal('6.00'), 1, 4))
+
+    def test_rebuild_matches_incremental_rollup_including_archive(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.enterContext(override_settings(SALE_ARCHIVE_DIR=root))
+
+        self.checkout(1)
+        old = self.checkout(2)
+        sale = self.checkout(5, payment_method='mobile_money')
+        mark_sale_paid(sale.id)
+        expected = self.rollup()
+
+        ShopHourlySales.objects.all().delete()
+        rebuild_hourly_sales()
+        self.assertEqual(self.rollup(), expected)
+
+        # An old sale moved to the archive is still counted after a rebuild
+        long_ago = old.created_at.replace(year=2020)
+        Sale.objects.filter(id=old.id).update(created_at=long_ago)
+        SaleItem.objects.filter(sale=old).update(created_at=long_ago)
+        rebuild_hourly_sales()
+        before_archiving = self.rollup()
+        self.assertEqual(archive_sales(months=0), (1, 1))
+        self.assertEqual(self.rollup(), before_archiving)  # Archived, not deleted
+        rebuild_hourly_sales()
+        self.assertEqual(self.rollup(), before_archiving)
+        self.assertEqual(sum(row[1] for row in before_archiving.values()), 3)
+
+    def test_edited_refunded_and_deleted_sales_leave_the_rollup(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.checkout(2)
+        edited = self.checkout(3)
+        refunded = self.checkout(1)
+        deleted = self.checkout(4)
+        [hour] = {hour for hour, _ in self.rollup()}
+        self.assertEqual(self.rollup()[hour, 'cash'], (Decimal('15.00'), 4, 10))
+
+        resp = client.patch(f'/api/sales/{edited.id}/', {'payment_method': 'card'}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.rollup()[hour, 'cash'], (Decimal('10.50'), 3, 7))
+        self.assertEqual(self.rollup()[hour, 'card'], (Decimal('4.50'), 1, 3))
+
+        refunded.status = 'refunded'
+        refunded.save()
+        self.assertEqual(client.delete(f'/api/sales/{deleted.id}/').status_code, 204)
+        self.assertEqual(self.rollup()[hour, 'cash'], (Decimal('3.00'), 1, 2))
+
+        # The emptied hour goes away, and the rollup matches a rebuild
+        Sale.objects.get(id=edited.id).delete()
+        expected = self.rollup()
+        self.assertEqual(list(expected), [(hour, 'cash')])
+        rebuild_hourly_sales()
+        self.assertEqual(self.rollup(), expected)
+
+    def test_report_reads_the_rollup(self):
+        self.checkout(2)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        # The report no longer scans sales: rollup rows are the source
+        ShopHourlySales.objects.update(revenue=Decimal('99.00'))
+        data = client.get('/api/reports/sales/').json()
+        self.assertEqual(data['today'], {'revenue': 99.0, 'transactions': 1})
+        self.assertEqual(data['daily_sales'][-1]['total_revenue'], 99.0)
@@ -84,3 +84,54 @@ class Subscription(models.Model):
 				return cls.PLAN_LIMITS.get(s.plan, 1)
 		return 0  # No active subscription
 
+
+
+class PaymentOutbox(models.Model):
+	"""Pending Paystack initialization for a sale (transactional outbox).
+
+	The row is written in the same transaction as the sale, so stock locks
+	are released before any HTTP call is made to the gateway.
+	"""
+	STATUS_PENDING = 'pending'
+	STATUS_PROCESSING = 'processing'
+	STATUS_SENT = 'sent'
+	STATUS_FAILED = 'failed'
+
+	STATUS_CHOICES = (
+		(STATUS_PENDING, 'Pending'),
+		(STATUS_PROCESSING, 'Processing'),
+		(STATUS_SENT, 'Sent'),
+		(STATUS_FAILED, 'Failed'),
+	)
+
+	sale = models.OneToOneField(
+		'sales.Sale',
+		on_delete=models.CASCADE,
+		related_name='payment_outbox'
+	)
+	payload = models.JSONField()
+	status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+	attempts = models.PositiveIntegerField(default=0)
+	response = models.JSONField(null=True, blank=True)
+	last_error = models.TextField(blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		ordering = ['created_at']
+		indexes = [
+			models.Index(fields=['status', 'updated_at']),
+		]
+
+	def __str__(self):
+		return f"PaymentOutbox({self.sale_id}, {self.status})"
+
+	def as_payment_data(self):
+		"""Shape returned to the till alongside the sale"""
+		response = self.response or {}
+		return {
+			'status': self.status,
+			'authorization_url': response.get('authorization_url'),
+			'access_code': response.get('access_code'),
+			'reference': response.get('reference', self.payload.get('reference')),
+		}
@@ -7,6 +7,19 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Separates a sale id from the attempt suffix of a re-initialized payment
+RETRY_SEPARATOR = '.r'
+
+
+def retry_reference(reference, attempt):
+    """A fresh reference for the sale's transaction, for attempt ``attempt``"""
+    return f'{sale_id_from_reference(reference)}{RETRY_SEPARATOR}{attempt}'
+
+
+def sale_id_from_reference(reference):
+    """The sale id a transaction reference was made from"""
+    return reference.split(RETRY_SEPARATOR, 1)[0]
+
 
 class PaystackClient:
     """Paystack API integration client"""
@@ -16,6 +29,7 @@ class PaystackClient:
     def __init__(self):
         self.secret_key = settings.PAYSTACK_SECRET_KEY
         self.public_key = settings.PAYSTACK_PUBLIC_KEY
+        self.base_url = getattr(settings, 'PAYSTACK_BASE_URL', self.BASE_URL)
         
     def _get_headers(self):
         return {
@@ -25,7 +39,7 @@ class PaystackClient:
     
     def initialize_transaction(self, email, amount, reference, callback_url=None, metadata=None):
         """Initialize a payment transaction"""
-        url = f"{self.BASE_URL}/transaction/initialize"
+        url = f"{self.base_url}/transaction/initialize"
         
         payload = {
             'email': email,
@@ -62,7 +76,7 @@ class PaystackClient:
     
     def verify_transaction(self, reference):
         """Verify a transaction"""
-        url = f"{self.BASE_URL}/transaction/verify/{reference}"
+        url = f"{self.base_url}/transaction/verify/{reference}"
         
         try:
             response = requests.get(
@@ -0,0 +1,116 @@
+# apps/payments/tasks.py
+from celery import shared_task
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from datetime import timedelta
+from .models import PaymentOutbox
+from .paystack import PaystackClient, retry_reference
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Verify statuses of a transaction nobody is paying; it is safe to start over
+UNPAID_STATUSES = {'abandoned', 'failed', 'reversed'}
+
+
+@shared_task
+def initialize_sale_payment(entry_id):
+    """Send one outbox entry to Paystack and record the outcome.
+
+    Runs outside any stock transaction. The entry is claimed with a
+    conditional UPDATE so concurrent workers never send it twice.
+    """
+    from sales.models import Sale
+    from sales.reservations import mark_sale_failed, mark_sale_paid
+
+    claimed = PaymentOutbox.objects.filter(
+        id=entry_id,
+        status=PaymentOutbox.STATUS_PENDING
+    ).update(
+        status=PaymentOutbox.STATUS_PROCESSING,
+        attempts=F('attempts') + 1,
+        updated_at=timezone.now()
+    )
+    if not claimed:
+        return None
+
+    entry = PaymentOutbox.objects.get(id=entry_id)
+    client = PaystackClient()
+    if entry.attempts > 1:
+        # An earlier attempt may have reached Paystack before its worker
+        # died, leaving no checkout URL behind
+        existing = client.verify_transaction(entry.payload['reference'])
+        status = existing.get('status') if existing else None
+        if status == 'success':
+            # Paid on the earlier checkout page before the webhook arrived
+            with transaction.atomic():
+                mark_sale_paid(entry.sale_id, existing)
+                entry.status = PaymentOutbox.STATUS_SENT
+                entry.response = {**(entry.response or {}), **existing}
+                entry.save()
+            return entry.status
+        if status is not None and status not in UNPAID_STATUSES:
+            # The customer is paying on it now; check again later
+            PaymentOutbox.objects.filter(id=entry.id).update(
+                status=PaymentOutbox.STATUS_PENDING, updated_at=timezone.now()
+            )
+            return PaymentOutbox.STATUS_PENDING
+        # Unknown or abandoned: start a new transaction, since Paystack
+        # rejects a reference it has already seen
+        entry.payload = {
+            **entry.payload, 'reference': retry_reference(entry.payload['reference'], entry.attempts)
+        }
+        entry.save(update_fields=['payload', 'updated_at'])
+    payment_data = client.initialize_transaction(**entry.payload)
+    if payment_data and not payment_data.get('authorization_url'):
+        # Without it the till has nowhere to send the customer
+        payment_data = None
+
+    with transaction.atomic():
+        # Partitioned sales only enforce a unique (reference, created_at),
+        # so a reference already held by another sale is refused here
+        if payment_data and Sale.objects.filter(
+            paystack_reference=payment_data['reference']
+        ).exclude(id=entry.sale_id).exists():
+            logger.error(f"Paystack reference {payment_data['reference']} is already used by another sale")
+            payment_data = None
+        if payment_data:
+            entry.status = PaymentOutbox.STATUS_SENT
+            entry.response = payment_data
+            Sale.objects.filter(id=entry.sale_id).update(
+                paystack_reference=payment_data['reference'],
+                updated_at=timezone.now()
+            )
+        else:
+            entry.status = PaymentOutbox.STATUS_FAILED
+            entry.last_error = 'Payment initialization failed'
+            mark_sale_failed(entry.sale_id)
+        entry.save()
+
+    logger.info(f"Payment initialization for sale {entry.sale_id}: {entry.status}")
+    return entry.status
+
+
+@shared_task
+def dispatch_payment_outbox(grace_seconds=30, stale_seconds=300, batch_size=100):
+    """Retry outbox entries that were never sent or whose worker died"""
+    now = timezone.now()
+
+    # Entries stuck mid-call go back to pending
+    PaymentOutbox.objects.filter(
+        status=PaymentOutbox.STATUS_PROCESSING,
+        updated_at__lt=now - timedelta(seconds=stale_seconds)
+    ).update(status=PaymentOutbox.STATUS_PENDING, updated_at=now)
+
+    entry_ids = list(
+        PaymentOutbox.objects.filter(
+            status=PaymentOutbox.STATUS_PENDING,
+            updated_at__lt=now - timedelta(seconds=grace_seconds)
+        ).values_list('id', flat=True)[:batch_size]
+    )
+
+    for entry_id in entry_ids:
+        initialize_sale_payment(entry_id)
+
+    return len(entry_ids)
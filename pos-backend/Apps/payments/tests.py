@@ -3,8 +3,15 @@ from django.urls import reverse
 from rest_framework.test import APIClient
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from .models import Subscription
+from .models import Subscription, PaymentOutbox
+from .paystack import PaystackClient
+from .tasks import dispatch_payment_outbox, initialize_sale_payment
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import json
+import threading
 
 
 class SubscriptionAPITest(TestCase):
@@ -70,3 +77,172 @@ class SubscriptionAPITest(TestCase):
 from django.test import TestCase
 
 # Create your tests here.
+
+
+class FakePaystackHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for the Paystack initialize endpoint"""
+    succeed = True
+    requests_seen = []
+    verify_status = 'abandoned'
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        duplicate = any(seen['reference'] == body['reference'] for seen in self.requests_seen)
+        self.requests_seen.append(body)
+        if duplicate:
+            self.respond(400, {'status': False, 'message': 'Duplicate Transaction Reference'})
+            return
+        if self.succeed:
+            payload = {'status': True, 'data': {
+                'authorization_url': f"https://checkout.test/{body['reference']}",
+                'access_code': 'ACCESS',
+                'reference': body['reference'],
+            }}
+        else:
+            payload = {'status': False, 'message': 'Declined'}
+        self.respond(200, payload)
+
+    def do_GET(self):
+        reference = self.path.rsplit('/', 1)[-1]
+        if any(seen['reference'] == reference for seen in self.requests_seen):
+            self.respond(200, {'status': True, 'data': {
+                'reference': reference, 'status': self.verify_status
+            }})
+        else:
+            self.respond(400, {'status': False, 'message': 'Transaction reference not found'})
+
+    def respond(self, code, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class PaymentOutboxTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakePaystackHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        from shops.models import Shop
+        from products.models import Product
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username='till', password='pass', email='till@example.com', role='admin'
+        )
+        self.shop = Shop.objects.create(name='Main', address='1 High St', phone='000')
+        self.product = Product.objects.create(
+            sku='BREAD', name='Bread', unit_price=Decimal('5.00'),
+            current_stock=10, shop=self.shop
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        FakePaystackHandler.succeed = True
+        FakePaystackHandler.requests_seen = []
+        FakePaystackHandler.verify_status = 'abandoned'
+
+    def post_card_sale(self):
+        with self.settings(PAYSTACK_BASE_URL=self.base_url):
+            return self.client.post('/api/sales/', {
+                'shop_id': self.shop.id,
+                'payment_method': 'card',
+                'items': [{'product_id': self.product.id, 'quantity': 2, 'unit_price': '5.00'}],
+            }, format='json')
+
+    def test_card_sale_initializes_after_commit(self):
+        resp = self.post_card_sale()
+        self.assertEqual(resp.status_code, 201)
+        data = resp.json()
+        sale_id = data['sale']['id']
+        self.assertEqual(data['payment']['reference'], sale_id)
+        self.assertEqual(FakePaystackHandler.requests_seen[0]['amount'], 1000)
+
+        entry = PaymentOutbox.objects.get(sale_id=sale_id)
+        self.assertEqual(entry.status, PaymentOutbox.STATUS_SENT)
+        self.assertEqual(entry.attempts, 1)
+
+        resp = self.client.get(f'/api/sales/{sale_id}/payment-status/')
+        self.assertEqual(resp.json()['payment']['status'], 'sent')
+
+    def test_declined_initialization_fails_sale(self):
+        FakePaystackHandler.succeed = False
+        resp = self.post_card_sale()
+        self.assertEqual(resp.status_code, 400)
+
+        entry = PaymentOutbox.objects.get()
+        self.assertEqual(entry.status, PaymentOutbox.STATUS_FAILED)
+        self.assertEqual(entry.sale.status, 'failed')
+
+    def test_entry_is_sent_only_once(self):
+        resp = self.post_card_sale()
+        entry = PaymentOutbox.objects.get(sale_id=resp.json()['sale']['id'])
+        with self.settings(PAYSTACK_BASE_URL=self.base_url):
+            self.assertIsNone(initialize_sale_payment(entry.id))
+        self.assertEqual(len(FakePaystackHandler.requests_seen), 1)
+
+    def lose_worker(self):
+        """A card sale whose worker reached Paystack, then died before recording it"""
+        sale_id = self.post_card_sale().json()['sale']['id']
+        PaymentOutbox.objects.filter(sale_id=sale_id).update(
+            status=PaymentOutbox.STATUS_PROCESSING, response=None,
+            updated_at=timezone.now() - timedelta(minutes=10)
+        )
+        with self.settings(PAYSTACK_BASE_URL=self.base_url):
+            self.assertEqual(dispatch_payment_outbox(), 0)  # back to pending
+            self.assertEqual(dispatch_payment_outbox(grace_seconds=0), 1)
+        return sale_id
+
+    def test_retry_of_a_sent_entry_does_not_fail_the_sale(self):
+        sale_id = self.lose_worker()
+
+        # The abandoned transaction is replaced by one with a new reference
+        entry = PaymentOutbox.objects.get(sale_id=sale_id)
+        self.assertEqual((entry.status, entry.attempts), (PaymentOutbox.STATUS_SENT, 2))
+        self.assertEqual(entry.response['reference'], f'{sale_id}.r2')
+        self.assertEqual(entry.sale.status, 'pending')
+        self.assertEqual(entry.sale.paystack_reference, f'{sale_id}.r2')
+        self.assertEqual(
+            [seen['reference'] for seen in FakePaystackHandler.requests_seen], [sale_id, f'{sale_id}.r2']
+        )
+        payment = self.client.get(f'/api/sales/{sale_id}/payment-status/').json()['payment']
+        self.assertEqual(payment['authorization_url'], f'https://checkout.test/{sale_id}.r2')
+
+        # Paying the new transaction completes the sale
+        with mock.patch.object(PaystackClient, 'verify_webhook_signature', return_value=True):
+            self.client.post(
+                '/api/payments/paystack/webhook/',
+                {'event': 'charge.success', 'data': {'reference': f'{sale_id}.r2'}},
+                format='json', HTTP_X_PAYSTACK_SIGNATURE='sig'
+            )
+        self.assertEqual(PaymentOutbox.objects.get(sale_id=sale_id).sale.status, 'completed')
+
+    def test_retry_of_a_paid_entry_completes_the_sale(self):
+        FakePaystackHandler.verify_status = 'success'
+        sale_id = self.lose_worker()
+
+        entry = PaymentOutbox.objects.get(sale_id=sale_id)
+        self.assertEqual(entry.status, PaymentOutbox.STATUS_SENT)
+        self.assertEqual(entry.sale.status, 'completed')
+        self.assertEqual(len(FakePaystackHandler.requests_seen), 1)
+
+    def test_retry_waits_while_the_customer_is_paying(self):
+        FakePaystackHandler.verify_status = 'ongoing'
+        sale_id = self.lose_worker()
+
+        entry = PaymentOutbox.objects.get(sale_id=sale_id)
+        self.assertEqual((entry.status, entry.sale.status), (PaymentOutbox.STATUS_PENDING, 'pending'))
+        self.assertEqual(len(FakePaystackHandler.requests_seen), 1)
@@ -5,8 +5,9 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.views.decorators.csrf import csrf_exempt
 from django.http import HttpResponse
-from .paystack import PaystackClient
+from .paystack import PaystackClient, sale_id_from_reference
 from sales.models import Sale
+from sales.reservations import mark_sale_paid, mark_sale_failed
 import json
 import logging
 from django.utils import timezone
@@ -40,19 +41,17 @@ def paystack_callback(request):
 
     # Update sale status
     try:
-        sale = Sale.objects.get(id=reference)
+        sale = Sale.objects.get(id=sale_id_from_reference(reference))
 
         if transaction_data['status'] == 'success':
-            sale.status = 'completed'
-            sale.paystack_response = transaction_data
-            sale.save()
+            # Completes the sale and converts its stock reservation
+            mark_sale_paid(sale.id, transaction_data)
 
             # Redirect to frontend with success and sale ID
             return redirect(f'{frontend_url}/payment-success?payment=success&saleId={sale.id}')
         else:
-            sale.status = 'failed'
-            sale.paystack_response = transaction_data
-            sale.save()
+            # Releases the reserved stock; a sale already paid is left alone
+            mark_sale_failed(sale.id, transaction_data)
 
             # Redirect to frontend with failure
             return redirect(f'{frontend_url}/payment-success?payment=failed&saleId={sale.id}')
@@ -92,10 +91,7 @@ def paystack_webhook(request):
 
             if reference:
                 try:
-                    sale = Sale.objects.get(id=reference)
-                    sale.status = 'completed'
-                    sale.paystack_response = data
-                    sale.save()
+                    mark_sale_paid(sale_id_from_reference(reference), data)
 
                     logger.info(f"Payment completed for sale {reference}")
                 except Sale.DoesNotExist:
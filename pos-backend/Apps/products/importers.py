@@ -1,12 +1,53 @@
 # apps/products/importers.py
 import csv
+import io
+import os
 import pandas as pd
-from decimal import Decimal
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
 from django.db import transaction
-from .models import Product, Supplier, SupplierInfo
+from django.utils import timezone
+from django.db.models import Case, F, IntegerField, Value, When
+from openpyxl import load_workbook
+from .models import ImportJob, Product, Supplier, SupplierInfo
+from .sharding import return_to_shards
+from reports.cache import invalidate_reports
 from shops.models import Shop
 
 
+def _integers(values):
+    """Whole numbers as a nullable Int64 column, NA where a value is not one"""
+    numbers = pd.to_numeric(values, errors='coerce')
+    whole = numbers.abs().lt(2 ** 63) & numbers.eq(numbers.round())
+    return numbers.where(whole).astype('Int64')
+
+
+def _decimals(values, field):
+    """Decimals that fit the model ``field``, None where a value does not"""
+    limit = Decimal(10) ** (field.max_digits - field.decimal_places)
+
+    def parse(value):
+        try:
+            number = Decimal(str(value).strip())
+        except InvalidOperation:
+            return None
+        if not number.is_finite() or abs(number) >= limit:
+            return None
+        return number
+
+    return values.map(parse)
+
+
+def _text(df, field):
+    if field not in df:
+        return pd.Series('', index=df.index)
+    return df[field].fillna('').astype(str).str.strip()
+
+
+class ImportInterrupted(Exception):
+    """A chunk failed part way through the file, rather than the file being unreadable"""
+
+
 class ProductImporter:
     """Handle batch product import from CSV/Excel"""
     
@@ -15,125 +56,341 @@ class ProductImporter:
         'description', 'reorder_level', 'current_stock',
         'supplier_id', 'supplier_sku', 'cost_price'
     ]
+    # Rows written per transaction
+    CHUNK_SIZE = 1000
     
-    def __init__(self, file_path, user):
+    def __init__(self, file_path, user, start_row=0, on_chunk=None, dry_run=False):
+        # A path, or an open binary file such as an uploaded file
         self.file_path = file_path
+        self.name = str(getattr(file_path, 'name', file_path))
         self.user = user
+        # Data rows already imported by an earlier run, skipped on resume
+        self.start_row = start_row
+        # Called as on_chunk(importer, rows_done) inside each chunk's transaction
+        self.on_chunk = on_chunk
+        # Validate and count only; (shop_id, sku) of the products the file
+        # would create, so later rows repeating one count as updates
+        self.dry_run = dry_run
+        self._planned = set()
         self.errors = []
         self.success_count = 0
         self.update_count = 0
         self.skip_count = 0
+        self._row_errors = []
     
     def import_from_csv(self):
-        """Import products from CSV file"""
+        """Import products from CSV file, reading CHUNK_SIZE rows at a time"""
         try:
-            df = pd.read_csv(self.file_path)
-            return self._process_dataframe(df)
+            columns = pd.read_csv(self._rewind(), nrows=0).columns
+            chunks = pd.read_csv(self._rewind(), chunksize=self.CHUNK_SIZE)
+            return self._process_chunks(columns, chunks)
+        except ImportInterrupted:
+            raise
         except Exception as e:
             self.errors.append(f"Failed to read CSV: {str(e)}")
             return False
     
     def import_from_excel(self):
-        """Import products from Excel file"""
+        """Import products from Excel file, iterating rows of a read-only workbook"""
+        if self.name.lower().endswith('.xls'):
+            # Legacy workbooks need xlrd and hold at most 65536 rows
+            try:
+                df = pd.read_excel(self._rewind())
+                return self._process_dataframe(df)
+            except ImportInterrupted:
+                raise
+            except Exception as e:
+                self.errors.append(f"Failed to read Excel: {str(e)}")
+                return False
+        
+        try:
+            workbook = load_workbook(self._rewind(), read_only=True, data_only=True)
+        except Exception as e:
+            self.errors.append(f"Failed to read Excel: {str(e)}")
+            return False
         try:
-            df = pd.read_excel(self.file_path)
-            return self._process_dataframe(df)
+            sheet_rows = workbook.active.iter_rows(values_only=True)
+            header = next(sheet_rows, ())
+            columns = ['' if value is None else str(value).strip() for value in header]
+            return self._process_chunks(columns, self._excel_chunks(sheet_rows, columns))
+        except ImportInterrupted:
+            raise
         except Exception as e:
             self.errors.append(f"Failed to read Excel: {str(e)}")
             return False
+        finally:
+            workbook.close()
+    
+    def _rewind(self):
+        """The source to read, an uploaded file being rewound first"""
+        if hasattr(self.file_path, 'seek'):
+            self.file_path.seek(0)
+        return self.file_path
+    
+    def estimate_rows(self):
+        """Rough number of data rows, for progress; None if unknown"""
+        name = self.name.lower()
+        source = self._rewind()
+        if name.endswith('.csv'):
+            handle = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else source
+            lines, last = 0, b'\n'
+            try:
+                for block in iter(lambda: handle.read(1 << 20), b''):
+                    lines += block.count(b'\n')
+                    last = block[-1:]
+            finally:
+                if handle is not source:
+                    handle.close()
+            # A last line without a newline is still a row
+            return max(lines - (last == b'\n'), 0)
+        if name.endswith('.xlsx'):
+            workbook = load_workbook(source, read_only=True)
+            try:
+                max_row = workbook.active.max_row
+            finally:
+                workbook.close()
+            return max(max_row - 1, 0) if max_row else None
+        return None
+    
+    def _excel_chunks(self, sheet_rows, columns):
+        """DataFrames of up to CHUNK_SIZE sheet rows, indexed so row numbers match the sheet"""
+        values, index = [], []
+        for row_number, row in enumerate(sheet_rows, start=2):
+            if row_number - 2 < self.start_row or all(value is None for value in row):
+                continue
+            row = tuple(row[:len(columns)])
+            values.append(row + (None,) * (len(columns) - len(row)))
+            index.append(row_number - 2)
+            if len(values) == self.CHUNK_SIZE:
+                yield pd.DataFrame(values, columns=columns, index=index)
+                values, index = [], []
+        if values:
+            yield pd.DataFrame(values, columns=columns, index=index)
     
     def _process_dataframe(self, df):
         """Process pandas dataframe"""
+        return self._process_chunks(df.columns, [df])
+    
+    def _process_chunks(self, columns, chunks):
+        """Validate and write each dataframe of ``chunks`` before reading the next.
+
+        Rows are checked column by column, shops, suppliers and existing
+        products are looked up with ``IN`` queries, and products are
+        written with bulk upserts, CHUNK_SIZE rows per transaction, so
+        memory depends on the chunk size rather than the file. Errors
+        still name their row, in row order.
+        """
         
         # Validate columns
-        missing_fields = set(self.REQUIRED_FIELDS) - set(df.columns)
+        missing_fields = set(self.REQUIRED_FIELDS) - set(columns)
         if missing_fields:
             self.errors.append(
                 f"Missing required columns: {', '.join(missing_fields)}"
             )
             return False
         
-        # Process each row
-        for index, row in df.iterrows():
+        for df in chunks:
+            df = df[df.index >= self.start_row]
+            if df.empty:
+                continue
             try:
-                self._process_row(row, index + 2)  # +2 for header and 0-index
+                with transaction.atomic():
+                    self._process_frame(df)
+                    if self.on_chunk:
+                        self.on_chunk(self, int(df.index[-1]) + 1)
             except Exception as e:
-                self.errors.append(f"Row {index + 2}: {str(e)}")
-                self.skip_count += 1
-        
+                # Rolled back along with its checkpoint: the chunk is redone on resume
+                raise ImportInterrupted(f"Import stopped at row {int(df.index[0]) + 2}: {e}") from e
         return True
     
-    @transaction.atomic
-    def _process_row(self, row, row_number):
-        """Process a single row"""
+    def _process_frame(self, df):
+        rows = self._validate(df)
+        for start in range(0, len(rows), self.CHUNK_SIZE):
+            chunk = rows.iloc[start:start + self.CHUNK_SIZE]
+            try:
+                with transaction.atomic():
+                    created, updated, notes = self._write_chunk(chunk)
+            except Exception as e:
+                for row_number in chunk['row_number']:
+                    self._row_error(row_number, str(e))
+                self.skip_count += len(chunk)
+                continue
+            self.success_count += created
+            self.update_count += updated
+            self._row_errors += notes
+        
+        # Rows are reported in file order, as a row-by-row import would
+        self._row_errors.sort(key=lambda error: error[0])
+        self.errors += [message for _, message in self._row_errors]
+        self._row_errors = []
+    
+    def _row_error(self, row_number, message):
+        self._row_errors.append((row_number, f"Row {row_number}: {message}"))
+    
+    def _validate(self, df):
+        """Parse every column at once and drop the rows that cannot be imported.
+
+        Each rejected row gets one error, the first check it fails, and
+        counts as skipped.
+        """
+        raw = df.astype(str)
+        rows = pd.DataFrame({'row_number': df.index + 2}, index=df.index)  # +2 for header and 0-index
+        errors = pd.Series(None, index=df.index, dtype=object)
         
-        # Validate required fields
+        def fail(mask, message):
+            mask = mask & errors.isna()
+            errors[mask] = message[mask] if isinstance(message, pd.Series) else message
+        
+        # Required fields
         for field in self.REQUIRED_FIELDS:
-            if pd.isna(row[field]) or str(row[field]).strip() == '':
-                raise ValueError(f"Missing required field: {field}")
+            fail(df[field].isna() | (raw[field].str.strip() == ''), f"Missing required field: {field}")
         
-        # Get or validate shop
-        try:
-            shop = Shop.objects.get(id=int(row['shop_id']))
-        except Shop.DoesNotExist:
-            raise ValueError(f"Shop not found: {row['shop_id']}")
-        
-        # Check user permission
-        if self.user.role != 'admin' and shop not in self.user.assigned_shops.all():
-            raise ValueError(f"No permission to import to shop: {shop.name}")
-        
-        # Prepare product data
-        product_data = {
-            'sku': str(row['sku']).strip(),
-            'name': str(row['name']).strip(),
-            'description': str(row.get('description', '')).strip(),
-            'unit_price': Decimal(str(row['unit_price'])),
-            'reorder_level': int(row.get('reorder_level', 10)),
-            'shop': shop,
-            'created_by': self.user
+        # Shops, and the user's access to them
+        rows['shop_id'] = _integers(df['shop_id'])
+        fail(rows['shop_id'].isna(), 'Invalid shop_id: ' + raw['shop_id'])
+        shops = Shop.objects.in_bulk(rows['shop_id'].dropna().unique().tolist())
+        fail(~rows['shop_id'].isin(list(shops)), 'Shop not found: ' + raw['shop_id'])
+        if self.user.role != 'admin':
+            allowed = list(self.user.assigned_shops.values_list('id', flat=True))
+            names = rows['shop_id'].map({shop.id: shop.name for shop in shops.values()}).fillna('')
+            fail(~rows['shop_id'].isin(allowed), 'No permission to import to shop: ' + names)
+        
+        # Product fields
+        for field in ('sku', 'name', 'description'):
+            rows[field] = _text(df, field)
+            max_length = Product._meta.get_field(field).max_length
+            if max_length:
+                fail(rows[field].str.len() > max_length,
+                     f"{field} is longer than {max_length} characters")
+        rows['unit_price'] = _decimals(df['unit_price'], Product._meta.get_field('unit_price'))
+        fail(rows['unit_price'].isna(), 'Invalid unit_price: ' + raw['unit_price'])
+        if 'reorder_level' in df:
+            rows['reorder_level'] = _integers(df['reorder_level'])
+            fail(rows['reorder_level'].isna(), 'Invalid reorder_level: ' + raw['reorder_level'])
+        else:
+            rows['reorder_level'] = 10
+        
+        # Stock to set on new products or add to existing ones
+        rows['stock'] = pd.Series(pd.NA, index=df.index, dtype='Int64')
+        if 'current_stock' in df:
+            rows['stock'] = _integers(df['current_stock'])
+            fail(df['current_stock'].notna() & rows['stock'].isna(),
+                 'Invalid current_stock: ' + raw['current_stock'])
+        
+        # Supplier links; an unknown supplier is reported but the product is still imported
+        rows['supplier_id'] = pd.Series(pd.NA, index=df.index, dtype='Int64')
+        rows['supplier_raw'] = raw['supplier_id'] if 'supplier_id' in df else ''
+        if 'supplier_id' in df:
+            rows['supplier_id'] = _integers(df['supplier_id'])
+            fail(df['supplier_id'].notna() & rows['supplier_id'].isna(),
+                 'Invalid supplier_id: ' + raw['supplier_id'])
+        suppliers = Supplier.objects.in_bulk(rows['supplier_id'].dropna().unique().tolist())
+        rows['supplier_found'] = rows['supplier_id'].isin(list(suppliers))
+        rows['supplier_sku'] = _text(df, 'supplier_sku')
+        max_length = SupplierInfo._meta.get_field('supplier_sku').max_length
+        fail(rows['supplier_found'] & (rows['supplier_sku'].str.len() > max_length),
+             f"supplier_sku is longer than {max_length} characters")
+        rows['cost_price'] = rows['unit_price']
+        if 'cost_price' in df:
+            cost = _decimals(df['cost_price'], SupplierInfo._meta.get_field('cost_price'))
+            given = df['cost_price'].notna()
+            fail(rows['supplier_found'] & given & cost.isna(), 'Invalid cost_price: ' + raw['cost_price'])
+            rows['cost_price'] = cost.where(given, rows['unit_price'])
+        
+        failed = errors.notna()
+        for row_number, message in zip(rows['row_number'][failed], errors[failed]):
+            self._row_error(row_number, message)
+        self.skip_count += int(failed.sum())
+        return rows[~failed]
+    
+    def _write_chunk(self, chunk):
+        """Upsert the chunk's products and supplier links.
+
+        Rows repeating a (sku, shop) update the product the earlier row
+        created or updated, and add their stock to it. Returns
+        ``(created, updated, notes)``; a dry run returns them without
+        writing.
+        """
+        keys = {(int(shop_id), sku) for shop_id, sku in zip(chunk['shop_id'], chunk['sku'])}
+        # (shop_id, sku) -> stock_shards of the products already there
+        existing = {
+            (shop_id, sku): stock_shards
+            for shop_id, sku, stock_shards in Product.objects.filter(
+                shop_id__in={shop_id for shop_id, _ in keys}, sku__in={sku for _, sku in keys}
+            ).values_list('shop_id', 'sku', 'stock_shards')
+            if (shop_id, sku) in keys
         }
+        if self.dry_run:
+            existing.update((key, None) for key in keys & self._planned if key not in existing)
         
-        # Create or update product
-        product, created = Product.objects.update_or_create(
-            sku=product_data['sku'],
-            shop=shop,
-            defaults=product_data
+        products, stock, links, notes = {}, defaultdict(int), {}, []
+        created = updated = 0
+        for row in chunk.itertuples(index=False):
+            key = (int(row.shop_id), row.sku)
+            if key in existing or key in products:
+                updated += 1
+            else:
+                created += 1
+            product = products.setdefault(key, Product(sku=row.sku, shop_id=key[0]))
+            product.name = row.name
+            product.description = row.description
+            product.unit_price = row.unit_price
+            product.reorder_level = int(row.reorder_level)
+            product.created_by = self.user
+            if not pd.isna(row.stock):
+                stock[key] += int(row.stock)
+            
+            if not pd.isna(row.supplier_id):
+                if row.supplier_found:
+                    # The last row naming a (supplier, product) pair wins
+                    links[int(row.supplier_id), key] = (row.supplier_sku, row.cost_price)
+                else:
+                    notes.append(
+                        (row.row_number, f"Row {row.row_number}: Supplier not found: {row.supplier_raw}")
+                    )
+        
+        if self.dry_run:
+            self._planned.update(key for key in products if key not in existing)
+            return created, updated, notes
+        
+        # New products start with their stock; the upsert leaves the
+        # stock of existing ones alone
+        for key, product in products.items():
+            product.current_stock = 0 if key in existing else stock.pop(key, 0)
+        Product.objects.bulk_create(
+            products.values(), update_conflicts=True, unique_fields=['sku', 'shop'],
+            update_fields=['name', 'description', 'unit_price', 'reorder_level', 'created_by', 'updated_at']
         )
         
-        # Update stock if provided
-        if 'current_stock' in row and not pd.isna(row['current_stock']):
-            stock = int(row['current_stock'])
-            if created:
-                product.current_stock = stock
-            else:
-                # Add to existing stock
-                product.current_stock += stock
-            product.save()
+        # Existing stock moves by a delta in SQL, so sales made while the
+        # file is importing are not overwritten; sharded products keep
+        # theirs in the shards
+        regular = {products[key].id: qty for key, qty in stock.items() if qty and not existing[key]}
+        sharded = {products[key].id: qty for key, qty in stock.items() if qty and existing[key]}
+        if regular:
+            amount = Case(
+                *[When(id=product_id, then=Value(qty)) for product_id, qty in regular.items()],
+                output_field=IntegerField(),
+            )
+            Product.objects.filter(id__in=list(regular)).update(current_stock=F('current_stock') + amount)
+        if sharded:
+            return_to_shards(sharded)
         
-        # Handle supplier info
-        if 'supplier_id' in row and not pd.isna(row['supplier_id']):
-            try:
-                supplier = Supplier.objects.get(id=int(row['supplier_id']))
-                
-                supplier_data = {
-                    'supplier_sku': str(row.get('supplier_sku', '')).strip(),
-                    'cost_price': Decimal(str(row.get('cost_price', row['unit_price'])))
-                }
-                
-                SupplierInfo.objects.update_or_create(
-                    supplier=supplier,
-                    product=product,
-                    defaults=supplier_data
-                )
-            except Supplier.DoesNotExist:
-                self.errors.append(
-                    f"Row {row_number}: Supplier not found: {row['supplier_id']}"
+        SupplierInfo.objects.bulk_create(
+            [
+                SupplierInfo(
+                    supplier_id=supplier_id, product=products[key],
+                    supplier_sku=supplier_sku, cost_price=cost_price
                 )
+                for (supplier_id, key), (supplier_sku, cost_price) in links.items()
+            ],
+            update_conflicts=True, unique_fields=['supplier', 'product'],
+            update_fields=['supplier_sku', 'cost_price']
+        )
         
-        if created:
-            self.success_count += 1
-        else:
-            self.update_count += 1
+        # Bulk writes send no post_save signals
+        invalidate_reports({shop_id for shop_id, _ in keys})
+        return created, updated, notes
     
     def get_summary(self):
         """Get import summary"""
@@ -146,40 +403,103 @@ class ProductImporter:
         }
 
 
+def run_import_job(job):
+    """Import a job's upload, continuing from its checkpoint.
+
+    Counters and errors are restored from the job, so the summary of a
+    resumed job is the same as an uninterrupted run's. The upload is
+    deleted once the job finishes.
+    """
+    storage = ImportJob.storage()
+    with storage.open(job.upload, 'rb') as upload:
+        importer = ProductImporter(upload, job.created_by, start_row=job.rows_processed)
+        importer.success_count = job.success_count
+        importer.update_count = job.update_count
+        importer.skip_count = job.skip_count
+        importer.errors = list(job.errors)
+        
+        def checkpoint(importer, rows_done):
+            ImportJob.objects.filter(id=job.id).update(
+                rows_processed=rows_done,
+                success_count=importer.success_count,
+                update_count=importer.update_count,
+                skip_count=importer.skip_count,
+                errors=importer.errors,
+                updated_at=timezone.now()
+            )
+        importer.on_chunk = checkpoint
+        importer.name = job.file_name
+        
+        if job.total_rows is None:
+            job.total_rows = importer.estimate_rows()
+            job.save(update_fields=['total_rows', 'updated_at'])
+        if job.file_name.lower().endswith('.csv'):
+            success = importer.import_from_csv()
+        else:
+            success = importer.import_from_excel()
+    
+    job.refresh_from_db()
+    if not success:
+        # Unreadable file or missing columns: nothing more will change
+        job.errors = importer.errors
+    job.status = ImportJob.STATUS_COMPLETED if success else ImportJob.STATUS_FAILED
+    job.finished_at = timezone.now()
+    job.save()
+    storage.delete(job.upload)
+    return job
+
+
 class ProductExporter:
     """Handle batch product export to CSV/Excel"""
     
+    # Products read per database round trip, and CSV rows per streamed piece
+    CHUNK_SIZE = 2000
+    CSV_FIELDS = [
+        'id', 'sku', 'name', 'description', 'unit_price',
+        'current_stock', 'reorder_level', 'shop_id', 'shop_name',
+        'is_active', 'created_at'
+    ]
+    
     def __init__(self, queryset):
         self.queryset = queryset
     
+    def csv_rows(self):
+        """CSV rows of the queryset, read as tuples CHUNK_SIZE at a time"""
+        products = self.queryset.prefetch_related(None).values_list(
+            'id', 'sku', 'name', 'description', 'unit_price',
+            'current_stock', 'reorder_level', 'shop_id', 'shop__name',
+            'is_active', 'created_at'
+        ).iterator(chunk_size=self.CHUNK_SIZE)
+        for row in products:
+            row = list(row)
+            row[4] = float(row[4])
+            row[10] = row[10].isoformat()
+            yield row
+    
+    def stream_csv(self):
+        """Yield the CSV in pieces of CHUNK_SIZE rows, the header first"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.CSV_FIELDS)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        
+        for count, row in enumerate(self.csv_rows(), start=1):
+            writer.writerow(row)
+            if count % self.CHUNK_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    
     def export_to_csv(self, file_path):
         """Export products to CSV"""
-        import csv
-        
         with open(file_path, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = [
-                'id', 'sku', 'name', 'description', 'unit_price',
-                'current_stock', 'reorder_level', 'shop_id', 'shop_name',
-                'is_active', 'created_at'
-            ]
-            
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            for product in self.queryset:
-                writer.writerow({
-                    'id': product.id,
-                    'sku': product.sku,
-                    'name': product.name,
-                    'description': product.description,
-                    'unit_price': float(product.unit_price),
-                    'current_stock': product.current_stock,
-                    'reorder_level': product.reorder_level,
-                    'shop_id': product.shop.id,
-                    'shop_name': product.shop.name,
-                    'is_active': product.is_active,
-                    'created_at': product.created_at.isoformat()
-                })
+            writer = csv.writer(csvfile)
+            writer.writerow(self.CSV_FIELDS)
+            writer.writerows(self.csv_rows())
     
     def export_to_excel(self, file_path):
         """Export products to Excel"""
@@ -0,0 +1,80 @@
+# apps/products/management/commands/benchmark_hot_sku.py
+from decimal import Decimal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+
+from products.models import Product
+from products.sharding import enable_sharding
+from sales.checkout import CheckoutEngine
+from sales.models import Sale
+from shops.models import Shop
+
+
+class Command(BaseCommand):
+    help = "Measure checkout throughput on one hot product with 1 vs N stock shards"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, nargs='+', default=[1, 8],
+                            help='Shard counts to compare; 1 is the plain product row')
+        parser.add_argument('--tills', type=int, default=16, help='Concurrent checkouts')
+        parser.add_argument('--sales', type=int, default=100, help='Sales per till')
+
+    def handle(self, *args, **options):
+        tills, sales = options['tills'], options['sales']
+        if connection.vendor == 'sqlite':
+            self.stderr.write(self.style.WARNING(
+                "SQLite serializes all writers; run against Postgres for meaningful numbers"
+            ))
+
+        shop = Shop.objects.create(name='Checkout benchmark', address='-', phone='-')
+        try:
+            for shards in options['shards']:
+                product = Product.objects.create(
+                    sku=f'HOT-{shards}', name='Hot product', unit_price=Decimal('1.00'),
+                    current_stock=tills * sales, shop=shop
+                )
+                if shards > 1:
+                    enable_sharding(product, shards)
+
+                elapsed, failures = self.run_tills(shop, product, tills, sales)
+                completed = tills * sales - len(failures)
+                self.stdout.write(
+                    f"{shards:>3} shard(s): {completed} sales in {elapsed:.2f}s "
+                    f"= {completed / elapsed:.0f} sales/s ({len(failures)} failed)"
+                )
+        finally:
+            Sale.objects.filter(shop=shop).delete()
+            shop.delete()
+
+    def run_tills(self, shop, product, tills, sales):
+        """Run ``tills`` threads each checking out ``sales`` one-item baskets"""
+        basket = [{'product_id': product.id, 'quantity': 1, 'unit_price': '1.00'}]
+        barrier = threading.Barrier(tills + 1)
+        failures = []
+
+        def till():
+            try:
+                barrier.wait()
+                for _ in range(sales):
+                    try:
+                        with transaction.atomic():
+                            engine = CheckoutEngine(shop, None)
+                            engine.checkout(
+                                engine.prepare(basket), payment_method='cash', status='completed'
+                            )
+                    except Exception as e:
+                        failures.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=till) for _ in range(tills)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start, failures
@@ -0,0 +1,96 @@
+# apps/products/management/commands/benchmark_import.py
+import csv
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from openpyxl import Workbook
+
+from products.importers import ProductImporter
+from shops.models import Shop
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+class Command(BaseCommand):
+    help = ("Import generated product catalogs and record peak RSS. Run sizes in "
+            "increasing order: a flat peak means memory does not grow with the file. "
+            "Everything is rolled back afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000],
+                            help='Catalog sizes to import, smallest first')
+        parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv')
+        parser.add_argument('--chunk', type=int, default=ProductImporter.CHUNK_SIZE,
+                            help='Rows per chunk')
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(role='admin').first()
+        if user is None:
+            self.stderr.write(self.style.ERROR("Needs an admin user to import as"))
+            return
+        if settings.DEBUG:
+            self.stderr.write(self.style.WARNING(
+                "DEBUG keeps the last 9000 queries in memory; set DEBUG=False for a meaningful peak"
+            ))
+        ProductImporter.CHUNK_SIZE = options['chunk']
+
+        self.stdout.write(f"Baseline peak RSS: {peak_rss_mb():.0f} MB")
+        for rows in options['rows']:
+            fd, path = tempfile.mkstemp(suffix=f".{options['format']}")
+            os.close(fd)
+            try:
+                with transaction.atomic():
+                    shop = Shop.objects.create(name='Import benchmark', address='-', phone='-')
+                    self.write_catalog(path, options['format'], rows, shop.id)
+                    size = os.path.getsize(path) / (1024 * 1024)
+
+                    importer = ProductImporter(path, user)
+                    start = time.perf_counter()
+                    if options['format'] == 'csv':
+                        importer.import_from_csv()
+                    else:
+                        importer.import_from_excel()
+                    elapsed = time.perf_counter() - start
+                    transaction.set_rollback(True)
+            finally:
+                os.unlink(path)
+
+            summary = importer.get_summary()
+            self.stdout.write(
+                f"{rows} rows ({size:.0f} MB {options['format']}): {elapsed:.1f}s "
+                f"= {rows / elapsed:.0f} rows/s, {summary['success_count']} created, "
+                f"{summary['skip_count']} skipped, peak RSS {peak_rss_mb():.0f} MB"
+            )
+
+    def write_catalog(self, path, file_format, rows, shop_id):
+        """Write ``rows`` products a line at a time, so generating costs no memory"""
+        header = ['sku', 'name', 'description', 'unit_price', 'shop_id', 'reorder_level', 'current_stock']
+        lines = (
+            [f'BENCH-{i}', f'Product {i}', 'Generated by benchmark_import',
+             f'{i % 500 + 1}.99', shop_id, 10, i % 50]
+            for i in range(rows)
+        )
+        if file_format == 'csv':
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(lines)
+        else:
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet()
+            sheet.append(header)
+            for line in lines:
+                sheet.append(line)
+            workbook.save(path)
@@ -0,0 +1,32 @@
+# apps/products/management/commands/shard_stock.py
+from django.core.management.base import BaseCommand, CommandError
+
+from products.models import Product
+from products.sharding import enable_sharding, disable_sharding
+
+
+class Command(BaseCommand):
+    help = "Split a hot product's stock across N counter rows (0 turns sharding off)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_id', type=int)
+        parser.add_argument('--shards', type=int, default=8)
+
+    def handle(self, *args, **options):
+        try:
+            product = Product.objects.get(id=options['product_id'])
+        except Product.DoesNotExist:
+            raise CommandError(f"Product {options['product_id']} does not exist")
+
+        try:
+            if options['shards']:
+                product = enable_sharding(product, options['shards'])
+            else:
+                product = disable_sharding(product)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{product.name}: {product.stock_shards or 'no'} shards, "
+            f"{product.total_stock} in stock"
+        ))
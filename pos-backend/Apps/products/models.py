@@ -1,6 +1,7 @@
 # apps/products/models.py
 from django.db import models
 from django.conf import settings
+from django.core.files.storage import storages
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
@@ -23,6 +24,11 @@ class Product(models.Model):
         validators=[MinValueValidator(Decimal('0.01'))]
     )
     current_stock = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    # Units held by pending card/mobile-money sales (sum of active reservations)
+    reserved_stock = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    # Hot products split their stock across this many StockShard rows (0 = off).
+    # current_stock is then a snapshot refreshed by refresh_sharded_stock.
+    stock_shards = models.PositiveSmallIntegerField(default=0)
     reorder_level = models.IntegerField(default=10, validators=[MinValueValidator(0)])
     shop = models.ForeignKey(
         'shops.Shop',
@@ -55,9 +61,52 @@ class Product(models.Model):
     def __str__(self):
         return f"{self.name} ({self.sku}) - {self.shop.name}"
     
+    @property
+    def is_sharded(self):
+        return self.stock_shards > 0
+    
+    @property
+    def total_stock(self):
+        """Stock on hand, summing the shards of a sharded product"""
+        if not self.is_sharded:
+            return self.current_stock
+        # Uses prefetch_related('shards') when the caller loaded them
+        return sum(shard.stock for shard in self.shards.all())
+    
     @property
     def is_low_stock(self):
-        return self.current_stock <= self.reorder_level
+        return self.total_stock <= self.reorder_level
+    
+    @property
+    def available_stock(self):
+        """Stock that can still be sold: on hand minus pending reservations"""
+        if self.is_sharded:
+            # Pending sales take their units out of the shards directly
+            return self.total_stock
+        return self.current_stock - self.reserved_stock
+
+
+class StockShard(models.Model):
+    """One slice of a hot product's stock.
+
+    Tills decrement whichever shard has capacity, so concurrent sales of
+    the same product lock different rows instead of queueing on one.
+    """
+    
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='shards'
+    )
+    index = models.PositiveSmallIntegerField()
+    stock = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    
+    class Meta:
+        ordering = ['product', 'index']
+        unique_together = [['product', 'index']]
+    
+    def __str__(self):
+        return f"{self.product_id}#{self.index}: {self.stock}"
 
 
 class SupplierInfo(models.Model):
@@ -117,3 +166,67 @@ class InventoryMovement(models.Model):
     def __str__(self):
         return f"{self.product.name}: {self.quantity} ({self.movement_type})"
 
+
+
+class ImportJob(models.Model):
+    """A product catalog upload imported by a Celery worker.
+
+    The upload is kept in PRODUCT_IMPORT_STORAGE until the job finishes.
+    ``rows_processed`` is the checkpoint: it is saved with the counters in
+    the transaction that writes each chunk, so a job whose worker died
+    resumes after the last committed chunk.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    )
+    
+    file_name = models.CharField(max_length=255)  # As uploaded; picks CSV or Excel
+    upload = models.CharField(max_length=255, blank=True)  # Name in the import storage
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    total_rows = models.PositiveIntegerField(null=True, blank=True)  # Estimate, for progress
+    rows_processed = models.PositiveIntegerField(default=0)
+    success_count = models.PositiveIntegerField(default=0)
+    update_count = models.PositiveIntegerField(default=0)
+    skip_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='product_imports'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"ImportJob({self.file_name}, {self.status})"
+    
+    @staticmethod
+    def storage():
+        return storages.create_storage(settings.PRODUCT_IMPORT_STORAGE)
+    
+    def get_summary(self):
+        """Counters so far, in the shape of ProductImporter.get_summary()"""
+        return {
+            'success_count': self.success_count,
+            'update_count': self.update_count,
+            'skip_count': self.skip_count,
+            'errors': self.errors,
+            'total_processed': self.success_count + self.update_count + self.skip_count
+        }
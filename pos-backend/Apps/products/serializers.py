@@ -1,6 +1,6 @@
 # apps/products/serializers.py
 from rest_framework import serializers
-from .models import Product, Supplier, SupplierInfo, InventoryMovement
+from .models import Product, Supplier, SupplierInfo, InventoryMovement, ImportJob
 from decimal import Decimal
 
 
@@ -34,16 +34,19 @@ class ProductSerializer(serializers.ModelSerializer):
     )
     is_low_stock = serializers.BooleanField(read_only=True)
     shop_name = serializers.CharField(source='shop.name', read_only=True)
+    # Summed from the shards for hot products
+    current_stock = serializers.IntegerField(source='total_stock', read_only=True)
+    available_stock = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Product
         fields = [
             'id', 'sku', 'name', 'description', 'unit_price',
-            'current_stock', 'reorder_level', 'shop', 'shop_name',
+            'current_stock', 'reserved_stock', 'available_stock', 'stock_shards', 'reorder_level', 'shop', 'shop_name',
             'is_active', 'is_low_stock', 'supplier_info',
             'created_by', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'current_stock', 'created_by', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'current_stock', 'reserved_stock', 'stock_shards', 'created_by', 'created_at', 'updated_at']
     
     def validate(self, data):
         # Ensure user has access to the shop
@@ -90,3 +93,27 @@ class InventoryMovementSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_by', 'created_at']
 
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    """Progress of a background product import, polled by the client"""
+    progress = serializers.SerializerMethodField()
+    summary = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'file_name', 'status', 'total_rows', 'rows_processed', 'progress',
+            'summary', 'last_error', 'created_at', 'updated_at', 'finished_at'
+        ]
+        read_only_fields = fields
+    
+    def get_progress(self, obj):
+        """Percentage of rows done; total_rows is estimated from the file"""
+        if obj.status == ImportJob.STATUS_COMPLETED:
+            return 100
+        if not obj.total_rows:
+            return None
+        return min(99, int(obj.rows_processed * 100 / obj.total_rows))
+    
+    def get_summary(self, obj):
+        return obj.get_summary()
@@ -0,0 +1,127 @@
+# apps/products/sharding.py
+from django.db import transaction
+from django.db.models import F, Sum, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from rest_framework import serializers
+
+from reports.cache import invalidate_reports
+from .models import Product, StockShard
+
+
+def _check_no_pending_sales(product):
+    # Reserved units live in reserved_stock for regular products and in the
+    # shards for sharded ones, so switching modes mid-payment would lose them
+    if product.reservations.filter(status='active').exists():
+        raise ValueError(
+            f"{product.name} has pending card/mobile-money sales; try again once they settle"
+        )
+
+
+def enable_sharding(product, shards):
+    """Split a product's stock evenly across ``shards`` StockShard rows"""
+    if shards < 2:
+        raise ValueError("A sharded product needs at least two shards")
+
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product.pk)
+        _check_no_pending_sales(product)
+        total = product.total_stock
+
+        product.shards.all().delete()
+        base, extra = divmod(total, shards)
+        StockShard.objects.bulk_create([
+            StockShard(product=product, index=i, stock=base + (1 if i < extra else 0))
+            for i in range(shards)
+        ])
+
+        product.stock_shards = shards
+        product.current_stock = total
+        product.save(update_fields=['stock_shards', 'current_stock', 'updated_at'])
+    return product
+
+
+def disable_sharding(product):
+    """Fold a sharded product's stock back into ``current_stock``"""
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product.pk)
+        if not product.is_sharded:
+            return product
+        _check_no_pending_sales(product)
+
+        product.current_stock = product.total_stock
+        product.stock_shards = 0
+        product.shards.all().delete()
+        product.save(update_fields=['stock_shards', 'current_stock', 'updated_at'])
+    return product
+
+
+def take_from_shards(quantities, force=False):
+    """Decrement sharded stock, one product at a time in id order.
+
+    Each product first tries a single random shard with enough stock,
+    skipping shards other tills hold. Only when no shard can cover the
+    quantity alone are all of the product's shards locked and drained in
+    turn. ``force`` lets the stock go negative (payment already taken).
+    """
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        shard = (
+            StockShard.objects.select_for_update(skip_locked=True)
+            .filter(product_id=product_id, stock__gte=quantity)
+            .order_by('?').first()
+        )
+        if shard is not None:
+            StockShard.objects.filter(pk=shard.pk).update(stock=F('stock') - quantity)
+            continue
+
+        shards = list(
+            StockShard.objects.select_for_update()
+            .filter(product_id=product_id).order_by('index')
+        )
+        if not force and sum(s.stock for s in shards) < quantity:
+            raise serializers.ValidationError(
+                "Insufficient stock for one or more products in this sale"
+            )
+        remaining = quantity
+        for i, s in enumerate(shards):
+            take = remaining if i == len(shards) - 1 else min(max(s.stock, 0), remaining)
+            if take:
+                StockShard.objects.filter(pk=s.pk).update(stock=F('stock') - take)
+                remaining -= take
+            if not remaining:
+                break
+
+
+def return_to_shards(quantities):
+    """Add stock back to each product's emptiest shard"""
+    for product_id in sorted(quantities):
+        emptiest = StockShard.objects.filter(product_id=product_id).order_by('stock', 'index')
+        StockShard.objects.filter(
+            pk=Subquery(emptiest.values('pk')[:1])
+        ).update(stock=F('stock') + quantities[product_id])
+
+
+def refresh_sharded_stock():
+    """Write each sharded product's shard total into ``current_stock``.
+
+    Keeps SQL filters such as low-stock alerts and stock valuation
+    working off the column; the snapshot lags sales by one refresh.
+    Only snapshots that moved are written, and only their shops' cached
+    reports are dropped. Returns the number of products updated.
+    """
+    totals = (
+        StockShard.objects.filter(product=OuterRef('pk'))
+        .order_by().values('product').annotate(total=Sum('stock')).values('total')
+    )
+    changed = list(
+        Product.objects.filter(stock_shards__gt=0)
+        .annotate(total=Coalesce(Subquery(totals), 0))
+        .exclude(current_stock=F('total'))
+        .values_list('id', 'shop_id', 'total')
+    )
+    if not changed:
+        return 0
+    invalidate_reports({shop_id for _, shop_id, _ in changed})
+    return Product.objects.filter(id__in=[product_id for product_id, _, _ in changed]).update(
+        current_stock=Coalesce(Subquery(totals), 0)
+    )
@@ -0,0 +1,80 @@
+# apps/products/tasks.py
+from celery import shared_task
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from datetime import timedelta
+from .importers import run_import_job
+from .models import ImportJob
+from .sharding import refresh_sharded_stock
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def refresh_sharded_stock_totals():
+    """Sum the shards of every sharded product into its current_stock"""
+    updated = refresh_sharded_stock()
+    logger.info(f'Refreshed stock totals for {updated} sharded products')
+    return updated
+
+
+@shared_task
+def run_product_import(job_id):
+    """Import an uploaded catalog, or resume it from its last checkpoint.
+
+    The job is claimed with a conditional UPDATE so two workers never
+    import the same file. A failed run goes back to pending for the
+    dispatcher until PRODUCT_IMPORT_MAX_ATTEMPTS is reached.
+    """
+    claimed = ImportJob.objects.filter(
+        id=job_id,
+        status=ImportJob.STATUS_PENDING
+    ).update(
+        status=ImportJob.STATUS_PROCESSING,
+        attempts=F('attempts') + 1,
+        updated_at=timezone.now()
+    )
+    if not claimed:
+        return None
+    
+    job = ImportJob.objects.get(id=job_id)
+    try:
+        job = run_import_job(job)
+    except Exception as e:
+        logger.exception(f'Product import {job_id} failed at row {job.rows_processed}')
+        gave_up = job.attempts >= settings.PRODUCT_IMPORT_MAX_ATTEMPTS
+        ImportJob.objects.filter(id=job_id).update(
+            status=ImportJob.STATUS_FAILED if gave_up else ImportJob.STATUS_PENDING,
+            last_error=str(e),
+            finished_at=timezone.now() if gave_up else None,
+            updated_at=timezone.now()
+        )
+        return ImportJob.STATUS_FAILED if gave_up else ImportJob.STATUS_PENDING
+    
+    logger.info(f'Product import {job_id}: {job.status}, {job.get_summary()["total_processed"]} rows')
+    return job.status
+
+
+@shared_task
+def resume_product_imports(grace_seconds=30, stale_seconds=300, batch_size=20):
+    """Re-queue imports that were never picked up or whose worker died"""
+    now = timezone.now()
+    
+    # Jobs checkpoint after every chunk; a silent one lost its worker
+    ImportJob.objects.filter(
+        status=ImportJob.STATUS_PROCESSING,
+        updated_at__lt=now - timedelta(seconds=stale_seconds)
+    ).update(status=ImportJob.STATUS_PENDING, updated_at=now)
+    
+    job_ids = list(
+        ImportJob.objects.filter(
+            status=ImportJob.STATUS_PENDING,
+            updated_at__lt=now - timedelta(seconds=grace_seconds)
+        ).values_list('id', flat=True)[:batch_size]
+    )
+    for job_id in job_ids:
+        run_product_import.delay(job_id)
+    
+    return len(job_ids)
@@ -1,3 +1,349 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
+import csv
+import io
+import os
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import CaptureQueriesContext
+from openpyxl import Workbook
+from rest_framework.test import APIClient
+from rest_framework import serializers
+
+from sales.checkout import CheckoutEngine
+from sales.reservations import mark_sale_failed
+from shops.models import Shop
+from suppliers.models import Supplier
+from .importers import ProductExporter, ProductImporter
+from .models import ImportJob, Product, SupplierInfo
+from .sharding import enable_sharding, disable_sharding, refresh_sharded_stock
+from .tasks import resume_product_imports, run_product_import
+
+
+class ShardedStockTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='cashier', password='pass', email='c@example.com', role='admin'
+        )
+        self.shop = Shop.objects.create(name='Main', address='1 High St', phone='000')
+        self.product = enable_sharding(Product.objects.create(
+            sku='BREAD', name='Bread', unit_price=Decimal('2.00'),
+            current_stock=10, reorder_level=3, shop=self.shop
+        ), 4)
+
+    def checkout(self, quantity, payment_method='cash'):
+        with transaction.atomic():
+            engine = CheckoutEngine(self.shop, self.user)
+            basket = engine.prepare([
+                {'product_id': self.product.id, 'quantity': quantity, 'unit_price': '2.00'}
+            ])
+            return engine.checkout(
+                basket, payment_method=payment_method,
+                status='completed' if payment_method == 'cash' else 'pending'
+            )
+
+    def shard_stock(self):
+        return list(self.product.shards.values_list('stock', flat=True))
+
+    def test_enable_splits_stock_evenly(self):
+        self.assertEqual(self.shard_stock(), [3, 3, 2, 2])
+        self.assertEqual(self.product.total_stock, 10)
+
+    def test_checkout_takes_from_shards_lazily_summed(self):
+        self.checkout(2)
+        self.assertEqual(sum(self.shard_stock()), 8)
+
+        # The column is a snapshot until the refresh runs
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.current_stock, 10)
+        self.assertEqual(self.product.total_stock, 8)
+        refresh_sharded_stock()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.current_stock, 8)
+
+    def test_quantity_larger_than_any_shard_drains_several(self):
+        self.checkout(9)
+        self.assertEqual(sum(self.shard_stock()), 1)
+        self.assertTrue(all(stock >= 0 for stock in self.shard_stock()))
+        self.assertTrue(self.product.is_low_stock)
+
+        with self.assertRaises(serializers.ValidationError):
+            self.checkout(2)
+
+    def test_released_reservation_returns_to_shards(self):
+        sale = self.checkout(4, payment_method='card')
+        self.assertEqual(sum(self.shard_stock()), 6)
+
+        mark_sale_failed(sale.id)
+        self.assertEqual(sum(self.shard_stock()), 10)
+
+    def test_disable_folds_shards_back(self):
+        self.checkout(3)
+        product = disable_sharding(self.product)
+        self.assertEqual((product.stock_shards, product.current_stock), (0, 7))
+        self.assertFalse(product.shards.exists())
+
+
+class ProductImporterTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='manager', password='pass', email='m@example.com', role='manager'
+        )
+        self.shop = Shop.objects.create(name='Main', address='1 High St', phone='000')
+        self.other = Shop.objects.create(name='Other', address='2 High St', phone='000')
+        self.user.assigned_shops.add(self.shop)
+        self.supplier = Supplier.objects.create(name='Farm')
+        self.bread = enable_sharding(Product.objects.create(
+            sku='BREAD', name='Bread', unit_price=Decimal('2.00'), current_stock=8, shop=self.shop
+        ), 2)
+        self.milk = Product.objects.create(
+            sku='MILK', name='Milk', unit_price=Decimal('1.00'), current_stock=5, shop=self.shop
+        )
+
+    def run_import(self, lines):
+        header = 'sku,name,unit_price,shop_id,current_stock,supplier_id,cost_price\n'
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(header + '\n'.join(lines) + '\n')
+        self.addCleanup(os.unlink, f.name)
+        importer = ProductImporter(f.name, self.user)
+        self.assertTrue(importer.import_from_csv())
+        return importer.get_summary()
+
+    def test_rows_are_upserted_and_errors_keep_their_row(self):
+        s, o, sup = self.shop.id, self.other.id, self.supplier.id
+        summary = self.run_import([
+            f'TEA,Tea,1.50,{s},10,{sup},1.10',
+            f'TEA,Green tea,1.60,{s},3,,',       # same product again: update, stock added
+            f'MILK,Milk 1L,1.20,{s},4,999,',     # unknown supplier: reported, still imported
+            f'BREAD,Bread,2.50,{s},6,,',         # sharded: stock goes to the shards
+            f'JAM,,3.00,{s},1,,',
+            f'JAM,Jam,abc,{s},1,,',
+            f'JAM,Jam,3.00,{o},1,,',
+            f'JAM,Jam,3.00,{s},x,,',
+        ])
+
+        self.assertEqual(summary['success_count'], 1)
+        self.assertEqual(summary['update_count'], 3)
+        self.assertEqual(summary['skip_count'], 4)
+        self.assertEqual(summary['errors'], [
+            'Row 4: Supplier not found: 999.0',
+            'Row 6: Missing required field: name',
+            'Row 7: Invalid unit_price: abc',
+            'Row 8: No permission to import to shop: Other',
+            'Row 9: Invalid current_stock: x',
+        ])
+
+        tea = Product.objects.get(sku='TEA', shop=self.shop)
+        self.assertEqual((tea.name, tea.unit_price, tea.current_stock), ('Green tea', Decimal('1.60'), 13))
+        self.assertEqual(SupplierInfo.objects.get(product=tea).cost_price, Decimal('1.10'))
+        self.milk.refresh_from_db()
+        self.assertEqual((self.milk.name, self.milk.current_stock), ('Milk 1L', 9))
+        self.bread.refresh_from_db()
+        self.assertEqual((self.bread.unit_price, self.bread.current_stock), (Decimal('2.50'), 8))
+        self.assertEqual(self.bread.total_stock, 14)
+        self.assertFalse(Product.objects.filter(sku='JAM').exists())
+
+    def test_dry_run_reports_the_import_without_writing(self):
+        s, o, sup = self.shop.id, self.other.id, self.supplier.id
+        lines = [
+            'sku,name,unit_price,shop_id,current_stock,supplier_id,cost_price',
+            f'TEA,Tea,1.50,{s},10,{sup},1.10',
+            f'MILK,Milk 1L,1.20,{s},4,999,',
+            f'TEA,Green tea,1.60,{s},3,,',       # created by an earlier chunk: an update
+            f'JAM,Jam,abc,{s},1,,',
+            f'JAM,Jam,3.00,{o},1,,',
+        ]
+        client = APIClient()
+        client.force_authenticate(self.user)
+        upload = SimpleUploadedFile('catalog.csv', '\n'.join(lines).encode())
+        with mock.patch.object(ProductImporter, 'CHUNK_SIZE', 2), \
+                CaptureQueriesContext(connection) as captured:
+            response = client.post('/api/products/import_products/?dry_run=true', {'file': upload})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['dry_run'])
+        self.assertEqual(response.json()['summary'], {
+            'success_count': 1, 'update_count': 2, 'skip_count': 2, 'total_processed': 5,
+            'errors': [
+                'Row 3: Supplier not found: 999',
+                'Row 5: Invalid unit_price: abc',
+                'Row 6: No permission to import to shop: Other',
+            ]
+        })
+        writes = [q['sql'] for q in captured if q['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+        self.assertEqual(writes, [])
+        self.assertFalse(Product.objects.filter(sku='TEA').exists())
+        self.assertFalse(ImportJob.objects.exists())
+        self.milk.refresh_from_db()
+        self.assertEqual((self.milk.name, self.milk.current_stock), ('Milk', 5))
+
+    def test_queries_do_not_grow_with_rows(self):
+        def queries(rows, prefix):
+            with CaptureQueriesContext(connection) as captured:
+                self.run_import([
+                    f'{prefix}{i},Item {i},1.00,{self.shop.id},2,{self.supplier.id},0.50'
+                    for i in range(rows)
+                ])
+            return len(captured)
+
+        self.assertEqual(queries(5, 'A'), queries(50, 'B'))
+        # A second pass updates every product
+        self.assertEqual(queries(50, 'B'), queries(5, 'A'))
+        self.assertEqual(Product.objects.get(sku='B7').current_stock, 4)
+
+    def test_uploads_are_read_in_bounded_chunks(self):
+        frames = []
+        validate = ProductImporter._validate
+
+        def record(importer, df):
+            frames.append(len(df))
+            return validate(importer, df)
+
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(['sku', 'name', 'unit_price', 'shop_id', 'current_stock'])
+        for i in range(7):
+            sheet.append([f'X{i}', None if i == 4 else f'Item {i}', 1.25, self.shop.id, i])
+        sheet.append([None] * 5)
+        sheet.append(['X7', 'Item 7', 1.25, self.shop.id, 7])
+        content = io.BytesIO()
+        workbook.save(content)
+
+        importer = ProductImporter(SimpleUploadedFile('catalog.xlsx', content.getvalue()), self.user)
+        with mock.patch.object(ProductImporter, 'CHUNK_SIZE', 3), \
+                mock.patch.object(ProductImporter, '_validate', record):
+            self.assertTrue(importer.import_from_excel())
+
+        summary = importer.get_summary()
+        self.assertEqual(frames, [3, 3, 2])
+        self.assertEqual(summary['success_count'], 7)
+        # Row numbers are sheet rows, whatever chunk they were read in
+        self.assertEqual(summary['errors'], ['Row 6: Missing required field: name'])
+        self.assertEqual(Product.objects.get(sku='X7').current_stock, 7)
+
+        frames.clear()
+        with mock.patch.object(ProductImporter, 'CHUNK_SIZE', 3), \
+                mock.patch.object(ProductImporter, '_validate', record):
+            summary = self.run_import([f'X{i},Item,1.25,{self.shop.id},1,,' for i in range(8)])
+        self.assertEqual(frames, [3, 3, 2])
+        self.assertEqual((summary['success_count'], summary['update_count']), (1, 7))
+
+
+class ProductExportTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='owner', password='pass', email='o@example.com', role='admin'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.shops = [
+            Shop.objects.create(name=name, address='-', phone='-') for name in ('Accra', 'Kumasi')
+        ]
+
+    def export(self):
+        with mock.patch.object(ProductExporter, 'CHUNK_SIZE', 2):
+            response = self.client.get('/api/products/export_products/')
+            self.assertTrue(response.streaming)
+            pieces = list(response.streaming_content)
+        return pieces, list(csv.reader(io.StringIO(b''.join(pieces).decode())))
+
+    def test_csv_is_streamed_in_chunks_with_shop_names(self):
+        for i in range(5):
+            Product.objects.create(
+                sku=f'P{i}', name=f'Item {i}', unit_price=Decimal('1.25'),
+                current_stock=i, shop=self.shops[i % 2]
+            )
+
+        with self.assertNumQueries(1):
+            pieces, rows = self.export()
+
+        self.assertEqual(len(pieces), 4)  # header, then 2 + 2 + 1 products
+        self.assertEqual(rows[0], ProductExporter.CSV_FIELDS)
+        self.assertEqual(
+            [(row[1], row[4], row[5], row[8]) for row in rows[1:]],
+            [(f'P{i}', '1.25', str(i), self.shops[i % 2].name) for i in range(5)]
+        )
+
+
+class ImportJobTest(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.enterContext(override_settings(PRODUCT_IMPORT_STORAGE={
+            'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': root},
+        }))
+        self.enterContext(mock.patch.object(ProductImporter, 'CHUNK_SIZE', 3))
+        self.user = get_user_model().objects.create_user(
+            username='owner', password='pass', email='o@example.com', role='admin'
+        )
+        self.shop = Shop.objects.create(name='Main', address='1 High St', phone='000')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, rows=8):
+        lines = ['sku,name,unit_price,shop_id,current_stock'] + [
+            f'J{i},{"" if i == 1 else f"Item {i}"},1.00,{self.shop.id},{i}' for i in range(rows)
+        ]
+        upload = SimpleUploadedFile('catalog.csv', '\n'.join(lines).encode())
+        with mock.patch('products.tasks.run_product_import.delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/products/import_products/', {'file': upload})
+        self.assertEqual(response.status_code, 202)
+        delay.assert_called_once_with(response.json()['id'])
+        return ImportJob.objects.get(id=response.json()['id'])
+
+    def test_upload_is_imported_in_the_background(self):
+        job = self.upload()
+        self.assertEqual((job.status, job.rows_processed), (ImportJob.STATUS_PENDING, 0))
+        self.assertFalse(Product.objects.exists())
+
+        self.assertEqual(run_product_import(job.id), ImportJob.STATUS_COMPLETED)
+        self.assertIsNone(run_product_import(job.id))  # Already claimed and done
+
+        data = self.client.get(f'/api/product-imports/{job.id}/').json()
+        self.assertEqual((data['status'], data['progress'], data['rows_processed']), ('completed', 100, 8))
+        self.assertEqual(data['total_rows'], 8)
+        self.assertEqual(data['summary'], {
+            'success_count': 7, 'update_count': 0, 'skip_count': 1,
+            'errors': ['Row 3: Missing required field: name'], 'total_processed': 8
+        })
+        # The stored upload is removed once imported
+        job.refresh_from_db()
+        self.assertFalse(ImportJob.storage().exists(job.upload))
+
+    def test_crashed_import_resumes_from_its_last_chunk(self):
+        job = self.upload()
+        process_frame = ProductImporter._process_frame
+        frames = []
+
+        def crash_on_second_chunk(importer, df):
+            frames.append(len(df))
+            process_frame(importer, df)
+            if len(frames) == 2:
+                raise ConnectionError('worker lost its database')
+
+        with mock.patch.object(ProductImporter, '_process_frame', crash_on_second_chunk):
+            self.assertEqual(run_product_import(job.id), ImportJob.STATUS_PENDING)
+        job.refresh_from_db()
+        # The second chunk rolled back with its checkpoint
+        self.assertEqual((job.rows_processed, job.success_count, job.skip_count), (3, 2, 1))
+        self.assertIn('Import stopped at row 5', job.last_error)
+        self.assertEqual(Product.objects.count(), 2)
+
+        # The dispatcher picks the job up again once it has been left alone
+        with mock.patch('products.tasks.run_product_import.delay') as delay:
+            self.assertEqual(resume_product_imports(grace_seconds=0), 1)
+        delay.assert_called_once_with(job.id)
+        self.assertEqual(run_product_import(job.id), ImportJob.STATUS_COMPLETED)
+
+        job.refresh_from_db()
+        self.assertEqual((job.attempts, job.rows_processed), (2, 8))
+        self.assertEqual(job.get_summary()['success_count'], 7)
+        self.assertEqual(job.errors, ['Row 3: Missing required field: name'])
+        stock = dict(Product.objects.values_list('sku', 'current_stock'))
+        self.assertEqual(stock, {f'J{i}': i for i in range(8) if i != 1})
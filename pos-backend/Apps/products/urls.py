@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet, InventoryMovementViewSet
+from .views import ProductViewSet, InventoryMovementViewSet, ImportJobViewSet
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet, basename='product')
 router.register(r'inventory-movements', InventoryMovementViewSet, basename='inventorymovement')
+router.register(r'product-imports', ImportJobViewSet, basename='productimport')
 
 
 urlpatterns = [
@@ -4,21 +4,24 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.db import transaction
 from django.db.models import Q, F
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 import os
 import tempfile
+import uuid
 
 #from users.permissions import HasShopAccess
 from suppliers.models import Supplier  # Import from suppliers app
-from .models import Product, InventoryMovement, SupplierInfo
+from .models import Product, InventoryMovement, SupplierInfo, ImportJob
 from .serializers import (
     ProductSerializer,
     ProductCreateWithStockSerializer,
     InventoryMovementSerializer,
-    SupplierInfoSerializer
-    
+    SupplierInfoSerializer,
+    ImportJobSerializer
 )
 from .importers import ProductImporter, ProductExporter
+from .sharding import return_to_shards
+from Apps.pagination import KeysetPagination
 
 
 # ==============================
@@ -30,7 +33,7 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        queryset = Product.objects.select_related('shop').prefetch_related('suppliers')
+        queryset = Product.objects.select_related('shop').prefetch_related('suppliers', 'shards')
 
         # For non-admin users, filter by assigned shops
         if user.role != 'admin':
@@ -88,8 +91,11 @@ class ProductViewSet(viewsets.ModelViewSet):
             product.save()
 
         # Add stock
-        product.current_stock += data['quantity']
-        product.save()
+        if product.is_sharded:
+            return_to_shards({product.id: data['quantity']})
+        else:
+            product.current_stock += data['quantity']
+            product.save()
 
         # Get supplier with error handling
         try:
@@ -132,23 +138,28 @@ class ProductViewSet(viewsets.ModelViewSet):
             return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
 
         file = request.FILES['file']
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.name)[1]) as tmp_file:
-            for chunk in file.chunks():
-                tmp_file.write(chunk)
-            tmp_path = tmp_file.name
+        if not file.name.endswith(('.csv', '.xls', '.xlsx')):
+            return Response({'error': 'Unsupported file format'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            importer = ProductImporter(tmp_path, request.user)
+        # A dry run validates the whole file against the database and
+        # reports what the import would do, writing nothing
+        if request.query_params.get('dry_run') == 'true':
+            importer = ProductImporter(file, request.user, dry_run=True)
             if file.name.endswith('.csv'):
                 success = importer.import_from_csv()
-            elif file.name.endswith(('.xls', '.xlsx')):
-                success = importer.import_from_excel()
             else:
-                return Response({'error': 'Unsupported file format'}, status=status.HTTP_400_BAD_REQUEST)
+                success = importer.import_from_excel()
+            return Response({'success': success, 'dry_run': True, 'summary': importer.get_summary()})
+
+        # Store the upload and import it in the background; the client
+        # polls the job for progress and the final summary
+        from .tasks import run_product_import
 
-            return Response({'success': success, 'summary': importer.get_summary()})
-        finally:
-            os.unlink(tmp_path)
+        job = ImportJob(file_name=os.path.basename(file.name)[:255], created_by=request.user)
+        job.upload = ImportJob.storage().save(f'{uuid.uuid4().hex}/{job.file_name}', file)
+        job.save()
+        transaction.on_commit(lambda: run_product_import.delay(job.id))
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
     # Export products to CSV/Excel
     @action(detail=False, methods=['get'])
@@ -157,15 +168,17 @@ class ProductViewSet(viewsets.ModelViewSet):
         queryset = self.filter_queryset(self.get_queryset())
         exporter = ProductExporter(queryset)
 
-        tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.csv' if format_type == 'csv' else '.xlsx')
         if format_type == 'csv':
-            exporter.export_to_csv(tmp_file.name)
-            content_type = 'text/csv'
-            filename = 'products_export.csv'
-        else:
-            exporter.export_to_excel(tmp_file.name)
-            content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            filename = 'products_export.xlsx'
+            # Rows are read and sent a chunk at a time, so the first bytes
+            # go out at once and memory does not grow with the catalog
+            response = StreamingHttpResponse(exporter.stream_csv(), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="products_export.csv"'
+            return response
+
+        tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
+        exporter.export_to_excel(tmp_file.name)
+        content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        filename = 'products_export.xlsx'
 
         with open(tmp_file.name, 'rb') as f:
             response = HttpResponse(f.read(), content_type=content_type)
@@ -175,12 +188,22 @@ class ProductViewSet(viewsets.ModelViewSet):
         return response
 
 
+class ImportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Background product imports started by the current user"""
+    serializer_class = ImportJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return ImportJob.objects.filter(created_by=self.request.user)
+
+
 # ==============================
 # Inventory Movements
 # ==============================
 class InventoryMovementViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = InventoryMovementSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
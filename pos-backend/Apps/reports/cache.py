@@ -0,0 +1,109 @@
+# apps/reports/cache.py
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from shops.dates import get_zone, local_today
+
+POLL_INTERVAL = 0.05
+
+
+def _version_key(shop_id):
+    return f'report-version:{shop_id}'
+
+
+def invalidate_reports(shop_ids):
+    """Make cached reports covering any of these shops stale.
+
+    The shops get new versions once the current transaction commits, so
+    a recompute racing the change cannot cache the data from before it.
+    """
+    shop_ids = set(shop_ids)
+    if not shop_ids:
+        return
+
+    def bump():
+        # A fresh token rather than a counter: an evicted and recreated
+        # version can never match the one an entry was computed with
+        version = uuid.uuid4().hex
+        caches['reports'].set_many(
+            {_version_key(shop_id): version for shop_id in shop_ids}, timeout=None
+        )
+
+    transaction.on_commit(bump)
+
+
+class ReportCache:
+    """Report results per (report, shop set, shop-local date).
+
+    An entry records the version of every shop it covers; completed sales
+    and stock changes give those shops new versions (``invalidate_reports``)
+    and the entry goes stale. A stale entry keeps being served while one
+    caller recomputes it, so a burst of dashboards polling the same scope
+    costs a single recompute. Entries are also revalidated after
+    ``REPORT_CACHE_MAX_AGE`` seconds. The backend is the 'reports' cache.
+    """
+
+    def __init__(self, report, timezones, cache=None):
+        """``timezones`` is the shop set, as returned by ``shop_timezones``"""
+        self.cache = cache or caches['reports']
+        self.shop_ids = sorted(shop_id for ids in timezones.values() for shop_id in ids)
+        # Each zone's local date: a new day in any of the shops is a new key
+        dates = sorted(f'{name}={local_today(get_zone(name)).isoformat()}' for name in timezones)
+        scope = hashlib.sha256(
+            f"{','.join(map(str, self.shop_ids))}|{';'.join(dates)}".encode()
+        ).hexdigest()[:32]
+        self.key = f'report:{report}:{scope}'
+        self.lock_key = f'{self.key}:lock'
+
+    def versions(self):
+        found = self.cache.get_many([_version_key(shop_id) for shop_id in self.shop_ids])
+        return [found.get(_version_key(shop_id)) for shop_id in self.shop_ids]
+
+    def get_or_compute(self, compute):
+        """Return the cached result, calling ``compute()`` when it is missing or stale"""
+        started = time.time()
+        versions = self.versions()
+        entry = self.cache.get(self.key)
+        if entry is not None:
+            if entry['versions'] == versions and started - entry['at'] < settings.REPORT_CACHE_MAX_AGE:
+                return entry['data']
+            if not self._lock():
+                # Another request is recomputing; the previous result will do
+                return entry['data']
+            locked = True
+        else:
+            locked = self._lock()
+            if not locked:
+                entry = self._wait()
+                if entry is not None:
+                    return entry['data']
+
+        try:
+            data = compute()
+            # Stamped with the versions read before computing: a change
+            # landing meanwhile leaves the entry stale, not wrongly fresh
+            self.cache.set(self.key, {'data': data, 'versions': versions, 'at': started})
+        finally:
+            if locked:
+                self.cache.delete(self.lock_key)
+        return data
+
+    def _lock(self):
+        return self.cache.add(self.lock_key, 1, settings.REPORT_CACHE_LOCK_TIMEOUT)
+
+    def _wait(self):
+        """Wait for a concurrent first computation; None if it failed or took too long"""
+        deadline = time.monotonic() + settings.REPORT_CACHE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            entry = self.cache.get(self.key)
+            if entry is not None:
+                return entry
+            if self.cache.get(self.lock_key) is None:
+                return None
+        return None
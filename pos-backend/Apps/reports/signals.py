@@ -0,0 +1,25 @@
+# apps/reports/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from products.models import Product
+from sales.models import Sale
+from .cache import invalidate_reports
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    """Stock, price or reorder level changed: refresh the shop's reports"""
+    invalidate_reports([instance.shop_id])
+
+
+@receiver(post_save, sender=Sale)
+def sale_changed(sender, instance, created, **kwargs):
+    """A refunded or edited sale; completions are caught by the hourly rollup"""
+    if not created:
+        invalidate_reports([instance.shop_id])
+
+
+@receiver(post_delete, sender=Sale)
+def sale_deleted(sender, instance, **kwargs):
+    invalidate_reports([instance.shop_id])
@@ -1,3 +1,140 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from analytics.models import ShopHourlySales
+from products.models import Product
+from sales.checkout import CheckoutEngine
+from shops.dates import get_zone, local_today
+from shops.models import Shop
+from .cache import ReportCache, invalidate_reports
+
+
+class SalesReportViewTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='owner', password='pass', email='o@example.com', role='admin'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.accra = Shop.objects.create(name='Accra', address='-', phone='-', timezone='Africa/Accra')
+        self.delhi = Shop.objects.create(name='Delhi', address='-', phone='-', timezone='Asia/Kolkata')
+        caches['reports'].clear()
+
+    def add_hour(self, shop, days_ago, revenue, count, method='cash'):
+        zone = get_zone(shop.timezone)
+        day = local_today(zone) - timedelta(days=days_ago)
+        ShopHourlySales.objects.create(
+            shop=shop, hour=datetime.combine(day, time(12), tzinfo=zone), payment_method=method,
+            revenue=Decimal(revenue), transaction_count=count, items_sold=count
+        )
+        return day
+
+    def test_windows_come_from_one_daily_series(self):
+        self.add_hour(self.accra, 0, '10.00', 1)
+        self.add_hour(self.accra, 0, '5.00', 1, method='card')
+        self.add_hour(self.delhi, 0, '20.00', 2)
+        three_days_ago = self.add_hour(self.delhi, 3, '7.00', 1)
+        twelve_days_ago = self.add_hour(self.accra, 12, '30.00', 3)
+        self.add_hour(self.accra, 45, '1000.00', 50)  # outside every window
+
+        # shops, one rollup scan, product breakdown
+        with self.assertNumQueries(3):
+            data = self.client.get('/api/reports/sales/').json()
+
+        self.assertEqual(data['today'], {'revenue': 35.0, 'transactions': 4})
+        self.assertEqual(data['last_7_days'], {'revenue': 42.0, 'transactions': 5})
+        in_month = local_today(get_zone('Africa/Accra')).day > 12
+        self.assertEqual(
+            data['this_month']['revenue'],
+            35.0 + (7.0 if three_days_ago.month == local_today(get_zone('Asia/Kolkata')).month else 0)
+            + (30.0 if in_month else 0)
+        )
+        # The summary covers the 30 days once, not today + week + month
+        self.assertEqual(data['summary'], {
+            'period': 'last_30_days', 'total_revenue': 72.0, 'total_transactions': 8
+        })
+        self.assertEqual(len(data['weekly_sales']), 2)
+        self.assertEqual(
+            [day['date'] for day in data['daily_sales']][0], twelve_days_ago.isoformat()
+        )
+        self.assertEqual(sum(day['transaction_count'] for day in data['daily_sales']), 8)
+
+
+class ReportCacheTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='owner', password='pass', email='o@example.com', role='admin'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.shop = Shop.objects.create(
+            name='Accra', address='-', phone='-', timezone='Africa/Accra', created_by=self.user
+        )
+        self.product = Product.objects.create(
+            sku='TEA', name='Tea', unit_price=Decimal('1.50'), current_stock=20, shop=self.shop
+        )
+        caches['reports'].clear()
+
+    def test_reports_are_cached_until_a_sale_completes(self):
+        ShopHourlySales.objects.create(
+            shop=self.shop, hour=datetime.combine(local_today(get_zone('Africa/Accra')), time(12),
+                                                  tzinfo=get_zone('Africa/Accra')),
+            payment_method='cash', revenue=Decimal('10.00'), transaction_count=1, items_sold=1
+        )
+        self.assertEqual(self.client.get('/api/reports/sales/').json()['today']['revenue'], 10.0)
+
+        # Writes that are not sale or stock events do not reach the cache
+        ShopHourlySales.objects.update(revenue=Decimal('20.00'))
+        with self.assertNumQueries(1):  # the shop set only
+            data = self.client.get('/api/reports/sales/').json()
+        self.assertEqual(data['today']['revenue'], 10.0)
+
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            engine = CheckoutEngine(self.shop, self.user)
+            basket = engine.prepare([
+                {'product_id': self.product.id, 'quantity': 1, 'unit_price': '1.50'}
+            ])
+            engine.checkout(basket, payment_method='cash', status='completed')
+        self.assertEqual(self.client.get('/api/reports/sales/').json()['today']['revenue'], 21.5)
+
+    def test_stock_changes_refresh_inventory_and_kpis(self):
+        kpis_url = f'/api/shops/{self.shop.id}/kpis/'
+        self.assertEqual(self.client.get(kpis_url).json()['low_stock_count'], 0)
+        inventory = self.client.get('/api/reports/inventory/').json()['summary']
+        self.assertEqual(inventory['total_inventory_value'], 30.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.current_stock = 4
+            self.product.save()
+        self.assertEqual(self.client.get(kpis_url).json()['low_stock_count'], 1)
+        inventory = self.client.get('/api/reports/inventory/').json()['summary']
+        self.assertEqual(inventory['total_inventory_value'], 6.0)
+
+    def test_stale_entry_is_served_while_another_caller_recomputes(self):
+        cache = ReportCache('test', {'Africa/Accra': [self.shop.id]})
+        self.assertEqual(cache.get_or_compute(lambda: 'first'), 'first')
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_reports([self.shop.id])
+
+        # A concurrent request holds the recompute lock
+        cache.cache.add(cache.lock_key, 1)
+        compute = mock.Mock(return_value='second')
+        self.assertEqual(cache.get_or_compute(compute), 'first')
+        compute.assert_not_called()
+
+        cache.cache.delete(cache.lock_key)
+        self.assertEqual(cache.get_or_compute(compute), 'second')
+        self.assertEqual(cache.get_or_compute(compute), 'second')
+        compute.assert_called_once()
 
-# Create your tests here.
+        # Other shop sets and other shop-local dates are separate entries
+        self.assertNotEqual(cache.key, ReportCache('test', {'Africa/Accra': [self.shop.id + 1]}).key)
+        self.assertNotEqual(cache.key, ReportCache('test', {'Pacific/Kiritimati': [self.shop.id]}).key)
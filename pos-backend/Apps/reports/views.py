@@ -6,13 +6,29 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
-from django.db.models import Sum, Count, F
-from django.utils import timezone
+from django.db.models import Sum, F
 from datetime import timedelta
 from django.http import HttpResponse
+from shops.models import Shop
+from shops.dates import local_window_q, primary_zone, shop_timezones
+from sales.archive import SaleArchive
+from .cache import ReportCache
 import csv
 
 
+def _add_archived_categories(breakdown, totals):
+    """Merge archived per-product totals into the category breakdown, best sellers first"""
+    categories = {item['category_name']: item for item in breakdown}
+    for name, revenue, quantity in totals.itertuples(index=False):
+        name = name if isinstance(name, str) and name else 'Uncategorized'
+        item = categories.setdefault(name, {
+            'category_name': name, 'total_revenue': 0.0, 'total_quantity': 0
+        })
+        item['total_revenue'] += float(revenue)
+        item['total_quantity'] += int(quantity)
+    return sorted(categories.values(), key=lambda item: -item['total_revenue'])
+
+
 # =====================================================================
 # SALES REPORT (FUNCTION BASED — SIMPLE PLACEHOLDER)
 # =====================================================================
@@ -36,81 +52,100 @@ class SalesReportView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
+        from analytics.models import ShopHourlySales
         from sales.models import Sale
-        from django.db.models.functions import TruncDate
-        from django.db.models import F
 
         user = request.user
 
         # FILTER SALES BY SHOP
         if user.role == 'admin':
+            shops = Shop.objects.all()
             sales = Sale.objects.filter(status='completed')
+            hourly = ShopHourlySales.objects.all()
+            archive_shops = None
         else:
+            shops = user.assigned_shops.all()
             shop_ids = user.assigned_shops.values_list('id', flat=True)
             sales = Sale.objects.filter(shop_id__in=shop_ids, status='completed')
+            hourly = ShopHourlySales.objects.filter(shop_id__in=shop_ids)
+            archive_shops = list(shop_ids)
 
-        today = timezone.now().date()
+        # Dashboards poll this; recompute only after a sale in one of the shops
+        timezones = shop_timezones(shops)
+        data = ReportCache('sales', timezones).get_or_compute(
+            lambda: self.build(timezones, sales, hourly, archive_shops)
+        )
+        return Response(data)
 
-        # PERIODS
-        month_start = today.replace(day=1)
-        week_ago = today - timedelta(days=7)
-        days_30_ago = today - timedelta(days=30)
+    def build(self, timezones, sales, hourly, archive_shops):
+        from sales.models import SaleItem
+        from django.db.models.functions import TruncDate
 
-        # AGGREGATIONS FOR SUMMARY
-        today_sales = sales.filter(created_at__date=today).aggregate(
-            total=Sum('total_amount'),
-            count=Count('id')
-        )
-        month_sales = sales.filter(created_at__date__gte=month_start).aggregate(
-            total=Sum('total_amount'),
-            count=Count('id')
-        )
-        week_sales = sales.filter(created_at__date__gte=week_ago).aggregate(
-            total=Sum('total_amount'),
-            count=Count('id')
+        # PERIODS (shop-local days, as bounds on the hourly rollup, whose
+        # rows start on the shop's local hours). The last 30 days contain
+        # every other window, so one range scan over them fills them all.
+        zone = primary_zone(timezones)
+        windows = {
+            'today': local_window_q(timezones, lambda today: (today, today), field='hour'),
+            'this_month': local_window_q(
+                timezones, lambda today: (today.replace(day=1), today), field='hour'
+            ),
+            'last_7_days': local_window_q(
+                timezones, lambda today: (today - timedelta(days=7), today), field='hour'
+            ),
+        }
+        days_30_window = local_window_q(
+            timezones, lambda today: (today - timedelta(days=30), today), field='hour'
         )
 
-        # Build a summary for total revenue and transactions
-        total_revenue = float(
-            (today_sales['total'] or 0) +
-            (month_sales['total'] or 0) +
-            (week_sales['total'] or 0)
-        )
-        total_transactions = (
-            (today_sales['count'] or 0) +
-            (month_sales['count'] or 0) +
-            (week_sales['count'] or 0)
-        )
-        
-        summary = {
-            'total_revenue': total_revenue,
-            'total_transactions': total_transactions,
-        }
+        buckets = {}
+        for name, window in windows.items():
+            buckets[f'{name}_revenue'] = Sum('revenue', filter=window)
+            buckets[f'{name}_count'] = Sum('transaction_count', filter=window)
 
-        # DAILY SALES DATA (last 30 days for chart)
-        daily_sales_data = (
-            sales.filter(created_at__date__gte=days_30_ago)
-            .annotate(sale_date=TruncDate('created_at'))
+        # DAILY SALES DATA (last 30 days), each day carrying its share of
+        # the shorter windows
+        days = list(
+            hourly.filter(days_30_window)
+            .annotate(sale_date=TruncDate('hour', tzinfo=zone))
             .values('sale_date')
             .annotate(
-                total_revenue=Sum('total_amount'),
-                transaction_count=Count('id')
+                day_revenue=Sum('revenue'),
+                day_count=Sum('transaction_count'),
+                **buckets
             )
             .order_by('sale_date')
         )
-        
-        daily_sales = [
-            {
-                'date': item['sale_date'].isoformat(),
-                'total_revenue': float(item['total_revenue'] or 0),
-                'transaction_count': item['transaction_count']
+
+        def series(revenue, count):
+            return [
+                {
+                    'date': day['sale_date'].isoformat(),
+                    'total_revenue': float(day[revenue] or 0),
+                    'transaction_count': day[count]
+                }
+                for day in days
+                if day[count]
+            ]
+
+        def window_totals(name):
+            return {
+                'revenue': float(sum(day[f'{name}_revenue'] or 0 for day in days)),
+                'transactions': sum(day[f'{name}_count'] or 0 for day in days),
             }
-            for item in daily_sales_data
-        ]
+
+        daily_sales = series('day_revenue', 'day_count')
+        weekly_sales = series('last_7_days_revenue', 'last_7_days_count')
+
+        # Totals over the widest window shown (today, the week and the
+        # month overlap, so adding them up would count sales repeatedly)
+        summary = {
+            'period': 'last_30_days',
+            'total_revenue': float(sum(day['day_revenue'] for day in days)),
+            'total_transactions': sum(day['day_count'] for day in days),
+        }
 
         # CATEGORY BREAKDOWN (by product categories in sale items)
-        from sales.models import SaleItem
-        
         category_sales = (
             SaleItem.objects.filter(sale__in=sales, sale__status='completed')
             .values(category_name=F('product__name'))
@@ -118,8 +153,12 @@ class SalesReportView(APIView):
                 total_revenue=Sum(F('quantity') * F('unit_price')),
                 total_quantity=Sum('quantity')
             )
-            .order_by('-total_revenue')[:6]  # Top 6 categories
+            .order_by('-total_revenue')
         )
+        # Archived months contribute their stored per-product totals
+        archived_totals = SaleArchive().category_totals(archive_shops)
+        if archived_totals.empty:
+            category_sales = category_sales[:6]  # Top 6 categories
         
         category_breakdown = [
             {
@@ -129,46 +168,16 @@ class SalesReportView(APIView):
             }
             for item in category_sales
         ]
+        if not archived_totals.empty:
+            category_breakdown = _add_archived_categories(category_breakdown, archived_totals)[:6]
 
-        # WEEKLY SALES DATA (last 7 days)
-        weekly_sales_data = (
-            sales.filter(created_at__date__gte=week_ago)
-            .annotate(sale_date=TruncDate('created_at'))
-            .values('sale_date')
-            .annotate(
-                total_revenue=Sum('total_amount'),
-                transaction_count=Count('id')
-            )
-            .order_by('sale_date')
-        )
-        
-        weekly_sales = [
-            {
-                'date': item['sale_date'].isoformat(),
-                'total_revenue': float(item['total_revenue'] or 0),
-                'transaction_count': item['transaction_count']
-            }
-            for item in weekly_sales_data
-        ]
-        
-        return Response({
+        return {
             'summary': summary,
-            'today': {
-                'revenue': float(today_sales['total'] or 0),
-                'transactions': today_sales['count'] or 0,
-            },
-            'this_month': {
-                'revenue': float(month_sales['total'] or 0),
-                'transactions': month_sales['count'] or 0
-            },
-            'last_7_days': {
-                'revenue': float(week_sales['total'] or 0),
-                'transactions': week_sales['count'] or 0
-            },
+            **{name: window_totals(name) for name in windows},
             'daily_sales': daily_sales,
             'category_breakdown': category_breakdown,
             'weekly_sales': weekly_sales,
-        })
+        }
 
 
 @api_view(['GET'])
@@ -181,9 +190,11 @@ def export_sales_csv(request):
     # FILTER BY SHOP
     if user.role == 'admin':
         sales = Sale.objects.filter(status='completed')
+        archive_shops = None
     else:
         shop_ids = user.assigned_shops.values_list('id', flat=True)
         sales = Sale.objects.filter(shop_id__in=shop_ids, status='completed')
+        archive_shops = list(shop_ids)
 
     # CSV RESPONSE
     response = HttpResponse(content_type='text/csv')
@@ -201,6 +212,21 @@ def export_sales_csv(request):
             sale.created_at.strftime('%Y-%m-%d %H:%M:%S')
         ])
 
+    # Older sales live in the cold archive, newest month first
+    shop_names = dict(Shop.objects.values_list('id', 'name'))
+    archived = SaleArchive().frames(
+        'sales', archive_shops, columns=['id', 'shop_id', 'total_amount', 'status', 'created_at']
+    )
+    for frame in archived:
+        for row in frame.sort_values('created_at', ascending=False).itertuples(index=False):
+            writer.writerow([
+                row.id,
+                shop_names.get(row.shop_id, 'N/A'),
+                float(row.total_amount),
+                row.status,
+                row.created_at.strftime('%Y-%m-%d %H:%M:%S')
+            ])
+
     return response
 
 
@@ -229,11 +255,19 @@ class InventoryReportView(APIView):
 
         # FILTER PRODUCTS BY SHOP
         if user.role == 'admin':
+            shops = Shop.objects.all()
             products = Product.objects.filter(is_active=True)
         else:
+            shops = user.assigned_shops.all()
             shop_ids = user.assigned_shops.values_list('id', flat=True)
             products = Product.objects.filter(shop_id__in=shop_ids, is_active=True)
 
+        data = ReportCache('inventory', shop_timezones(shops)).get_or_compute(
+            lambda: self.build(products)
+        )
+        return Response(data)
+
+    def build(self, products):
         # AGGREGATIONS
         total_products = products.count()
         low_stock = products.filter(current_stock__lte=F('reorder_level')).count()
@@ -251,7 +285,7 @@ class InventoryReportView(APIView):
             'out_of_stock_items': out_of_stock,
             'total_inventory_value': float(inventory_value['total'] or 0),
         }
-        return Response({'summary': summary})
+        return {'summary': summary}
 
 
 # =====================================================================
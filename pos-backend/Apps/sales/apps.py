@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SalesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sales'
+    
+    def ready(self):
+        import sales.signals  # Drop cached receipts when a sale changes
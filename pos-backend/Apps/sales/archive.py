@@ -0,0 +1,327 @@
+# apps/sales/archive.py
+"""Cold archive of old completed sales as Parquet files.
+
+Sales older than ``SALE_ARCHIVE_AFTER_MONTHS`` are written, with their
+items, to zstd-compressed Parquet files under ``SALE_ARCHIVE_DIR``::
+
+    shop=<id>/month=<YYYY-MM>/sales-<part>.parquet
+    shop=<id>/month=<YYYY-MM>/items-<part>.parquet
+    shop=<id>/month=<YYYY-MM>/categories-<part>.parquet
+    manifest.json
+
+and then deleted from the database. Months are UTC calendar months, like
+the table partitions. ``manifest.json`` lists every part with its row
+counts and revenue; readers only open the files of months overlapping the
+range they ask for. Each part also gets its per-product totals, so reports
+never scan archived items.
+"""
+from collections import defaultdict
+from contextvars import ContextVar
+from datetime import datetime, time, timezone as dt_timezone
+from decimal import Decimal
+from itertools import islice
+import copy
+import json
+import os
+
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .ids import uuid7
+from .models import Sale, SaleItem
+from .partitions import add_months, current_month
+
+SALE_FIELDS = [
+    'id', 'shop_id', 'cashier_id', 'total_amount', 'payment_method', 'status',
+    'paystack_reference', 'customer_name', 'customer_phone', 'customer_email',
+    'notes', 'created_at', 'updated_at',
+]
+ITEM_FIELDS = [
+    'id', 'sale_id', 'product_id', 'product_name', 'product_sku', 'quantity',
+    'unit_price', 'discount', 'subtotal', 'created_at',
+]
+
+# Parsed manifests by path, reloaded when the file changes
+_manifests = {}
+
+# True while archived sales are deleted: they stay counted in rollups
+archiving = ContextVar('sale_archiving', default=False)
+
+
+def _schemas():
+    import pyarrow as pa
+
+    money = pa.decimal128(10, 2)
+    stamp = pa.timestamp('us', tz='UTC')
+    sales = pa.schema([
+        ('id', pa.string()), ('shop_id', pa.int64()), ('cashier_id', pa.int64()),
+        ('total_amount', money), ('payment_method', pa.string()), ('status', pa.string()),
+        ('paystack_reference', pa.string()), ('customer_name', pa.string()),
+        ('customer_phone', pa.string()), ('customer_email', pa.string()),
+        ('notes', pa.string()), ('created_at', stamp), ('updated_at', stamp),
+    ])
+    items = pa.schema([
+        ('id', pa.int64()), ('sale_id', pa.string()), ('product_id', pa.int64()),
+        ('product_name', pa.string()), ('product_sku', pa.string()), ('quantity', pa.int64()),
+        ('unit_price', money), ('discount', money), ('subtotal', money), ('created_at', stamp),
+    ])
+    categories = pa.schema([
+        ('product_name', pa.string()), ('revenue', pa.decimal128(18, 2)), ('quantity', pa.int64()),
+    ])
+    return sales, items, categories
+
+
+def month_bounds(month):
+    """UTC ``[start, end)`` of a calendar month"""
+    start = datetime.combine(month, time.min, tzinfo=dt_timezone.utc)
+    end = datetime.combine(add_months(month, 1), time.min, tzinfo=dt_timezone.utc)
+    return start, end
+
+
+def _category_rows(items, rows=()):
+    """Add ``(product_name, quantity, unit_price)`` items to per-product total rows"""
+    totals = defaultdict(lambda: [Decimal(0), 0])
+    for row in rows:
+        totals[row['product_name']][0] += row['revenue']
+        totals[row['product_name']][1] += row['quantity']
+    for name, quantity, unit_price in items:
+        totals[name][0] += quantity * unit_price
+        totals[name][1] += quantity
+    return [
+        {'product_name': name, 'revenue': revenue, 'quantity': quantity}
+        for name, (revenue, quantity) in totals.items()
+    ]
+
+
+class SaleArchive:
+    """Reader and writer for the Parquet sales archive"""
+
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, root=None):
+        self.root = root or settings.SALE_ARCHIVE_DIR
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, self.MANIFEST)
+
+    def load_manifest(self):
+        path = self.manifest_path
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return {'version': 1, 'months': {}}
+        cached = _manifests.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path) as f:
+                cached = _manifests[path] = (mtime, json.load(f))
+        return cached[1]
+
+    def save_manifest(self, manifest):
+        # Replace atomically so readers never see a half-written file
+        tmp = f'{self.manifest_path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.manifest_path)
+
+    def entries(self, shop_ids=None, start=None, end=None):
+        """Manifest entries for the shops whose month overlaps ``[start, end)``, newest first"""
+        shop_ids = None if shop_ids is None else set(shop_ids)
+        entries = []
+        for entry in self.load_manifest()['months'].values():
+            if shop_ids is not None and entry['shop_id'] not in shop_ids:
+                continue
+            if start is not None and datetime.fromisoformat(entry['end']) <= start:
+                continue
+            if end is not None and datetime.fromisoformat(entry['start']) >= end:
+                continue
+            entries.append(entry)
+        return sorted(entries, key=lambda entry: entry['month'], reverse=True)
+
+    def frames(self, kind, shop_ids=None, start=None, end=None, columns=None):
+        """Yield one DataFrame of ``'sales'`` or ``'items'`` per archived shop-month"""
+        import pyarrow.parquet as pq
+
+        filters = []
+        if start is not None:
+            filters.append(('created_at', '>=', start))
+        if end is not None:
+            filters.append(('created_at', '<', end))
+
+        for entry in self.entries(shop_ids, start, end):
+            paths = [os.path.join(self.root, part[kind]) for part in entry['parts']]
+            table = pq.read_table(
+                paths, columns=columns, filters=filters or None, partitioning=None
+            )
+            if table.num_rows:
+                yield table.to_pandas()
+
+    def read(self, kind, shop_ids=None, start=None, end=None, columns=None):
+        """All matching archived rows as one DataFrame (empty if none)"""
+        frames = list(self.frames(kind, shop_ids, start, end, columns))
+        if not frames:
+            fields = SALE_FIELDS if kind == 'sales' else ITEM_FIELDS
+            return pd.DataFrame(columns=columns or fields)
+        return pd.concat(frames, ignore_index=True)
+
+    def category_totals(self, shop_ids=None):
+        """Archived revenue and quantity per product name, over every month"""
+        import pyarrow.parquet as pq
+
+        frames = []
+        for entry in self.entries(shop_ids):
+            for part in entry['parts']:
+                if 'categories' in part:
+                    frames.append(pq.read_table(os.path.join(self.root, part['categories'])).to_pandas())
+                else:
+                    # Parts archived before totals were kept
+                    items = pq.read_table(
+                        os.path.join(self.root, part['items']),
+                        columns=['product_name', 'quantity', 'unit_price']
+                    ).to_pandas()
+                    frames.append(pd.DataFrame(_category_rows(items.itertuples(index=False))))
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame(columns=['product_name', 'revenue', 'quantity'])
+        return (
+            pd.concat(frames, ignore_index=True)
+            .groupby('product_name', as_index=False, dropna=False)
+            .agg({'revenue': 'sum', 'quantity': 'sum'})
+        )
+
+    def archive_month(self, shop_id, month, batch_size=1000):
+        """Move one shop's completed sales of a UTC month into a new part.
+
+        Files and manifest are written before anything is deleted, and
+        sales already present in earlier parts are skipped, so an
+        interrupted run can simply be repeated.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        start, end = month_bounds(month)
+        key = f'{shop_id}/{month:%Y-%m}'
+        manifest = copy.deepcopy(self.load_manifest())
+        entry = manifest['months'].get(key) or {
+            'shop_id': shop_id,
+            'month': f'{month:%Y-%m}',
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'parts': [],
+        }
+        archived = set()
+        if entry['parts']:
+            archived = set(self.read('sales', [shop_id], start, end, columns=['id'])['id'])
+
+        sales = Sale.objects.filter(
+            shop_id=shop_id, status='completed', created_at__gte=start, created_at__lt=end
+        ).order_by('created_at', 'id')
+
+        directory = os.path.join(self.root, f'shop={shop_id}', f'month={month:%Y-%m}')
+        os.makedirs(directory, exist_ok=True)
+        part = uuid7().hex
+        names = {
+            kind: os.path.join(directory, f'{kind}-{part}.parquet')
+            for kind in ('sales', 'items', 'categories')
+        }
+        sale_schema, item_schema, category_schema = _schemas()
+
+        moved, revenue, item_count, categories = [], 0, 0, []
+        sale_writer = pq.ParquetWriter(names['sales'], sale_schema, compression='zstd')
+        item_writer = pq.ParquetWriter(names['items'], item_schema, compression='zstd')
+        try:
+            rows = sales.values(*SALE_FIELDS).iterator(chunk_size=batch_size)
+            while batch := list(islice(rows, batch_size)):
+                chunk = [
+                    {**row, 'id': str(row['id'])} for row in batch
+                    if str(row['id']) not in archived
+                ]
+                if not chunk:
+                    continue
+                items = [
+                    {**item, 'sale_id': str(item['sale_id'])}
+                    for item in SaleItem.objects.filter(sale_id__in=[row['id'] for row in chunk])
+                    .order_by('id')
+                    .values(
+                        'id', 'sale_id', 'product_id', 'quantity', 'unit_price', 'discount',
+                        'subtotal', 'created_at',
+                        product_name=F('product__name'), product_sku=F('product__sku'),
+                    )
+                ]
+                sale_writer.write_table(pa.Table.from_pylist(chunk, sale_schema))
+                item_writer.write_table(pa.Table.from_pylist(items, item_schema))
+                moved += [row['id'] for row in chunk]
+                revenue += sum(row['total_amount'] for row in chunk)
+                item_count += len(items)
+                categories = _category_rows(
+                    [(item['product_name'], item['quantity'], item['unit_price']) for item in items],
+                    categories
+                )
+        finally:
+            sale_writer.close()
+            item_writer.close()
+
+        if not moved:
+            for kind in ('sales', 'items'):
+                os.remove(names[kind])
+            return 0, 0
+        pq.write_table(
+            pa.Table.from_pylist(categories, category_schema), names['categories'], compression='zstd'
+        )
+
+        entry['parts'].append({
+            'sales': os.path.relpath(names['sales'], self.root),
+            'items': os.path.relpath(names['items'], self.root),
+            'categories': os.path.relpath(names['categories'], self.root),
+            'sales_count': len(moved),
+            'items_count': item_count,
+            'revenue': str(revenue),
+            'archived_at': timezone.now().isoformat(),
+        })
+        manifest['months'][key] = entry
+        self.save_manifest(manifest)
+
+        token = archiving.set(True)
+        try:
+            for offset in range(0, len(moved), batch_size):
+                with transaction.atomic():
+                    Sale.objects.filter(id__in=moved[offset:offset + batch_size]).delete()
+        finally:
+            archiving.reset(token)
+        return len(moved), item_count
+
+
+
+def archive_sales(months=None, shop_ids=None, batch_size=1000):
+    """Archive completed sales from before the last ``months`` calendar months.
+
+    Returns ``(sales, items)`` moved out of the database.
+    """
+    if months is None:
+        months = settings.SALE_ARCHIVE_AFTER_MONTHS
+    cutoff, _ = month_bounds(add_months(current_month(), -months))
+
+    pending = Sale.objects.filter(status='completed', created_at__lt=cutoff)
+    if shop_ids is not None:
+        pending = pending.filter(shop_id__in=shop_ids)
+    shop_months = (
+        pending.annotate(month=TruncMonth('created_at', tzinfo=dt_timezone.utc))
+        .values_list('shop_id', 'month')
+        .distinct()
+        .order_by('month', 'shop_id')
+    )
+
+    archive = SaleArchive()
+    sales = items = 0
+    for shop_id, month in shop_months:
+        moved = archive.archive_month(shop_id, month.date(), batch_size=batch_size)
+        sales += moved[0]
+        items += moved[1]
+    return sales, items
+
@@ -0,0 +1,230 @@
+# apps/sales/checkout.py
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.db.models import Case, When, Value, F, IntegerField
+from rest_framework import serializers
+
+from analytics.rollups import add_completed_sales
+from products.models import Product
+from products.sharding import take_from_shards
+from .models import Sale, SaleItem
+from .reservations import reserve_for_sale, record_sale_movements
+
+
+class BasketContext:
+    """A validated basket: the shop, its locked product rows and resolved lines.
+
+    Built once during validation and handed to ``CheckoutEngine.checkout``
+    so the products are never locked or read twice for the same sale.
+    """
+
+    def __init__(self, shop, products, lines):
+        self.shop = shop
+        self.products = products  # {product_id: Product}, locked FOR UPDATE
+        self.lines = lines  # [{'product_id', 'quantity', 'unit_price', 'discount', 'subtotal'}]
+
+    @property
+    def total_amount(self):
+        return sum((line['subtotal'] for line in self.lines), Decimal('0.00'))
+
+    @property
+    def quantities(self):
+        return CheckoutEngine.quantities_by_product(self.lines)
+
+
+class CheckoutEngine:
+    """Set-based checkout for a single basket.
+
+    The number of queries is fixed regardless of basket size:
+    one ordered ``SELECT ... FOR UPDATE`` for the products, one insert for
+    the sale, one conditional ``UPDATE`` for the stock, and one
+    ``bulk_create`` each for sale items and inventory movements (or stock
+    reservations, for a sale awaiting payment).
+    """
+
+    def __init__(self, shop, cashier):
+        self.shop = shop
+        self.cashier = cashier
+
+    def lock_products(self, product_ids):
+        """Lock all basket products in primary-key order.
+
+        Locking in a stable order means two tills selling overlapping
+        baskets can never deadlock on each other.
+        """
+        return self.load_for_sale(product_ids, shop=self.shop)
+
+    @staticmethod
+    def load_for_sale(product_ids, **filters):
+        """Lock regular products in id order and read sharded ones unlocked.
+
+        Sharded (hot) products are never locked as a whole: their stock is
+        taken from individual StockShard rows at checkout. The second
+        query only runs when the basket holds such a product.
+        """
+        product_ids = set(product_ids)
+        products = {
+            product.id: product
+            for product in Product.objects.select_for_update()
+            .filter(id__in=product_ids, stock_shards=0, **filters)
+            .order_by('id')
+        }
+        missing = product_ids - set(products)
+        if missing:
+            products.update(
+                (product.id, product)
+                for product in Product.objects.filter(
+                    id__in=missing, stock_shards__gt=0, **filters
+                ).prefetch_related('shards')
+            )
+        return products
+
+    @staticmethod
+    def quantities_by_product(items):
+        """Sum requested quantities per product (a basket may repeat a SKU)"""
+        quantities = OrderedDict()
+        for item in items:
+            product_id = int(item['product_id'])
+            quantities[product_id] = quantities.get(product_id, 0) + int(item['quantity'])
+        return quantities
+
+    def check_stock(self, items, products):
+        """Raise ValidationError if any line is missing or short on stock"""
+        for product_id, quantity in self.quantities_by_product(items).items():
+            product = products.get(product_id)
+            if product is None:
+                raise serializers.ValidationError(
+                    f"Product {product_id} not found in this shop"
+                )
+            if product.available_stock < quantity:
+                raise serializers.ValidationError(
+                    f"Insufficient stock for {product.name}. "
+                    f"Available: {product.available_stock}, Requested: {quantity}"
+                )
+
+    @staticmethod
+    def per_product(quantities):
+        """CASE expression mapping each product id to its quantity"""
+        return Case(
+            *[When(id=product_id, then=Value(qty)) for product_id, qty in quantities.items()],
+            output_field=IntegerField(),
+        )
+
+    @staticmethod
+    def split_sharded(quantities, products):
+        """Split quantities into (regular, sharded) by each product's stock mode"""
+        regular, sharded = OrderedDict(), OrderedDict()
+        for product_id, quantity in quantities.items():
+            target = sharded if products[product_id].is_sharded else regular
+            target[product_id] = quantity
+        return regular, sharded
+
+    @staticmethod
+    def deduct_stock(quantities):
+        """Decrement stock for every product in one conditional UPDATE"""
+        CheckoutEngine._update_available(quantities, current_stock=-1)
+
+    @staticmethod
+    def reserve_stock(quantities):
+        """Hold stock for a pending sale in one conditional UPDATE"""
+        CheckoutEngine._update_available(quantities, reserved_stock=1)
+
+    @staticmethod
+    def _update_available(quantities, **signs):
+        """Apply ``quantities`` to the given columns only where enough is available"""
+        if not quantities:
+            return
+        amount = CheckoutEngine.per_product(quantities)
+        updated = Product.objects.filter(
+            id__in=list(quantities),
+            current_stock__gte=F('reserved_stock') + amount,
+        ).update(**{
+            column: F(column) + amount if sign > 0 else F(column) - amount
+            for column, sign in signs.items()
+        })
+
+        if updated != len(quantities):
+            raise serializers.ValidationError(
+                "Insufficient stock for one or more products in this sale"
+            )
+
+    @staticmethod
+    def resolve_line(item):
+        """Normalise a raw basket line to typed values with its subtotal"""
+        quantity = int(item['quantity'])
+        unit_price = Decimal(str(item['unit_price']))
+        discount = Decimal(str(item.get('discount', 0) or 0))
+        return {
+            'product_id': int(item['product_id']),
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'discount': discount,
+            'subtotal': (unit_price * quantity) - discount,
+        }
+
+    def prepare(self, items):
+        """Lock and validate the basket, returning a BasketContext.
+
+        Must be called inside ``transaction.atomic``.
+        """
+        products = self.lock_products(item['product_id'] for item in items)
+        self.check_stock(items, products)
+        return BasketContext(
+            self.shop, products, [self.resolve_line(item) for item in items]
+        )
+
+    def checkout(self, basket, payment_method, status='pending', **sale_fields):
+        """Create the sale and its items, then deduct or reserve stock.
+
+        Completed sales deduct stock and record movements straight away;
+        pending sales only reserve it until the payment settles. Must be
+        called inside the same transaction that prepared ``basket``.
+        """
+        products = basket.products
+        quantities = basket.quantities
+
+        sale = Sale.objects.create(
+            shop=self.shop,
+            cashier=self.cashier,
+            total_amount=basket.total_amount,
+            payment_method=payment_method,
+            status=status,
+            **sale_fields
+        )
+
+        regular, sharded = self.split_sharded(quantities, products)
+        # Hot products always take from their shards; a pending sale's
+        # reservation hands the units back if the payment never arrives
+        take_from_shards(sharded)
+        if status == 'pending':
+            # Payment still outstanding: hold the stock until it is settled
+            self.reserve_stock(regular)
+            reserve_for_sale(sale, quantities)
+        else:
+            self.deduct_stock(regular)
+            record_sale_movements(sale, quantities, created_by=self.cashier)
+
+        SaleItem.objects.bulk_create([
+            SaleItem(
+                sale=sale,
+                product=products[line['product_id']],
+                quantity=line['quantity'],
+                unit_price=line['unit_price'],
+                discount=line['discount'],
+                subtotal=line['subtotal'],
+                created_at=sale.created_at,
+            )
+            for line in basket.lines
+        ])
+        if status == 'completed':
+            add_completed_sales([sale], {sale.id: sum(quantities.values())})
+
+        # Keep the in-memory rows in step with the database
+        for product_id, quantity in regular.items():
+            if status == 'pending':
+                products[product_id].reserved_stock += quantity
+            else:
+                products[product_id].current_stock -= quantity
+
+        return sale
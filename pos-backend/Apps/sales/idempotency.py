@@ -0,0 +1,60 @@
+# apps/sales/idempotency.py
+from datetime import timedelta
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+# Fields that identify a submission rather than describe the sale
+ENVELOPE_FIELDS = ('client_ref', 'idempotency_key', 'created_at')
+
+
+def get_idempotency_key(request):
+    """Key from the Idempotency-Key header, falling back to ``client_ref``"""
+    key = request.headers.get(IDEMPOTENCY_HEADER) or request.data.get('client_ref')
+    return str(key).strip()[:100] if key else None
+
+
+def request_fingerprint(data):
+    """Stable hash of a submission so a reused key with a new body is caught"""
+    payload = {k: v for k, v in dict(data).items() if k not in ENVELOPE_FIELDS}
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def claim_idempotency_key(user, key, fingerprint):
+    """Insert the key row in the current transaction.
+
+    Returns ``(record, created)``. A concurrent request with the same key
+    blocks on the unique index until the first one commits, then gets the
+    stored record back with ``created=False``.
+    """
+    now = timezone.now()
+    IdempotencyKey.objects.filter(user=user, key=key, expires_at__lte=now).delete()
+    
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                user=user,
+                key=key,
+                fingerprint=fingerprint,
+                expires_at=now + timedelta(seconds=settings.SALE_IDEMPOTENCY_KEY_TTL)
+            )
+        return record, True
+    except IntegrityError:
+        return IdempotencyKey.objects.get(user=user, key=key), False
+
+
+def store_response(record, response):
+    """Persist the response a retry with this key will receive"""
+    IdempotencyKey.objects.filter(id=record.id).update(
+        response_status=response.status_code,
+        response_body=response.data
+    )
@@ -0,0 +1,20 @@
+# apps/sales/management/commands/archive_sales.py
+from django.core.management.base import BaseCommand
+
+from sales.archive import archive_sales
+
+
+class Command(BaseCommand):
+    help = "Move completed sales older than N months into the Parquet archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=None,
+                            help='Keep this many calendar months (default SALE_ARCHIVE_AFTER_MONTHS)')
+        parser.add_argument('--shop', type=int, nargs='+', default=None, help='Only these shop ids')
+        parser.add_argument('--batch', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        sales, items = archive_sales(
+            months=options['months'], shop_ids=options['shop'], batch_size=options['batch']
+        )
+        self.stdout.write(self.style.SUCCESS(f"Archived {sales} sales and {items} sale items"))
@@ -0,0 +1,86 @@
+# apps/sales/management/commands/benchmark_receipts.py
+from io import BytesIO
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+import qrcode
+
+from sales.models import Sale, SaleItem
+from sales.receipt_generator import ReceiptGenerator
+
+
+class Command(BaseCommand):
+    help = "Time receipt rendering (PDF, ESC/POS) and compare PNG vs vector QR codes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sale', help='Sale id to render (default: latest completed sale)')
+        parser.add_argument('--count', type=int, default=200, help='Renders per measurement')
+
+    def handle(self, *args, **options):
+        sales = Sale.objects.filter(status='completed').select_related(
+            'shop', 'cashier'
+        ).prefetch_related(
+            Prefetch('items', queryset=SaleItem.objects.select_related('product'))
+        )
+        if options['sale']:
+            sales = sales.filter(id=options['sale'])
+        sale = sales.order_by('-created_at').first()
+        if sale is None:
+            raise CommandError("No completed sale to render; create one or pass --sale")
+
+        count = options['count']
+        generator = ReceiptGenerator(sale)
+
+        def page():
+            return canvas.Canvas(BytesIO(), pagesize=(generator.width, generator.height))
+
+        def png_qr():
+            # The previous approach: PIL image -> PNG bytes -> ImageReader
+            qr = qrcode.QRCode(version=1, box_size=2, border=1)
+            qr.add_data(f"{settings.SITE_URL}/receipts/{sale.id}")
+            qr.make(fit=True)
+            buffer = BytesIO()
+            qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+            buffer.seek(0)
+            page().drawImage(ImageReader(buffer), 0, 0, width=57, height=57)
+
+        cases = [
+            ('receipt pdf', lambda: ReceiptGenerator(sale).generate_pdf()),
+            ('receipt escpos', lambda: ReceiptGenerator(sale).generate_escpos()),
+            ('qr png image', png_qr),
+            ('qr vector', lambda: generator._draw_qr_code(page(), generator.height)),
+        ]
+        for label, render in cases:
+            elapsed, peak = self.measure(render, count)
+            self.stdout.write(
+                f"{label:>15}: {elapsed / count * 1000:.3f} ms each, "
+                f"peak {peak / 1024:.0f} KiB over {count} runs"
+            )
+
+        started = time.perf_counter()
+        combined = ReceiptGenerator.generate_combined_pdf([sale] * count).getbuffer().nbytes
+        single = len(ReceiptGenerator(sale).generate_pdf().getvalue())
+        self.stdout.write(
+            f"{count} receipts in one PDF: {time.perf_counter() - started:.2f}s, "
+            f"{combined / count:.0f} bytes per receipt (single PDF: {single} bytes)"
+        )
+
+    def measure(self, render, count):
+        """Wall time without tracing, then peak traced allocation"""
+        render()  # warm up fonts and imports
+        started = time.perf_counter()
+        for _ in range(count):
+            render()
+        elapsed = time.perf_counter() - started
+
+        tracemalloc.start()
+        for _ in range(count):
+            render()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return elapsed, peak
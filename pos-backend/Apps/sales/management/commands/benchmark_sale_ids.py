@@ -0,0 +1,80 @@
+# apps/sales/management/commands/benchmark_sale_ids.py
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from sales.ids import uuid7
+
+GENERATORS = {
+    'uuid4': uuid.uuid4,
+    'uuid7': uuid7,
+}
+
+
+class Command(BaseCommand):
+    help = "Compare insert throughput and index size for random vs time-ordered sale ids"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000)
+        parser.add_argument('--batch', type=int, default=10_000)
+        parser.add_argument('--ids', nargs='+', choices=list(GENERATORS), default=list(GENERATORS))
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stderr.write(self.style.WARNING(
+                "Index sizes are only reported on Postgres; throughput elsewhere is indicative"
+            ))
+
+        for name in options['ids']:
+            elapsed, sizes = self.run(name, options['rows'], options['batch'])
+            self.stdout.write(
+                f"{name}: {options['rows'] / elapsed:,.0f} rows/s "
+                f"({elapsed:.1f}s for {options['rows']:,} rows)"
+                + ''.join(f", {index} {size / 2**20:,.1f} MiB" for index, size in sizes.items())
+            )
+
+    def run(self, name, rows, batch):
+        """Insert ``rows`` sales-like rows plus one item row each, in batches.
+
+        The item table has an index on its sale id, like
+        ``sales_saleitem.sale_id`` and ``loyalty_loyaltytransaction.sale_id``.
+        """
+        sale_table, item_table = f'bench_{name}_sale', f'bench_{name}_item'
+        generate = GENERATORS[name]
+        adapt = (lambda value: value) if connection.vendor == 'postgresql' else (lambda value: value.hex)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {item_table}')
+            cursor.execute(f'DROP TABLE IF EXISTS {sale_table}')
+            cursor.execute(
+                f'CREATE TABLE {sale_table} (id uuid PRIMARY KEY, total numeric(10, 2) NOT NULL)'
+            )
+            cursor.execute(f'CREATE TABLE {item_table} (sale_id uuid NOT NULL, quantity integer NOT NULL)')
+            cursor.execute(f'CREATE INDEX {item_table}_sale_id ON {item_table} (sale_id)')
+
+        try:
+            started = time.perf_counter()
+            for offset in range(0, rows, batch):
+                ids = [adapt(generate()) for _ in range(min(batch, rows - offset))]
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.executemany(
+                        f'INSERT INTO {sale_table} (id, total) VALUES (%s, 10.00)', [(i,) for i in ids]
+                    )
+                    cursor.executemany(
+                        f'INSERT INTO {item_table} (sale_id, quantity) VALUES (%s, 1)', [(i,) for i in ids]
+                    )
+            elapsed = time.perf_counter() - started
+
+            sizes = {}
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    for index in (f'{sale_table}_pkey', f'{item_table}_sale_id'):
+                        cursor.execute('SELECT pg_relation_size(%s::regclass)', [index])
+                        sizes[index] = cursor.fetchone()[0]
+            return elapsed, sizes
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS {item_table}')
+                cursor.execute(f'DROP TABLE IF EXISTS {sale_table}')
@@ -0,0 +1,88 @@
+# apps/sales/management/commands/partitions.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from sales.partitions import (
+    partitioned_models, is_partitioned, list_partitions, convert_to_partitioned,
+    ensure_partitions, detach_expired,
+)
+
+
+class Command(BaseCommand):
+    help = "Manage monthly partitions of sales, sale items and inventory movements (Postgres)"
+
+    def add_arguments(self, parser):
+        actions = parser.add_subparsers(dest='action', required=True)
+
+        actions.add_parser('status', help='List partitioned tables and their partitions')
+
+        convert = actions.add_parser(
+            'convert', help='Partition the tables in place (locks them; run in a maintenance window)'
+        )
+        convert.add_argument('--ahead', type=int, default=None, help='Months to create ahead')
+
+        create = actions.add_parser('create', help='Pre-create upcoming monthly partitions')
+        create.add_argument('--ahead', type=int, default=None, help='Months to create ahead')
+
+        detach = actions.add_parser('detach', help='Detach months older than the retention window')
+        detach.add_argument('--keep', type=int, required=True,
+                            help='Months to keep before the current one')
+        detach.add_argument('--archive-schema', default=None,
+                            help='Move detached tables into this schema')
+        detach.add_argument('--drop', action='store_true', help='Drop detached tables')
+        detach.add_argument('--concurrently', action='store_true',
+                            help='DETACH ... CONCURRENTLY (Postgres 14+)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Table partitioning needs PostgreSQL")
+
+        try:
+            getattr(self, options['action'])(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+    def status(self, options):
+        for model in partitioned_models():
+            table = model._meta.db_table
+            if not is_partitioned(table):
+                self.stdout.write(f"{table}: not partitioned")
+                continue
+            self.stdout.write(f"{table}:")
+            for name, upper in list_partitions(table).items():
+                self.stdout.write(f"  {name} (before {upper or 'MAXVALUE'})")
+
+    def convert(self, options):
+        for model in partitioned_models():
+            table = model._meta.db_table
+            if is_partitioned(table):
+                self.stdout.write(f"{table}: already partitioned")
+                continue
+            created = convert_to_partitioned(model, months_ahead=options['ahead'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{table}: partitioned, existing rows in {table}_history, "
+                f"{len(created)} monthly partitions created"
+            ))
+
+    def create(self, options):
+        created = ensure_partitions(months_ahead=options['ahead'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(created)} partitions" + (f": {', '.join(created)}" if created else '')
+        ))
+
+    def detach(self, options):
+        if options['drop'] and options['archive_schema']:
+            raise CommandError("Use either --drop or --archive-schema")
+
+        detached = detach_expired(
+            options['keep'],
+            archive_schema=options['archive_schema'],
+            drop=options['drop'],
+            concurrently=options['concurrently'],
+        )
+        outcome = 'dropped' if options['drop'] else (
+            f"moved to {options['archive_schema']}" if options['archive_schema'] else 'detached'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(detached)} partitions {outcome}" + (f": {', '.join(detached)}" if detached else '')
+        ))
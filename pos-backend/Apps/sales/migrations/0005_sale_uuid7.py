@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:46
+
+import sales.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0004_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sale',
+            name='id',
+            field=models.UUIDField(default=sales.ids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
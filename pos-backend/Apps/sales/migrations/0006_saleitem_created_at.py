@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0005_sale_uuid7'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saleitem',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        # Existing items take their sale's timestamp
+        migrations.RunSQL(
+            'UPDATE sales_saleitem SET created_at = ('
+            'SELECT created_at FROM sales_sale WHERE sales_sale.id = sales_saleitem.sale_id)',
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -1,9 +1,12 @@
 # apps/sales/models.py
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from decimal import Decimal
-import uuid
+from .ids import uuid7
 
 
 class Sale(models.Model):
@@ -22,7 +25,7 @@ class Sale(models.Model):
         ('card', 'Card'),
     )
     
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     shop = models.ForeignKey(
         'shops.Shop',
         on_delete=models.CASCADE,
@@ -66,9 +69,40 @@ class Sale(models.Model):
     def __str__(self):
         return f"Sale {self.id} - {self.shop.name} - {self.total_amount}"
     
+    @property
+    def receipt_number(self):
+        """Short receipt number printed on receipts (8 hex characters).
+
+        Older random (v4) ids keep their leading characters. Time-ordered
+        (v7) ids start with the timestamp, shared by every sale in the
+        same minute, so their random tail is used instead.
+        """
+        if self.id.version == 7:
+            return self.id.hex[-8:]
+        return str(self.id)[:8]
+    
     @property
     def items_count(self):
+        # Set by an ``items_count`` annotation on list querysets
+        if '_items_count' in self.__dict__:
+            return self._items_count
         return self.items.count()
+    
+    @items_count.setter
+    def items_count(self, value):
+        self._items_count = value
+    
+    @staticmethod
+    def items_count_subquery():
+        """Correlated count of a sale's items, for ``annotate(items_count=...)``"""
+        counts = (
+            SaleItem.objects.filter(sale=models.OuterRef('pk'))
+            .order_by()
+            .values('sale')
+            .annotate(count=models.Count('id'))
+            .values('count')
+        )
+        return Coalesce(models.Subquery(counts), 0)
 
 
 class SaleItem(models.Model):
@@ -93,6 +127,8 @@ class SaleItem(models.Model):
         validators=[MinValueValidator(Decimal('0.00'))]
     )
     subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    # The sale's timestamp, so items are partitioned and pruned by the same window
+    created_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         ordering = ['id']
@@ -103,4 +139,80 @@ class SaleItem(models.Model):
     def save(self, *args, **kwargs):
         # Auto-calculate subtotal
         self.subtotal = (self.unit_price * self.quantity) - self.discount
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+
+class IdempotencyKey(models.Model):
+    """Stored outcome of a sale submission keyed by a client-generated key.
+
+    Terminals on flaky links retry POSTs; a retry carrying the same key is
+    answered from here instead of running the checkout again.
+    """
+    
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='idempotency_keys'
+    )
+    key = models.CharField(max_length=100)
+    fingerprint = models.CharField(max_length=64)  # SHA-256 of the request body
+    sale = models.ForeignKey(
+        Sale,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='idempotency_keys'
+    )
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        unique_together = [['user', 'key']]
+    
+    def __str__(self):
+        return f"{self.key} ({self.user_id})"
+
+
+class StockReservation(models.Model):
+    """Stock held for a pending card/mobile-money sale until it is paid.
+
+    Active reservations are mirrored in ``Product.reserved_stock`` so
+    available-to-sell is a column read, not an aggregate per request.
+    """
+    
+    STATUS_ACTIVE = 'active'
+    STATUS_CONVERTED = 'converted'
+    STATUS_RELEASED = 'released'
+    
+    STATUS_CHOICES = (
+        (STATUS_ACTIVE, 'Active'),
+        (STATUS_CONVERTED, 'Converted'),
+        (STATUS_RELEASED, 'Released'),
+    )
+    
+    sale = models.ForeignKey(
+        Sale,
+        on_delete=models.CASCADE,
+        related_name='reservations'
+    )
+    product = models.ForeignKey(
+        'products.Product',
+        on_delete=models.CASCADE,
+        related_name='reservations'
+    )
+    quantity = models.IntegerField(validators=[MinValueValidator(1)])
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+            models.Index(fields=['sale', 'status']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} x {self.quantity} for {self.sale_id} ({self.status})"
@@ -0,0 +1,361 @@
+# apps/sales/partitions.py
+"""Monthly range partitioning of the append-only sales tables (Postgres only).
+
+``sales_sale``, ``sales_saleitem`` and ``products_inventorymovement`` can
+be converted in place to tables ``PARTITION BY RANGE (created_at)`` with
+one partition per UTC month. The rows that exist at conversion time stay
+where they are as a single ``<table>_history`` partition, so converting
+does not copy data. Date-window filters (``shops.dates.window_q``) compare
+the bare ``created_at`` column, which lets the planner prune partitions.
+
+Retention is a ``DETACH PARTITION`` of whole months, taken from all three
+tables together; the detached tables are dropped or moved to an archive
+schema instead of being emptied with ``DELETE``. Rows of other tables that
+point at the detached rows are first deleted or nulled as their foreign
+key's ``on_delete`` says, as Django would when deleting the sales.
+"""
+from datetime import date, datetime, time, timezone as dt_timezone
+import re
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.backends.utils import truncate_name
+from django.utils import timezone
+
+# Partitioned and detached together, so a month's sales, items and
+# movements are always all present or all archived
+PARTITIONED_MODELS = ['sales.Sale', 'sales.SaleItem', 'products.InventoryMovement']
+
+UPPER_BOUND_RE = re.compile(r"TO \('([^']+)'\)")
+PARTITION_KEY_RE = re.compile(r'\bcreated_at\b')
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def current_month():
+    """First day of the current UTC month"""
+    return timezone.now().date().replace(day=1)
+
+
+def month_bound(month):
+    """SQL literal for the first instant (UTC) of a month"""
+    return f"'{month:%Y-%m-%d} 00:00:00+00'"
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y_%m}'
+
+
+def partitioned_models():
+    return [apps.get_model(label) for label in PARTITIONED_MODELS]
+
+
+def expired_partitions(partitions, before):
+    """Names of partitions holding only rows older than ``before``.
+
+    ``partitions`` maps names to their exclusive upper bound (None for an
+    open-ended partition, which never expires).
+    """
+    return [
+        name for name, upper in partitions.items()
+        if upper is not None and upper <= before
+    ]
+
+
+def with_partition_key(definition):
+    """A unique index or constraint definition extended to include ``created_at``.
+
+    Partitioned tables only enforce uniqueness that includes the partition
+    key, so ``UNIQUE (paystack_reference)`` becomes
+    ``UNIQUE (paystack_reference, created_at)``.
+    """
+    head, where, predicate = definition.partition(' WHERE ')
+    if ' INCLUDE (' in head or not head.endswith(')'):
+        raise ValueError(f"Cannot add the partition key to: {definition}")
+    if PARTITION_KEY_RE.search(head):
+        return definition
+    return f'{head[:-1]}, created_at){where}{predicate}'
+
+
+def release_references(model, before):
+    """Apply ``on_delete`` to rows of other tables referencing ``model`` rows before ``before``.
+
+    Detaching or dropping a partition removes rows without Django's
+    delete collector, and converted tables have no incoming foreign keys
+    left to stop it, so referencing rows would be orphaned. CASCADE
+    relations are deleted (through the ORM, so their own relations are
+    handled too), SET_NULL ones nulled; anything else refuses.
+    """
+    partitioned = set(partitioned_models())
+    leaving = model._base_manager.filter(created_at__lt=before).values('pk')
+    released = 0
+    for relation in model._meta.related_objects:
+        # Partitioned tables leave together, month by month
+        if relation.related_model in partitioned:
+            continue
+        field = relation.field.name
+        referencing = relation.related_model._base_manager.filter(**{f'{field}__in': leaving})
+        if relation.on_delete is models.CASCADE:
+            released += referencing.delete()[0]
+        elif relation.on_delete is models.SET_NULL:
+            released += referencing.update(**{field: None})
+        elif referencing.exists():
+            raise ValueError(
+                f"{relation.related_model._meta.db_table} rows still reference "
+                f"{model._meta.db_table} rows from before {before:%Y-%m-%d}"
+            )
+    return released
+
+
+def _check_postgres():
+    if connection.vendor != 'postgresql':
+        raise ValueError("Table partitioning needs PostgreSQL")
+
+
+def is_partitioned(table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))',
+            [table]
+        )
+        return cursor.fetchone()[0]
+
+
+def list_partitions(table):
+    """``{name: upper bound}`` for a partitioned table, oldest first"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) '
+            'FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass',
+            [table]
+        )
+        rows = cursor.fetchall()
+
+    partitions = {}
+    for name, bound in rows:
+        match = UPPER_BOUND_RE.search(bound)
+        partitions[name] = datetime.fromisoformat(match.group(1)) if match else None
+    return dict(sorted(partitions.items(), key=lambda item: (item[1] is None, item[1] or 0)))
+
+
+def create_partitions(table, first_month, last_month):
+    """Create the missing monthly partitions first_month..last_month"""
+    qn = connection.ops.quote_name
+    created = []
+    month = first_month
+    with connection.cursor() as cursor:
+        while month <= last_month:
+            name = partition_name(table, month)
+            cursor.execute('SELECT to_regclass(%s) IS NULL', [name])
+            if cursor.fetchone()[0]:
+                cursor.execute(
+                    f'CREATE TABLE {qn(name)} PARTITION OF {qn(table)} FOR VALUES '
+                    f'FROM ({month_bound(month)}) TO ({month_bound(add_months(month, 1))})'
+                )
+                created.append(name)
+            month = add_months(month, 1)
+    return created
+
+
+def ensure_partitions(months_ahead=None):
+    """Pre-create partitions up to ``months_ahead`` months past the current one.
+
+    A no-op on other databases and for tables that were never converted.
+    """
+    if connection.vendor != 'postgresql':
+        return []
+    if months_ahead is None:
+        months_ahead = settings.SALE_PARTITION_MONTHS_AHEAD
+
+    first = current_month()
+    created = []
+    for model in partitioned_models():
+        table = model._meta.db_table
+        if is_partitioned(table):
+            created += create_partitions(table, first, add_months(first, months_ahead))
+    return created
+
+
+def convert_to_partitioned(model, months_ahead=None):
+    """Turn a model's table into a monthly partitioned table in one transaction.
+
+    The existing table becomes the ``<table>_history`` partition for
+    everything before the current month. Partitioned tables can only
+    enforce keys that include ``created_at``, so:
+
+    * the primary key becomes ``(id, created_at)``;
+    * other unique constraints and indexes also get ``created_at``
+      (``with_partition_key``). A value such as ``paystack_reference``
+      is then only unique per timestamp, so the application has to keep
+      it unique (the payment outbox checks before recording one);
+    * foreign keys pointing *at* the table are dropped. ORM deletes still
+      cascade, but nothing in the database stops orphaned references:
+      ``detach_expired`` releases them (``release_references``) before
+      partitions leave.
+
+    The table is locked for the duration; run it in a maintenance window.
+    """
+    _check_postgres()
+    if months_ahead is None:
+        months_ahead = settings.SALE_PARTITION_MONTHS_AHEAD
+
+    qn = connection.ops.quote_name
+    table = model._meta.db_table
+    history = f'{table}_history'
+    cutoff = current_month()
+
+    if is_partitioned(table):
+        raise ValueError(f"{table} is already partitioned")
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE')
+
+        cursor.execute(
+            "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+            "WHERE confrelid = %s::regclass AND contype = 'f' AND conparentid = 0",
+            [table]
+        )
+        for referencing, name in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {referencing} DROP CONSTRAINT {qn(name)}')
+
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [table]
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'",
+            [table]
+        )
+        primary_key = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'u'",
+            [table]
+        )
+        unique_constraints = cursor.fetchall()
+        cursor.execute(
+            'SELECT indexname, indexdef FROM pg_indexes '
+            'WHERE schemaname = current_schema() AND tablename = %s',
+            [table]
+        )
+        indexes = cursor.fetchall()
+
+        # Free the table and index names for the partitioned parent, so
+        # later migrations still find them
+        cursor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(history)}')
+        for name, _ in indexes:
+            renamed = truncate_name(f'{name}_history', connection.ops.max_name_length())
+            cursor.execute(f'ALTER INDEX {qn(name)} RENAME TO {qn(renamed)}')
+
+        cursor.execute(
+            f'CREATE TABLE {qn(table)} (LIKE {qn(history)} INCLUDING DEFAULTS '
+            f'INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS) '
+            f'PARTITION BY RANGE (created_at)'
+        )
+        cursor.execute(
+            f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(primary_key)} PRIMARY KEY (id, created_at)'
+        )
+        for name, definition in unique_constraints:
+            cursor.execute(
+                f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {with_partition_key(definition)}'
+            )
+        constraint_names = {primary_key} | {name for name, _ in unique_constraints}
+        for name, definition in indexes:
+            if name in constraint_names:
+                continue
+            if definition.startswith('CREATE UNIQUE INDEX'):
+                definition = with_partition_key(definition)
+            # indexdef names the original table, which is now the parent
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}')
+
+        if isinstance(model._meta.pk, models.AutoField):
+            _move_id_sequence(cursor, table, history)
+
+        # A validated CHECK lets ATTACH skip scanning the history rows
+        check = truncate_name(f'{history}_range', connection.ops.max_name_length())
+        cursor.execute(
+            f'ALTER TABLE {qn(history)} ADD CONSTRAINT {qn(check)} '
+            f'CHECK (created_at < {month_bound(cutoff)}) NOT VALID'
+        )
+        cursor.execute(f'ALTER TABLE {qn(history)} VALIDATE CONSTRAINT {qn(check)}')
+        cursor.execute(
+            f'ALTER TABLE {qn(table)} ATTACH PARTITION {qn(history)} '
+            f'FOR VALUES FROM (MINVALUE) TO ({month_bound(cutoff)})'
+        )
+        cursor.execute(f'ALTER TABLE {qn(history)} DROP CONSTRAINT {qn(check)}')
+
+        return create_partitions(table, cutoff, add_months(cutoff, months_ahead))
+
+
+def _move_id_sequence(cursor, table, history):
+    """Hand the id sequence (identity or serial) from the history table to the parent"""
+    qn = connection.ops.quote_name
+    cursor.execute(
+        "SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'",
+        [history]
+    )
+    if cursor.fetchone()[0]:
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {qn(history)}')
+        start = cursor.fetchone()[0]
+        # Partitions may not carry their own identity; this drops its sequence
+        cursor.execute(f'ALTER TABLE {qn(history)} ALTER COLUMN id DROP IDENTITY')
+        sequence = qn(f'{table}_id_seq')
+        cursor.execute(f'CREATE SEQUENCE {sequence} START WITH {start} OWNED BY {qn(table)}.id')
+    else:
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [history])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f'ALTER TABLE {qn(history)} ALTER COLUMN id DROP DEFAULT')
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {qn(table)}.id')
+    cursor.execute(
+        f"ALTER TABLE {qn(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}'::regclass)"
+    )
+
+
+def detach_expired(keep_months, archive_schema=None, drop=False, concurrently=False):
+    """Detach every partition older than the last ``keep_months`` months.
+
+    Detached tables are left standalone, moved into ``archive_schema`` or
+    dropped. Either way their rows leave the application, so references
+    to them from other tables are released first (``release_references``).
+    ``concurrently`` (Postgres 14+) avoids blocking queries on the parent
+    but must run outside a transaction.
+    """
+    _check_postgres()
+    qn = connection.ops.quote_name
+    before = datetime.combine(
+        add_months(current_month(), -keep_months), time.min, tzinfo=dt_timezone.utc
+    )
+
+    detached = []
+    with connection.cursor() as cursor:
+        if archive_schema and not drop:
+            cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {qn(archive_schema)}')
+        for model in partitioned_models():
+            table = model._meta.db_table
+            if not is_partitioned(table):
+                continue
+            partitions = list_partitions(table)
+            expired = expired_partitions(partitions, before)
+            if expired:
+                # Partitions are contiguous: the expired ones hold every row before this
+                release_references(model, max(partitions[name] for name in expired))
+            for name in expired:
+                cursor.execute(
+                    f'ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}'
+                    + (' CONCURRENTLY' if concurrently else '')
+                )
+                if drop:
+                    cursor.execute(f'DROP TABLE {qn(name)}')
+                elif archive_schema:
+                    cursor.execute(f'ALTER TABLE {qn(name)} SET SCHEMA {qn(archive_schema)}')
+                detached.append(name)
+    return detached
@@ -0,0 +1,145 @@
+# apps/sales/receipt_cache.py
+from datetime import timedelta
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import SaleItem
+from .receipt_generator import ReceiptGenerator
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class ReceiptCache:
+    """Rendered receipt PDFs under content-addressed names.
+
+    The name hashes everything the PDF is drawn from (the sale and its
+    last change, the shop header and the layout version), so an edited
+    sale or shop simply misses and re-renders. Storage is any Django
+    storage backend, configured by ``RECEIPT_CACHE_STORAGE``.
+    """
+
+    def __init__(self, storage=None):
+        self.storage = storage or storages.create_storage(settings.RECEIPT_CACHE_STORAGE)
+
+    @staticmethod
+    def digest(sale):
+        parts = [
+            str(sale.id),
+            sale.updated_at.isoformat(),
+            sale.shop.updated_at.isoformat(),
+            str(ReceiptGenerator.LAYOUT_VERSION),
+        ]
+        return hashlib.sha256('|'.join(parts).encode()).hexdigest()[:32]
+
+    @staticmethod
+    def name(sale, digest):
+        return f'{sale.id}/{digest}.pdf'
+
+    def get_or_render(self, sale):
+        """Return ``(pdf_bytes, digest)``; a hit is a single file read"""
+        digest = self.digest(sale)
+        name = self.name(sale, digest)
+        try:
+            with self.storage.open(name, 'rb') as f:
+                return f.read(), digest
+        except FileNotFoundError:
+            pass
+
+        prefetch_related_objects(
+            [sale], Prefetch('items', queryset=SaleItem.objects.select_related('product'))
+        )
+        pdf = ReceiptGenerator(sale).generate_pdf().getvalue()
+        # A concurrent render may have stored it first; the bytes are identical
+        if not self.storage.exists(name):
+            self.storage.save(name, ContentFile(pdf))
+        return pdf, digest
+
+    def invalidate(self, sale):
+        """Delete every cached rendering of a sale"""
+        try:
+            _, files = self.storage.listdir(str(sale.id))
+        except FileNotFoundError:
+            return 0
+        for filename in files:
+            self.storage.delete(f'{sale.id}/{filename}')
+        return len(files)
+
+    def sweep(self, max_age):
+        """Delete renderings stored more than ``max_age`` seconds ago"""
+        cutoff = timezone.now() - timedelta(seconds=max_age)
+        deleted = 0
+        sale_dirs, _ = self.storage.listdir('')
+        for sale_dir in sale_dirs:
+            _, files = self.storage.listdir(sale_dir)
+            for filename in files:
+                name = f'{sale_dir}/{filename}'
+                if self.storage.get_modified_time(name) < cutoff:
+                    self.storage.delete(name)
+                    deleted += 1
+        return deleted
+
+
+def _parse_range(header, size):
+    """``(start, end)`` for a single byte range, None to ignore it, False if unsatisfiable"""
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # Malformed or multi-range requests get the whole body
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def receipt_response(request, content, digest, last_modified, filename,
+                     content_type='application/pdf'):
+    """Serve receipt bytes with validators and single-range support"""
+    etag = quote_etag(digest)
+    timestamp = int(last_modified.timestamp())
+
+    # 304 for If-None-Match / If-Modified-Since, 412 for failed preconditions
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        return response
+
+    status_code, body = 200, content
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    byte_range = None
+    if range_header and (not if_range or if_range == etag):
+        byte_range = _parse_range(range_header, len(content))
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{len(content)}'
+        return response
+    if byte_range:
+        start, end = byte_range
+        status_code, body = 206, content[start:end + 1]
+
+    response = HttpResponse(body, content_type=content_type, status=status_code)
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{len(content)}'
+    response['Content-Length'] = len(body)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(timestamp)
+    response['Cache-Control'] = 'private, no-cache'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,132 @@
+# apps/sales/receipt_export.py
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import zipfile
+
+import django
+from django.conf import settings
+from django.core import signing
+from django.db.models import Prefetch
+from django.utils.text import slugify
+
+from shops.dates import shop_zone, window_q
+from .models import Sale, SaleItem
+from .receipt_generator import ReceiptGenerator
+
+
+def render_receipt_pdf(sale):
+    """Process-pool worker: PDF bytes for a sale loaded with its items"""
+    return ReceiptGenerator(sale).generate_pdf().getvalue()
+
+
+DOWNLOAD_SALT = 'sales.receipt-export'
+
+
+def download_token(user_id, shop_id, name):
+    """Signed, timestamped token for one user's download of a stored export"""
+    return signing.dumps({'user': user_id, 'shop': shop_id, 'name': name}, salt=DOWNLOAD_SALT)
+
+
+def read_download_token(token):
+    """The token's payload; raises ``signing.BadSignature`` (or ``SignatureExpired``)"""
+    return signing.loads(token, salt=DOWNLOAD_SALT, max_age=settings.RECEIPT_EXPORT_LINK_MAX_AGE)
+
+
+class _ZipStream:
+    """Write-only file object for ZipFile whose bytes are drained per entry.
+
+    It reports a position but cannot seek, so ZipFile writes sizes in
+    data descriptors after each entry instead of patching headers later.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ReceiptExporter:
+    """ZIP of every completed sale receipt for a shop and local date range.
+
+    Sales are read with ``iterator()`` one chunk at a time (items
+    prefetched per chunk), each chunk is rendered in a process pool, and
+    ZIP bytes are yielded as each entry is written. Memory is bounded by
+    one chunk of PDFs whatever the size of the range.
+    """
+
+    def __init__(self, shop, first_day, last_day, chunk_size=None, workers=None):
+        self.shop = shop
+        self.first_day = first_day
+        self.last_day = last_day
+        self.zone = shop_zone(shop)
+        self.chunk_size = chunk_size or settings.RECEIPT_EXPORT_CHUNK_SIZE
+        self.workers = settings.RECEIPT_EXPORT_WORKERS if workers is None else workers
+
+    def get_queryset(self):
+        return (
+            Sale.objects.filter(
+                window_q(self.first_day, self.last_day, self.zone),
+                shop=self.shop,
+                status='completed'
+            )
+            .select_related('shop', 'cashier')
+            .prefetch_related(
+                Prefetch('items', queryset=SaleItem.objects.select_related('product'))
+            )
+            .order_by('created_at', 'id')
+        )
+
+    @property
+    def filename(self):
+        return f'receipts_{slugify(self.shop.name)}_{self.first_day}_{self.last_day}.zip'
+
+    def entry(self, sale):
+        """ZipInfo filed under the sale's local date and stamped with its local time"""
+        local = sale.created_at.astimezone(self.zone)
+        info = zipfile.ZipInfo(
+            f'{local:%Y-%m-%d}/receipt_{sale.id}.pdf', date_time=local.timetuple()[:6]
+        )
+        info.compress_type = zipfile.ZIP_DEFLATED
+        return info
+
+    def chunks(self):
+        sales = self.get_queryset().iterator(chunk_size=self.chunk_size)
+        while True:
+            chunk = list(islice(sales, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def stream(self):
+        """Yield the archive in pieces, one per receipt plus the central directory"""
+        out = _ZipStream()
+        executor = None
+        if self.workers > 1:
+            # django.setup makes spawned/forkserver workers able to unpickle sales
+            executor = ProcessPoolExecutor(self.workers, initializer=django.setup)
+        try:
+            with zipfile.ZipFile(out, 'w') as archive:
+                for chunk in self.chunks():
+                    render = executor.map if executor else map
+                    for sale, pdf in zip(chunk, render(render_receipt_pdf, chunk)):
+                        archive.writestr(self.entry(sale), pdf)
+                        yield out.drain()
+            yield out.drain()
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
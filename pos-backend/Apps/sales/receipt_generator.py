@@ -2,26 +2,72 @@ from io import BytesIO
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.units import mm
 from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
 from django.conf import settings
 import qrcode
 
+# ESC/POS command prefixes
+ESC = b'\x1b'
+GS = b'\x1d'
+
 
 class ReceiptGenerator:
     """Generate printable receipts for sales"""
     
+    # Bump whenever the drawing code changes so cached PDFs are re-rendered
+    LAYOUT_VERSION = 2
+    
+    # Characters per line in ESC/POS font A on 80mm paper
+    ESCPOS_COLUMNS = 48
+    
+    PAYMENT_METHODS = {
+        'cash': 'Cash',
+        'card': 'Card',
+        'mobile_money': 'Mobile Money'
+    }
+    
     def __init__(self, sale):
         self.sale = sale
         self.width = 80 * mm  # 80mm thermal printer
         self.height = 297 * mm  # A4 height
     
+    @property
+    def verification_url(self):
+        return f"{settings.SITE_URL}/receipts/{self.sale.id}"
+    
     def generate_pdf(self):
         """Generate PDF receipt"""
         buffer = BytesIO()
         
         # Create canvas
         c = canvas.Canvas(buffer, pagesize=(self.width, self.height))
+        self.draw(c)
+        
+        # Save PDF
+        c.save()
+        
+        buffer.seek(0)
+        return buffer
+    
+    @classmethod
+    def generate_combined_pdf(cls, sales):
+        """One PDF with a page per sale; each shop header is embedded once"""
+        buffer = BytesIO()
+        c = None
         
+        for sale in sales:
+            generator = cls(sale)
+            if c is None:
+                c = canvas.Canvas(buffer, pagesize=(generator.width, generator.height))
+            generator.draw(c)
+            c.showPage()
+        
+        if c is not None:
+            c.save()
+        buffer.seek(0)
+        return buffer
+    
+    def draw(self, c):
+        """Draw the receipt on the current page of ``c``"""
         # Starting position
         y = self.height - 10 * mm
         
@@ -45,16 +91,33 @@ class ReceiptGenerator:
         
         # Footer
         self._draw_footer(c, y)
-        
-        # Save PDF
-        c.save()
-        
-        buffer.seek(0)
-        return buffer
+    
+    def _place_form(self, c, name, y, height, draw):
+        """Draw a form XObject with its top edge at ``y``, defining it on first use.
+
+        Forms are written to the document once and referenced by every page
+        that uses them, so receipts sharing a shop share one header.
+        """
+        if not c.hasForm(name):
+            # Room above the top baseline for the ascenders of the first line
+            c.beginForm(name, lowerx=0, lowery=-height, upperx=self.width, uppery=10 * mm)
+            draw(c, 0)
+            c.endForm()
+        
+        c.saveState()
+        c.translate(0, y)
+        c.doForm(name)
+        c.restoreState()
+        return y - height
     
     def _draw_header(self, c, y):
         """Draw shop header"""
         shop = self.sale.shop
+        height = (23 if shop.email else 19) * mm
+        return self._place_form(c, f'header-{shop.id}', y, height, self._draw_header_lines)
+    
+    def _draw_header_lines(self, c, y):
+        shop = self.sale.shop
         
         # Shop name (bold, larger)
         c.setFont("Helvetica-Bold", 14)
@@ -86,7 +149,7 @@ class ReceiptGenerator:
         
         # Receipt number
         c.drawString(5 * mm, y, "Receipt #:")
-        c.drawRightString(self.width - 5 * mm, y, str(self.sale.id)[:8])
+        c.drawRightString(self.width - 5 * mm, y, self.sale.receipt_number)
         y -= 4 * mm
         
         # Date and time
@@ -185,17 +248,11 @@ class ReceiptGenerator:
         """Draw payment information"""
         c.setFont("Helvetica", 8)
         
-        payment_methods = {
-            'cash': 'Cash',
-            'card': 'Card',
-            'mobile_money': 'Mobile Money'
-        }
-        
         c.drawString(5 * mm, y, "Payment Method:")
         c.drawRightString(
             self.width - 5 * mm,
             y,
-            payment_methods.get(self.sale.payment_method, 'Other')
+            self.PAYMENT_METHODS.get(self.sale.payment_method, 'Other')
         )
         y -= 4 * mm
         
@@ -210,31 +267,37 @@ class ReceiptGenerator:
         return y
     
     def _draw_qr_code(self, c, y):
-        """Draw QR code for receipt verification"""
-        # Generate QR code
-        qr = qrcode.QRCode(version=1, box_size=2, border=1)
-        qr.add_data(f"{settings.SITE_URL}/receipts/{self.sale.id}")
+        """Draw QR code for receipt verification as vector rectangles"""
+        # A fixed mask skips scoring all eight patterns, which is most of
+        # the encode time; any mask is a valid, scannable code
+        qr = qrcode.QRCode(version=1, box_size=2, border=1, mask_pattern=0)
+        qr.add_data(self.verification_url)
         qr.make(fit=True)
+        matrix = qr.get_matrix()
         
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to image
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        
-        # Draw QR code
         qr_size = 20 * mm
         x = (self.width - qr_size) / 2
         y -= qr_size
         
-        c.drawImage(
-            ImageReader(buffer),
-            x,
-            y,
-            width=qr_size,
-            height=qr_size
-        )
+        # One rectangle per horizontal run of dark modules, in module units
+        # with rows counted down from the top-left corner
+        runs = []
+        for row, cells in enumerate(matrix):
+            col, size = 0, len(cells)
+            while col < size:
+                if not cells[col]:
+                    col += 1
+                    continue
+                start = col
+                while col < size and cells[col]:
+                    col += 1
+                runs.append(f"{start} {row} {col - start} 1 re")
+        
+        c.saveState()
+        c.translate(x, y + qr_size)
+        c.scale(qr_size / len(matrix), -qr_size / len(matrix))
+        c.addLiteral("\n".join(runs) + "\nf")
+        c.restoreState()
         
         y -= 4 * mm
         
@@ -242,6 +305,9 @@ class ReceiptGenerator:
     
     def _draw_footer(self, c, y):
         """Draw footer"""
+        self._place_form(c, 'footer', y, 14 * mm, self._draw_footer_lines)
+    
+    def _draw_footer_lines(self, c, y):
         c.setFont("Helvetica", 7)
         
         # Thank you message
@@ -268,6 +334,96 @@ class ReceiptGenerator:
             "Powered by POS System"
         )
     
+    def generate_escpos(self):
+        """Generate the receipt as an ESC/POS byte stream for thermal printers.
+
+        Same content and order as the PDF. The printer draws the QR code
+        itself (GS ( k), so the payload is plain text plus a few commands.
+        """
+        sale = self.sale
+        shop = sale.shop
+        width = self.ESCPOS_COLUMNS
+        rule = '-' * width
+        out = bytearray(ESC + b'@' + ESC + b't\x00')  # reset, code page PC437
+        
+        def text(value=''):
+            out.extend(value.encode('cp437', 'replace') + b'\n')
+        
+        def columns(left, right):
+            left = left[:width - len(right) - 1]
+            text(left + right.rjust(width - len(left)))
+        
+        # Shop header: centred, name in bold double size
+        out.extend(ESC + b'a\x01' + ESC + b'E\x01' + GS + b'!\x11')
+        text(shop.name[:width // 2])
+        out.extend(GS + b'!\x00' + ESC + b'E\x00')
+        text(shop.address)
+        text(f"Tel: {shop.phone}")
+        if shop.email:
+            text(shop.email)
+        out.extend(ESC + b'a\x00')
+        text(rule)
+        
+        # Sale info
+        columns("Receipt #:", sale.receipt_number)
+        columns("Date:", sale.created_at.strftime("%Y-%m-%d %H:%M"))
+        columns("Cashier:", sale.cashier.username if sale.cashier else "N/A")
+        if sale.customer_name:
+            columns("Customer:", sale.customer_name)
+        text(rule)
+        
+        # Items
+        out.extend(ESC + b'E\x01')
+        columns("Item", "Amount")
+        out.extend(ESC + b'E\x00')
+        for item in sale.items.all():
+            text(item.product.name[:width])
+            columns(
+                f"   {item.quantity} x {float(item.unit_price):.2f}",
+                f"{float(item.subtotal):.2f}"
+            )
+            if item.discount > 0:
+                columns("   Discount:", f"-{float(item.discount):.2f}")
+        text(rule)
+        
+        # Totals in bold double height
+        out.extend(ESC + b'E\x01' + GS + b'!\x01')
+        columns("TOTAL:", f"{float(sale.total_amount):.2f}")
+        out.extend(GS + b'!\x00' + ESC + b'E\x00')
+        text(rule)
+        
+        # Payment info
+        columns("Payment Method:", self.PAYMENT_METHODS.get(sale.payment_method, 'Other'))
+        columns("Status:", sale.status.capitalize())
+        text()
+        
+        # QR code and footer, centred
+        out.extend(ESC + b'a\x01')
+        out.extend(self._escpos_qr(self.verification_url))
+        text()
+        text("Thank you for your business!")
+        text("Goods sold are not returnable")
+        text()
+        text("Powered by POS System")
+        
+        # Feed to the cutter and cut
+        out.extend(ESC + b'a\x00' + GS + b'VB\x00')
+        return bytes(out)
+    
+    @staticmethod
+    def _escpos_qr(data, module_size=6):
+        """GS ( k commands: model 2, module size, error level M, store, print"""
+        def command(body):
+            return GS + b'(k' + len(body).to_bytes(2, 'little') + body
+        
+        return (
+            command(b'1A2\x00')
+            + command(b'1C' + bytes([module_size]))
+            + command(b'1E1')
+            + command(b'1P0' + data.encode('ascii'))
+            + command(b'1Q0')
+        )
+    
     def generate_html(self):
         """Generate HTML receipt for web display"""
         from django.template.loader import render_to_string
@@ -0,0 +1,17 @@
+# apps/sales/renderers.py
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class EscPosRenderer(BaseRenderer):
+    """Accepts ``?format=escpos`` during content negotiation.
+
+    Receipt bytes are returned as a plain HttpResponse and never reach
+    this renderer; only error payloads do, and they are written as JSON.
+    """
+    media_type = 'application/octet-stream'
+    format = 'escpos'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data)
@@ -0,0 +1,200 @@
+# apps/sales/reservations.py
+from collections import OrderedDict
+from datetime import timedelta
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, When, Value, F, IntegerField
+from django.utils import timezone
+
+from analytics.rollups import add_completed_sales
+from products.models import Product, InventoryMovement
+from products.sharding import take_from_shards, return_to_shards
+from .models import Sale, StockReservation
+
+logger = logging.getLogger(__name__)
+
+
+def reserve_for_sale(sale, quantities):
+    """Record the stock a pending sale holds; the counters are updated by the caller"""
+    expires_at = timezone.now() + timedelta(seconds=settings.SALE_RESERVATION_TTL)
+    StockReservation.objects.bulk_create([
+        StockReservation(
+            sale=sale,
+            product_id=product_id,
+            quantity=quantity,
+            expires_at=expires_at,
+        )
+        for product_id, quantity in quantities.items()
+    ])
+
+
+def record_sale_movements(sale, quantities, created_by=None, notes="Sale transaction"):
+    InventoryMovement.objects.bulk_create([
+        InventoryMovement(
+            product_id=product_id,
+            quantity=-quantity,
+            movement_type='sale',
+            reference_id=str(sale.id),
+            notes=notes,
+            created_by=created_by,
+        )
+        for product_id, quantity in quantities.items()
+    ])
+
+
+def _sum_by_product(rows):
+    quantities = OrderedDict()
+    for product_id, quantity in rows:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def _split_sharded(quantities):
+    """Split quantities into (regular, sharded) products"""
+    sharded_ids = set(
+        Product.objects.filter(id__in=list(quantities), stock_shards__gt=0)
+        .values_list('id', flat=True)
+    )
+    regular, sharded = OrderedDict(), OrderedDict()
+    for product_id, quantity in quantities.items():
+        target = sharded if product_id in sharded_ids else regular
+        target[product_id] = quantity
+    return regular, sharded
+
+
+def _apply_to_products(quantities, **columns):
+    """Subtract per-product quantities from the given counter columns.
+
+    Product rows are locked in id order first, matching checkout, so
+    settlement and checkout never deadlock on each other.
+    """
+    if not quantities:
+        return
+    list(
+        Product.objects.select_for_update()
+        .filter(id__in=list(quantities)).order_by('id').values_list('id', flat=True)
+    )
+    amount = Case(
+        *[When(id=product_id, then=Value(qty)) for product_id, qty in quantities.items()],
+        output_field=IntegerField(),
+    )
+    Product.objects.filter(id__in=list(quantities)).update(
+        **{column: F(column) - amount for column in columns}
+    )
+
+
+def convert_reservations(sale):
+    """Turn a paid sale's reservations into stock deductions.
+
+    A reservation the sweeper already released is converted too: the
+    customer has paid, so the goods have left the shop.
+    """
+    reservations = StockReservation.objects.select_for_update().filter(sale=sale)
+    active = list(
+        reservations.filter(status=StockReservation.STATUS_ACTIVE)
+        .values_list('id', 'product_id', 'quantity')
+    )
+    if active:
+        # Sharded products gave their units up at checkout already
+        regular, _ = _split_sharded(_sum_by_product((p, q) for _, p, q in active))
+        _apply_to_products(regular, current_stock=True, reserved_stock=True)
+    released = list(
+        reservations.filter(status=StockReservation.STATUS_RELEASED)
+        .values_list('id', 'product_id', 'quantity')
+    )
+    if released:
+        logger.warning(f"Sale {sale.id} was paid after its reservation expired")
+        regular, sharded = _split_sharded(_sum_by_product((p, q) for _, p, q in released))
+        _apply_to_products(regular, current_stock=True)
+        take_from_shards(sharded, force=True)
+
+    rows = active + released
+    if not rows:
+        # Pending sales from before reservations deducted stock at checkout
+        return
+    StockReservation.objects.filter(id__in=[r[0] for r in rows]).update(
+        status=StockReservation.STATUS_CONVERTED
+    )
+    record_sale_movements(
+        sale, _sum_by_product((p, q) for _, p, q in rows), created_by=sale.cashier
+    )
+
+
+def release_reservations(sale_ids):
+    """Return the stock held by the given sales' active reservations"""
+    rows = list(
+        StockReservation.objects.select_for_update()
+        .filter(sale_id__in=sale_ids, status=StockReservation.STATUS_ACTIVE)
+        .values_list('id', 'product_id', 'quantity')
+    )
+    if not rows:
+        return 0
+    regular, sharded = _split_sharded(_sum_by_product((p, q) for _, p, q in rows))
+    _apply_to_products(regular, reserved_stock=True)
+    return_to_shards(sharded)
+    return StockReservation.objects.filter(id__in=[r[0] for r in rows]).update(
+        status=StockReservation.STATUS_RELEASED
+    )
+
+
+@transaction.atomic
+def mark_sale_paid(sale_id, paystack_response=None):
+    """Complete a pending sale and convert its reservations. Returns False if already completed."""
+    sale = Sale.objects.select_for_update().get(id=sale_id)
+    if sale.status == 'completed':
+        return False
+
+    sale.status = 'completed'
+    if paystack_response is not None:
+        sale.paystack_response = paystack_response
+    sale.save()
+
+    convert_reservations(sale)
+    add_completed_sales([sale])
+    return True
+
+
+@transaction.atomic
+def mark_sale_failed(sale_id, paystack_response=None):
+    """Fail an unpaid sale and release its reservations. Completed sales are left alone."""
+    sale = Sale.objects.select_for_update().get(id=sale_id)
+    if sale.status == 'completed':
+        return False
+
+    sale.status = 'failed'
+    if paystack_response is not None:
+        sale.paystack_response = paystack_response
+    sale.save()
+
+    release_reservations([sale.id])
+    return True
+
+
+def release_expired_reservations(batch_size=500):
+    """Release expired reservations in bulk and fail their unpaid sales"""
+    now = timezone.now()
+    total = 0
+
+    while True:
+        sale_ids = list(
+            StockReservation.objects.filter(
+                status=StockReservation.STATUS_ACTIVE,
+                expires_at__lte=now
+            ).order_by().values_list('sale_id', flat=True).distinct()[:batch_size]
+        )
+        if not sale_ids:
+            break
+
+        with transaction.atomic():
+            # Lock sales before products, the same order as mark_sale_paid
+            pending = list(
+                Sale.objects.select_for_update()
+                .filter(id__in=sale_ids, status='pending')
+                .order_by('id').values_list('id', flat=True)
+            )
+            total += release_reservations(sale_ids)
+            Sale.objects.filter(id__in=pending).update(status='failed', updated_at=now)
+
+    return total
@@ -1,7 +1,7 @@
 # apps/sales/serializers.py
 from rest_framework import serializers
 from .models import Sale, SaleItem
-from products.models import Product
+from .checkout import CheckoutEngine
 from decimal import Decimal
 
 
@@ -23,11 +23,12 @@ class SaleSerializer(serializers.ModelSerializer):
     cashier_name = serializers.CharField(source='cashier.username', read_only=True)
     shop_name = serializers.CharField(source='shop.name', read_only=True)
     items_count = serializers.IntegerField(read_only=True)
+    receipt_number = serializers.CharField(read_only=True)
     
     class Meta:
         model = Sale
         fields = [
-            'id', 'shop', 'shop_name', 'cashier', 'cashier_name',
+            'id', 'receipt_number', 'shop', 'shop_name', 'cashier', 'cashier_name',
             'total_amount', 'payment_method', 'status',
             'paystack_reference', 'customer_name', 'customer_phone',
             'customer_email', 'notes', 'items', 'items_count',
@@ -53,6 +54,9 @@ class CreateSaleSerializer(serializers.Serializer):
     
     notes = serializers.CharField(required=False, allow_blank=True)
     
+    # Client-generated key for safe retries (the Idempotency-Key header wins)
+    client_ref = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    
     # Line items
     items = serializers.ListField(
         child=serializers.DictField(),
@@ -89,31 +93,46 @@ class CreateSaleSerializer(serializers.Serializer):
         except Shop.DoesNotExist:
             raise serializers.ValidationError("Shop not found")
         
-        if not user.is_admin and shop not in user.assigned_shops.all():
+        if not user.is_admin and not user.assigned_shops.filter(id=shop.id).exists():
             raise serializers.ValidationError(
                 "You don't have permission to create sales in this shop"
             )
         
-        # Validate stock availability
-        for item in data['items']:
-            try:
-                product = Product.objects.select_for_update().get(
-                    id=item['product_id'],
-                    shop=shop
-                )
-                if product.current_stock < item['quantity']:
-                    raise serializers.ValidationError(
-                        f"Insufficient stock for {product.name}. "
-                        f"Available: {product.current_stock}, Requested: {item['quantity']}"
-                    )
-            except Product.DoesNotExist:
-                raise serializers.ValidationError(
-                    f"Product {item['product_id']} not found in this shop"
-                )
+        # Lock the basket's products once and validate stock; the view
+        # reuses this context instead of reloading the same rows
+        data['basket'] = CheckoutEngine(shop, user).prepare(data['items'])
         
         return data
 
 
+class SyncSaleSerializer(CreateSaleSerializer):
+    """One queued offline sale; stock and shop checks run per chunk"""
+    idempotency_key = serializers.CharField(max_length=100)
+    created_at = serializers.DateTimeField()
+    payment_method = serializers.ChoiceField(choices=['cash'])
+    
+    def validate(self, data):
+        # Shop access and stock are checked set-wise by OfflineSyncEngine
+        return data
+
+
+class SaleSyncSerializer(serializers.Serializer):
+    """Batch of offline sales uploaded by a till"""
+    sales = serializers.ListField(
+        child=serializers.DictField(),
+        min_length=1
+    )
+    
+    def validate_sales(self, sales):
+        from django.conf import settings
+        limit = settings.SALE_SYNC_MAX_BATCH
+        if len(sales) > limit:
+            raise serializers.ValidationError(
+                f"A sync batch may contain at most {limit} sales"
+            )
+        return sales
+
+
 class SaleListSerializer(serializers.ModelSerializer):
     """Lightweight serializer for sale lists"""
     cashier_name = serializers.CharField(source='cashier.username', read_only=True)
@@ -123,6 +142,6 @@ class SaleListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Sale
         fields = [
-            'id', 'shop_name', 'cashier_name', 'total_amount',
+            'id', 'receipt_number', 'shop_name', 'cashier_name', 'total_amount',
             'payment_method', 'status', 'items_count', 'created_at'
         ]
\ No newline at end of file
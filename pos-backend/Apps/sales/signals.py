@@ -0,0 +1,26 @@
+# apps/sales/signals.py
+from django.db import transaction
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+from .models import Sale
+from .receipt_cache import ReceiptCache
+
+
+@receiver(post_init, sender=Sale)
+def remember_status(sender, instance, **kwargs):
+    instance._loaded_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Sale)
+def drop_cached_receipts(sender, instance, created, **kwargs):
+    """Delete cached receipt PDFs once a sale is refunded.
+
+    Other edits change ``updated_at`` and so the cache name; their old
+    renderings are left to the ``sweep_receipt_cache`` task.
+    """
+    refunded = (
+        not created and instance.status == 'refunded' and instance._loaded_status != 'refunded'
+    )
+    instance._loaded_status = instance.status
+    if refunded:
+        transaction.on_commit(lambda: ReceiptCache().invalidate(instance))
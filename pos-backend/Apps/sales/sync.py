@@ -0,0 +1,250 @@
+# apps/sales/sync.py
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, When, Value, DateTimeField
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from analytics.rollups import add_completed_sales
+from products.models import InventoryMovement
+from products.sharding import take_from_shards
+from shops.models import Shop
+from .checkout import CheckoutEngine
+from .idempotency import request_fingerprint
+from .models import Sale, SaleItem, IdempotencyKey
+from .serializers import SyncSaleSerializer
+
+
+class OfflineSyncEngine:
+    """Replay queued offline sales from a till in bounded chunks.
+
+    Each chunk runs in one transaction with one ordered product lock, and
+    its sales, items, movements and stock updates are written set-wise.
+    A sale that fails validation is reported and skipped without aborting
+    the rest of its chunk.
+    """
+
+    def __init__(self, user, chunk_size=None):
+        self.user = user
+        self.chunk_size = chunk_size or settings.SALE_SYNC_CHUNK_SIZE
+        self._allowed_shop_ids = None
+
+    def sync(self, entries):
+        """Process all entries, returning one result per entry in order"""
+        results = []
+        for start in range(0, len(entries), self.chunk_size):
+            chunk = list(enumerate(entries[start:start + self.chunk_size], start=start))
+            try:
+                results.extend(self._sync_chunk(chunk))
+            except IntegrityError:
+                # A concurrent sync claimed some of these keys first; the
+                # retry sees them as duplicates
+                results.extend(self._sync_chunk(chunk))
+        return results
+
+    def can_sell_in(self, shop_id):
+        if self.user.is_admin:
+            return True
+        if self._allowed_shop_ids is None:
+            self._allowed_shop_ids = set(
+                self.user.assigned_shops.values_list('id', flat=True)
+            )
+        return shop_id in self._allowed_shop_ids
+
+    @staticmethod
+    def _error(index, key, errors):
+        return {'index': index, 'idempotency_key': key, 'status': 'error', 'errors': errors}
+
+    @staticmethod
+    def _duplicate(index, key, sale_id):
+        return {
+            'index': index, 'idempotency_key': key, 'status': 'duplicate',
+            'sale_id': str(sale_id) if sale_id else None,
+        }
+
+    @transaction.atomic
+    def _sync_chunk(self, chunk):
+        now = timezone.now()
+        results = {}
+        pending = []
+
+        # Structural validation needs no queries
+        for index, entry in chunk:
+            serializer = SyncSaleSerializer(data=entry)
+            if not serializer.is_valid():
+                results[index] = self._error(index, entry.get('idempotency_key'), serializer.errors)
+                continue
+            data = serializer.validated_data
+            pending.append((index, data, request_fingerprint(entry)))
+
+        # Answer keys we have already seen from the stored records
+        keys = [data['idempotency_key'] for _, data, _ in pending]
+        IdempotencyKey.objects.filter(
+            user=self.user, key__in=keys, expires_at__lte=now
+        ).delete()
+        seen = {
+            record.key: record
+            for record in IdempotencyKey.objects.filter(user=self.user, key__in=keys)
+        }
+
+        fresh = []
+        claimed = {}
+        repeated = []
+        for index, data, fingerprint in pending:
+            key = data['idempotency_key']
+            if key in claimed:
+                # Same key twice in one chunk: resolved once the first is written
+                repeated.append((index, key, fingerprint))
+                continue
+            record = seen.get(key)
+            if record is not None:
+                if record.fingerprint != fingerprint:
+                    results[index] = self._error(
+                        index, key, ['Idempotency-Key was already used for a different sale']
+                    )
+                else:
+                    results[index] = self._duplicate(index, key, record.sale_id)
+                continue
+            claimed[key] = IdempotencyKey(
+                user=self.user,
+                key=key,
+                fingerprint=fingerprint,
+                expires_at=now + timedelta(seconds=settings.SALE_IDEMPOTENCY_KEY_TTL)
+            )
+            fresh.append((index, data))
+
+        # One lookup for the chunk's shops and one ordered lock for its products
+        shops = Shop.objects.in_bulk({data['shop_id'] for _, data in fresh})
+        product_ids = {
+            int(item['product_id']) for _, data in fresh for item in data['items']
+        }
+        products = CheckoutEngine.load_for_sale(product_ids)
+
+        sales, lines_by_sale, created_at = [], [], {}
+        chunk_quantities = {}
+        for index, data in fresh:
+            key = data['idempotency_key']
+            shop = shops.get(data['shop_id'])
+            if shop is None:
+                results[index] = self._error(index, key, ['Shop not found'])
+                continue
+            if not self.can_sell_in(shop.id):
+                results[index] = self._error(
+                    index, key, ["You don't have permission to create sales in this shop"]
+                )
+                continue
+
+            quantities = CheckoutEngine.quantities_by_product(data['items'])
+            error = None
+            for product_id, quantity in quantities.items():
+                product = products.get(product_id)
+                if product is None or product.shop_id != shop.id:
+                    error = f"Product {product_id} not found in this shop"
+                elif product.available_stock - chunk_quantities.get(product_id, 0) < quantity:
+                    error = (
+                        f"Insufficient stock for {product.name}. "
+                        f"Available: {product.available_stock - chunk_quantities.get(product_id, 0)}, "
+                        f"Requested: {quantity}"
+                    )
+                if error:
+                    break
+            if error:
+                results[index] = self._error(index, key, [error])
+                continue
+
+            # Sharded stock is only known per shard; take it sale by sale
+            _, sharded = CheckoutEngine.split_sharded(quantities, products)
+            if sharded:
+                try:
+                    with transaction.atomic():
+                        take_from_shards(sharded)
+                except ValidationError as exc:
+                    results[index] = self._error(index, key, exc.detail)
+                    continue
+
+            # Count what the chunk has taken so later sales see the new level
+            for product_id, quantity in quantities.items():
+                chunk_quantities[product_id] = chunk_quantities.get(product_id, 0) + quantity
+
+            lines = [CheckoutEngine.resolve_line(item) for item in data['items']]
+            sale = Sale(
+                shop=shop,
+                cashier=self.user,
+                total_amount=sum((line['subtotal'] for line in lines), Decimal('0.00')),
+                payment_method=data['payment_method'],
+                status='completed',
+                customer_name=data.get('customer_name', ''),
+                customer_phone=data.get('customer_phone', ''),
+                customer_email=data.get('customer_email', ''),
+                notes=data.get('notes', ''),
+            )
+            sales.append(sale)
+            lines_by_sale.append((sale, lines, quantities))
+            created_at[sale.id] = min(data['created_at'], now)
+            claimed[key].sale = sale
+            results[index] = {
+                'index': index, 'idempotency_key': key,
+                'status': 'created', 'sale_id': str(sale.id),
+            }
+
+        if sales:
+            Sale.objects.bulk_create(sales)
+            # auto_now_add stamps the upload time; restore the till's timestamps
+            Sale.objects.filter(id__in=list(created_at)).update(
+                created_at=Case(
+                    *[When(id=sale_id, then=Value(ts)) for sale_id, ts in created_at.items()],
+                    output_field=DateTimeField(),
+                )
+            )
+            for sale in sales:
+                sale.created_at = created_at[sale.id]
+            regular, _ = CheckoutEngine.split_sharded(chunk_quantities, products)
+            CheckoutEngine.deduct_stock(regular)
+            SaleItem.objects.bulk_create([
+                SaleItem(
+                    sale=sale,
+                    product=products[line['product_id']],
+                    quantity=line['quantity'],
+                    unit_price=line['unit_price'],
+                    discount=line['discount'],
+                    subtotal=line['subtotal'],
+                    created_at=created_at[sale.id],
+                )
+                for sale, lines, _ in lines_by_sale
+                for line in lines
+            ])
+            InventoryMovement.objects.bulk_create([
+                InventoryMovement(
+                    product=products[product_id],
+                    quantity=-quantity,
+                    movement_type='sale',
+                    reference_id=str(sale.id),
+                    notes="Offline sale sync",
+                    created_by=self.user,
+                )
+                for sale, _, quantities in lines_by_sale
+                for product_id, quantity in quantities.items()
+            ])
+            add_completed_sales(sales, {
+                sale.id: sum(quantities.values()) for sale, _, quantities in lines_by_sale
+            })
+
+        records = [record for record in claimed.values() if record.sale is not None]
+        if records:
+            IdempotencyKey.objects.bulk_create(records)
+
+        for index, key, fingerprint in repeated:
+            record = claimed[key]
+            if record.sale is None:
+                results[index] = self._error(index, key, ['Duplicate of a sale that failed in this batch'])
+            elif record.fingerprint != fingerprint:
+                results[index] = self._error(
+                    index, key, ['Idempotency-Key was already used for a different sale']
+                )
+            else:
+                results[index] = self._duplicate(index, key, record.sale.id)
+
+        return [results[index] for index, _ in chunk]
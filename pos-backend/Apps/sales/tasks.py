@@ -0,0 +1,115 @@
+# apps/sales/tasks.py
+from celery import shared_task
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import storages
+from django.core.mail import send_mail
+from django.urls import reverse
+from django.utils import timezone
+from datetime import date
+from .archive import archive_sales
+from .models import IdempotencyKey
+from .partitions import ensure_partitions
+from .receipt_cache import ReceiptCache
+from .receipt_export import ReceiptExporter, download_token
+from .reservations import release_expired_reservations
+import logging
+import tempfile
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def purge_expired_idempotency_keys(batch_size=10000):
+    """Delete expired sale idempotency keys in bounded batches"""
+    now = timezone.now()
+    total = 0
+    
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=now)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        deleted, _ = IdempotencyKey.objects.filter(id__in=ids).delete()
+        total += deleted
+    
+    logger.info(f'Deleted {total} expired idempotency keys')
+    return total
+
+
+@shared_task
+def release_expired_stock_reservations(batch_size=500):
+    """Return stock held by pending sales whose payment window has lapsed"""
+    released = release_expired_reservations(batch_size=batch_size)
+    if released:
+        logger.info(f'Released {released} expired stock reservations')
+    return released
+
+
+@shared_task
+def create_sale_partitions():
+    """Create upcoming monthly partitions so inserts never miss one"""
+    created = ensure_partitions()
+    if created:
+        logger.info(f'Created partitions {", ".join(created)}')
+    return created
+
+
+@shared_task
+def sweep_receipt_cache(max_age=None):
+    """Delete cached receipt PDFs past RECEIPT_CACHE_MAX_AGE"""
+    deleted = ReceiptCache().sweep(max_age or settings.RECEIPT_CACHE_MAX_AGE)
+    if deleted:
+        logger.info(f'Deleted {deleted} cached receipts')
+    return deleted
+
+
+@shared_task
+def archive_old_sales(months=None):
+    """Move completed sales past the retention window into the Parquet archive"""
+    sales, items = archive_sales(months=months)
+    logger.info(f'Archived {sales} sales and {items} sale items')
+    return sales
+
+
+@shared_task
+def export_receipts_archive(user_id, shop_id, start_date, end_date):
+    """Build a receipt ZIP too large to stream and email its download link.
+
+    Celery's prefork workers are daemonic and cannot start a process
+    pool, so receipts are rendered inline here.
+    """
+    from shops.models import Shop
+    from users.models import User
+    
+    user = User.objects.get(id=user_id)
+    shop = Shop.objects.get(id=shop_id)
+    exporter = ReceiptExporter(
+        shop, date.fromisoformat(start_date), date.fromisoformat(end_date), workers=1
+    )
+    storage = storages.create_storage(settings.RECEIPT_EXPORT_STORAGE)
+    
+    with tempfile.TemporaryFile() as archive:
+        for piece in exporter.stream():
+            archive.write(piece)
+        archive.seek(0)
+        name = storage.save(f'{uuid.uuid4().hex}/{exporter.filename}', File(archive))
+    
+    # The storage is private; the link is signed for this user and expires
+    link = (
+        f"{settings.API_URL.rstrip('/')}{reverse('sale-download-receipts')}"
+        f"?token={download_token(user.id, shop.id, name)}"
+    )
+    hours = settings.RECEIPT_EXPORT_LINK_MAX_AGE // 3600
+    send_mail(
+        subject=f'Receipts for {shop.name}, {start_date} to {end_date}',
+        message=f'Your receipt export is ready (link valid for {hours} hours): {link}',
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[user.email],
+        fail_silently=True,
+    )
+    logger.info(f'Exported receipts for shop {shop_id} to {name}')
+    return name
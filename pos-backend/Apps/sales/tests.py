@@ -1,3 +1,756 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+import io
+import os
+import re
+import shutil
+import tempfile
+import uuid
+import zipfile
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from products.models import Product, InventoryMovement
+from products.sharding import enable_sharding
+from reports.views import export_sales_csv
+from shops.models import Shop
+from .archive import SaleArchive, archive_sales
+from .checkout import CheckoutEngine
+from .ids import uuid7
+from .models import Sale, SaleItem, IdempotencyKey, StockReservation
+from .partitions import (
+    add_months, expired_partitions, ensure_partitions, partition_name, release_references,
+    with_partition_key,
+)
+from .receipt_cache import ReceiptCache
+from .receipt_export import ReceiptExporter
+from .receipt_generator import ReceiptGenerator
+from .reservations import mark_sale_paid, mark_sale_failed, release_expired_reservations
+from .tasks import export_receipts_archive, sweep_receipt_cache
+
+
+class SalesTestMixin:
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username='cashier', password='pass', email='c@example.com', role='admin'
+        )
+        self.shop = Shop.objects.create(name='Main', address='1 High St', phone='000')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_products(self, count, stock=50):
+        return [
+            Product.objects.create(
+                sku=f'SKU{i}', name=f'Product {i}', unit_price=Decimal('2.50'),
+                current_stock=stock, shop=self.shop
+            )
+            for i in range(count)
+        ]
+
+    def basket(self, products, quantity=1):
+        return [
+            {'product_id': p.id, 'quantity': quantity, 'unit_price': '2.50'}
+            for p in products
+        ]
+
+
+class CheckoutEngineTest(SalesTestMixin, TestCase):
+    def checkout(self, items):
+        with transaction.atomic():
+            engine = CheckoutEngine(self.shop, self.user)
+            return engine.checkout(
+                engine.prepare(items), payment_method='cash', status='completed'
+            )
+
+    def test_checkout_deducts_stock_and_writes_rows(self):
+        products = self.make_products(3)
+        sale = self.checkout(self.basket(products, quantity=2))
+
+        self.assertEqual(sale.total_amount, Decimal('15.00'))
+        self.assertEqual(SaleItem.objects.filter(sale=sale).count(), 3)
+        self.assertEqual(
+            InventoryMovement.objects.filter(reference_id=str(sale.id)).count(), 3
+        )
+        for product in products:
+            product.refresh_from_db()
+            self.assertEqual(product.current_stock, 48)
+
+    def test_query_count_independent_of_basket_size(self):
+        # lock, sale insert, stock update, two bulk inserts, rollup upsert
+        # + savepoint pair
+        small = self.make_products(2)
+        with self.assertNumQueries(8):
+            self.checkout(self.basket(small))
+
+        large = [
+            Product.objects.create(
+                sku=f'BIG{i}', name=f'Big {i}', unit_price=Decimal('1.00'),
+                current_stock=10, shop=self.shop
+            )
+            for i in range(40)
+        ]
+        with self.assertNumQueries(8):
+            self.checkout(self.basket(large))
+
+    def test_insufficient_stock_rolls_back(self):
+        products = self.make_products(2, stock=1)
+        with self.assertRaises(serializers.ValidationError):
+            self.checkout(self.basket(products, quantity=2))
+
+        self.assertFalse(Sale.objects.exists())
+        for product in products:
+            product.refresh_from_db()
+            self.assertEqual(product.current_stock, 1)
+
+
+class StockReservationTest(SalesTestMixin, TestCase):
+    def pending_sale(self, products, quantity=2):
+        with transaction.atomic():
+            engine = CheckoutEngine(self.shop, self.user)
+            return engine.checkout(
+                engine.prepare(self.basket(products, quantity=quantity)), payment_method='card'
+            )
+
+    def stock(self, product):
+        product.refresh_from_db()
+        return product.current_stock, product.reserved_stock
+
+    def test_pending_sale_reserves_instead_of_deducting(self):
+        product = self.make_products(1, stock=5)[0]
+        self.pending_sale([product], quantity=4)
+
+        self.assertEqual(self.stock(product), (5, 4))
+        self.assertEqual(product.available_stock, 1)
+        self.assertFalse(InventoryMovement.objects.exists())
+        with self.assertRaises(serializers.ValidationError):
+            self.pending_sale([product], quantity=2)
+
+    def test_payment_converts_reservation(self):
+        product = self.make_products(1, stock=5)[0]
+        sale = self.pending_sale([product])
+
+        self.assertTrue(mark_sale_paid(sale.id, {'status': 'success'}))
+        self.assertFalse(mark_sale_paid(sale.id))
+        self.assertEqual(self.stock(product), (3, 0))
+        self.assertEqual(
+            InventoryMovement.objects.get(reference_id=str(sale.id)).quantity, -2
+        )
+        self.assertEqual(
+            StockReservation.objects.get(sale=sale).status, StockReservation.STATUS_CONVERTED
+        )
+
+    def test_failed_payment_releases_reservation(self):
+        product = self.make_products(1, stock=5)[0]
+        sale = self.pending_sale([product])
+
+        mark_sale_failed(sale.id)
+        sale.refresh_from_db()
+        self.assertEqual(sale.status, 'failed')
+        self.assertEqual(self.stock(product), (5, 0))
+
+    def test_sweeper_releases_expired_reservations(self):
+        products = self.make_products(2, stock=5)
+        expired = self.pending_sale(products)
+        fresh = self.pending_sale(products[:1])
+        StockReservation.objects.filter(sale=expired).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.assertEqual(release_expired_reservations(), 2)
+        self.assertEqual(self.stock(products[0]), (5, 2))
+        self.assertEqual(self.stock(products[1]), (5, 0))
+        expired.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((expired.status, fresh.status), ('failed', 'pending'))
+
+        # A late payment still deducts the stock it was sold
+        mark_sale_paid(expired.id)
+        self.assertEqual(self.stock(products[1]), (3, 0))
+
+
+class SaleIdTest(SalesTestMixin, TestCase):
+    def test_ids_are_time_ordered_uuids(self):
+        ids = [uuid7() for _ in range(5000)]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual({(i.version, i.variant) for i in ids}, {(7, uuid.RFC_4122)})
+
+    def test_receipt_numbers_stay_distinct(self):
+        products = self.make_products(1)
+        sales = [
+            CheckoutEngine(self.shop, self.user).checkout(
+                CheckoutEngine(self.shop, self.user).prepare(self.basket(products)),
+                payment_method='cash', status='completed'
+            )
+            for _ in range(3)
+        ]
+        # The leading characters are the timestamp, shared within ~65 seconds
+        self.assertEqual(len({sale.receipt_number for sale in sales}), 3)
+        self.assertTrue(all(len(sale.receipt_number) == 8 for sale in sales))
+
+        legacy = Sale(id=uuid.UUID('1b4e28ba-2fa1-41d2-883f-0016d3cca427'))
+        self.assertEqual(legacy.receipt_number, '1b4e28ba')
+
+
+class PartitionPlanTest(TestCase):
+    def test_month_arithmetic_and_names(self):
+        self.assertEqual(add_months(date(2025, 11, 1), 3), date(2026, 2, 1))
+        self.assertEqual(add_months(date(2026, 1, 1), -1), date(2025, 12, 1))
+        self.assertEqual(partition_name('sales_sale', date(2026, 2, 1)), 'sales_sale_p2026_02')
+
+    def test_only_months_entirely_before_cutoff_expire(self):
+        utc = lambda *args: datetime(*args, tzinfo=dt_timezone.utc)
+        partitions = {
+            'sales_sale_history': utc(2025, 1, 1),
+            'sales_sale_p2025_01': utc(2025, 2, 1),
+            'sales_sale_p2025_02': utc(2025, 3, 1),
+            'sales_sale_p2025_03': utc(2025, 4, 1),
+        }
+        self.assertEqual(
+            expired_partitions(partitions, utc(2025, 3, 1)),
+            ['sales_sale_history', 'sales_sale_p2025_01', 'sales_sale_p2025_02']
+        )
+
+    def test_unique_keys_gain_the_partition_key(self):
+        self.assertEqual(
+            with_partition_key('UNIQUE (paystack_reference)'), 'UNIQUE (paystack_reference, created_at)'
+        )
+        self.assertEqual(
+            with_partition_key(
+                'CREATE UNIQUE INDEX ref ON public.sales_sale USING btree (ref) WHERE (ref IS NOT NULL)'
+            ),
+            'CREATE UNIQUE INDEX ref ON public.sales_sale USING btree (ref, created_at) '
+            'WHERE (ref IS NOT NULL)'
+        )
+        self.assertEqual(with_partition_key('UNIQUE (id, created_at)'), 'UNIQUE (id, created_at)')
+        with self.assertRaises(ValueError):
+            with_partition_key('CREATE UNIQUE INDEX ref ON sales_sale USING btree (ref) INCLUDE (id)')
+
+    @mock.patch.object(connection, 'vendor', 'sqlite')
+    def test_postgres_only(self):
+        self.assertEqual(ensure_partitions(), [])
+        with self.assertRaises(CommandError):
+            call_command('partitions', 'status')
+
+
+class PartitionRetentionTest(SalesTestMixin, TestCase):
+    def test_references_to_expiring_sales_are_released(self):
+        from payments.models import PaymentOutbox
+
+        products = self.make_products(1)
+        sales = []
+        for _ in range(2):
+            with transaction.atomic():
+                engine = CheckoutEngine(self.shop, self.user)
+                sales.append(engine.checkout(
+                    engine.prepare(self.basket(products)), payment_method='card', status='pending'
+                ))
+        old, recent = sales
+        long_ago = timezone.now() - timedelta(days=400)
+        Sale.objects.filter(id=old.id).update(created_at=long_ago)
+        for sale in sales:
+            PaymentOutbox.objects.create(sale=sale, payload={})
+            IdempotencyKey.objects.create(
+                user=self.user, key=str(sale.id), fingerprint='-', sale=sale,
+                expires_at=timezone.now()
+            )
+
+        release_references(Sale, timezone.now() - timedelta(days=200))
+
+        # CASCADE rows go, SET_NULL rows stay without their sale
+        self.assertEqual(list(PaymentOutbox.objects.values_list('sale_id', flat=True)), [recent.id])
+        self.assertFalse(StockReservation.objects.filter(sale=old).exists())
+        self.assertTrue(StockReservation.objects.filter(sale=recent).exists())
+        self.assertEqual(
+            set(IdempotencyKey.objects.values_list('key', 'sale_id')),
+            {(str(old.id), None), (str(recent.id), recent.id)}
+        )
+        # The sales themselves are left for the partition detach
+        self.assertEqual(Sale.objects.count(), 2)
+
+
+class SaleArchiveTest(SalesTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.enterContext(override_settings(SALE_ARCHIVE_DIR=root))
+        caches['reports'].clear()
+
+        products = self.make_products(2)
+        self.old = [self.checkout(products) for _ in range(3)]
+        self.pending = self.checkout(products, status='pending')
+        self.recent = self.checkout(products)
+        # Before the current month whatever today's date is
+        long_ago = timezone.now() - timedelta(days=40)
+        old_ids = [sale.id for sale in self.old] + [self.pending.id]
+        Sale.objects.filter(id__in=old_ids).update(created_at=long_ago)
+        SaleItem.objects.filter(sale_id__in=old_ids).update(created_at=long_ago)
+
+    def checkout(self, products, status='completed'):
+        with transaction.atomic():
+            engine = CheckoutEngine(self.shop, self.user)
+            return engine.checkout(
+                engine.prepare(self.basket(products)), payment_method='cash', status=status
+            )
+
+    def test_old_completed_sales_move_to_parquet(self):
+        self.assertEqual(archive_sales(months=0), (3, 6))
+        self.assertEqual(
+            set(Sale.objects.values_list('id', flat=True)), {self.pending.id, self.recent.id}
+        )
+        self.assertFalse(SaleItem.objects.filter(sale__in=self.old).exists())
+
+        archive = SaleArchive()
+        [entry] = archive.entries()
+        self.assertEqual((entry['shop_id'], entry['parts'][0]['sales_count']), (self.shop.id, 3))
+        self.assertEqual(entry['parts'][0]['revenue'], '15.00')
+        sales = archive.read('sales')
+        self.assertEqual(set(sales['id']), {str(sale.id) for sale in self.old})
+        items = archive.read('items', columns=['sale_id', 'product_name', 'quantity'])
+        self.assertEqual(len(items), 6)
+        self.assertEqual(set(items['product_name']), {'Product 0', 'Product 1'})
+
+        # Parts archived before per-product totals were kept are summed from their items
+        manifest = archive.load_manifest()
+        for part in manifest['months'][f"{self.shop.id}/{entry['month']}"]['parts']:
+            del part['categories']
+        archive.save_manifest(manifest)
+        totals = archive.category_totals([self.shop.id])
+        self.assertEqual(
+            dict(zip(totals['product_name'], totals['quantity'])), {'Product 0': 3, 'Product 1': 3}
+        )
+
+        # Nothing left to move; no empty part is recorded
+        self.assertEqual(archive_sales(months=0), (0, 0))
+        self.assertEqual(len(archive.entries()[0]['parts']), 1)
+
+    def test_reports_include_archived_sales(self):
+        archive_sales(months=0)
+        archive = SaleArchive()
+        totals = archive.category_totals()
+        self.assertEqual(
+            {row.product_name: (row.revenue, row.quantity) for row in totals.itertuples()},
+            {'Product 0': (Decimal('7.50'), 3), 'Product 1': (Decimal('7.50'), 3)}
+        )
+        # Reports use the stored totals and never open archived items
+        for part in archive.entries()[0]['parts']:
+            os.remove(os.path.join(archive.root, part['items']))
+
+        resp = self.client.get('/api/reports/sales/')
+        self.assertEqual(resp.status_code, 200)
+        quantities = {
+            item['category_name']: item['total_quantity'] for item in resp.json()['category_breakdown']
+        }
+        self.assertEqual(quantities, {'Product 0': 4, 'Product 1': 4})
+
+        request = APIRequestFactory().get('/api/reports/export/sales.csv')
+        force_authenticate(request, self.user)
+        rows = export_sales_csv(request).content.decode().splitlines()[1:]
+        self.assertEqual(len(rows), 4)
+        self.assertTrue(rows[0].startswith(str(self.recent.id)))
+
+
+class CreateSaleAPITest(SalesTestMixin, TestCase):
+    def test_cash_sale_is_completed(self):
+        products = self.make_products(2)
+        resp = self.client.post('/api/sales/', {
+            'shop_id': self.shop.id,
+            'payment_method': 'cash',
+            'items': self.basket(products, quantity=3),
+        }, format='json')
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.json()['status'], 'completed')
+        self.assertEqual(resp.json()['items_count'], 2)
+        products[0].refresh_from_db()
+        self.assertEqual(products[0].current_stock, 47)
+
+    def test_create_query_count_independent_of_basket_size(self):
+        def post(products):
+            return self.client.post('/api/sales/', {
+                'shop_id': self.shop.id,
+                'payment_method': 'cash',
+                'items': self.basket(products),
+            }, format='json')
+
+        products = self.make_products(40)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(post(products[:2]).status_code, 201)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(post(products).status_code, 201)
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        # Shop and products are each read once
+        shop_reads = [
+            q for q in large.captured_queries
+            if q['sql'].startswith('SELECT') and '"shops_shop"' in q['sql'].split('WHERE')[0]
+            and 'products_product' not in q['sql']
+        ]
+        self.assertEqual(len(shop_reads), 1)
+
+
+class IdempotentSaleTest(SalesTestMixin, TestCase):
+    def post(self, products, quantity=1, **extra):
+        return self.client.post('/api/sales/', {
+            'shop_id': self.shop.id,
+            'payment_method': 'cash',
+            'items': self.basket(products, quantity=quantity),
+        }, format='json', **extra)
+
+    def test_retry_replays_stored_response(self):
+        products = self.make_products(1)
+        first = self.post(products, HTTP_IDEMPOTENCY_KEY='till-1-0001')
+        retry = self.post(products, HTTP_IDEMPOTENCY_KEY='till-1-0001')
+
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json()['id'], first.json()['id'])
+        self.assertEqual(Sale.objects.count(), 1)
+        products[0].refresh_from_db()
+        self.assertEqual(products[0].current_stock, 49)
+
+    def test_key_reused_with_different_body_is_rejected(self):
+        products = self.make_products(1)
+        self.post(products, HTTP_IDEMPOTENCY_KEY='till-1-0002')
+        resp = self.post(products, quantity=2, HTTP_IDEMPOTENCY_KEY='till-1-0002')
+        self.assertEqual(resp.status_code, 422)
+
+    def test_retry_for_a_deleted_sale_is_gone(self):
+        products = self.make_products(1)
+        self.post(products, HTTP_IDEMPOTENCY_KEY='till-1-0004')
+        # The response was never stored, then the sale was archived
+        IdempotencyKey.objects.update(response_status=None, response_body=None)
+        Sale.objects.all().delete()
+        resp = self.post(products, HTTP_IDEMPOTENCY_KEY='till-1-0004')
+
+        self.assertEqual(resp.status_code, 410)
+        self.assertEqual(resp['Idempotent-Replayed'], 'true')
+        self.assertFalse(Sale.objects.exists())
+
+    def test_expired_key_runs_checkout_again(self):
+        products = self.make_products(1)
+        self.post(products, HTTP_IDEMPOTENCY_KEY='till-1-0003')
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        resp = self.post(products, HTTP_IDEMPOTENCY_KEY='till-1-0003')
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(Sale.objects.count(), 2)
+
+
+class OfflineSyncTest(SalesTestMixin, TestCase):
+    def entry(self, key, products, quantity=1, created_at='2026-01-05T10:30:00Z'):
+        return {
+            'idempotency_key': key,
+            'created_at': created_at,
+            'shop_id': self.shop.id,
+            'payment_method': 'cash',
+            'items': self.basket(products, quantity=quantity),
+        }
+
+    def sync(self, entries):
+        return self.client.post('/api/sales/sync/', {'sales': entries}, format='json')
+
+    def test_sync_creates_sales_with_till_timestamps(self):
+        products = self.make_products(2, stock=5)
+        resp = self.sync([
+            self.entry('k1', products),
+            self.entry('k2', products[:1], quantity=10),  # more than in stock
+            self.entry('k3', products, quantity=2),
+        ])
+
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual([r['status'] for r in data['results']], ['created', 'error', 'created'])
+        self.assertEqual(data['created'], 2)
+        self.assertEqual(data['failed'], 1)
+
+        sale = Sale.objects.get(id=data['results'][0]['sale_id'])
+        self.assertEqual(sale.status, 'completed')
+        self.assertEqual(sale.created_at.isoformat(), '2026-01-05T10:30:00+00:00')
+        # Items share the sale's partition key
+        self.assertEqual({item.created_at for item in sale.items.all()}, {sale.created_at})
+        products[0].refresh_from_db()
+        self.assertEqual(products[0].current_stock, 2)
+
+    def test_resync_reports_duplicates(self):
+        products = self.make_products(1)
+        first = self.sync([self.entry('k1', products)]).json()
+        again = self.sync([self.entry('k1', products), self.entry('k1', products)]).json()
+
+        self.assertEqual(again['duplicates'], 2)
+        self.assertEqual(again['results'][0]['sale_id'], first['results'][0]['sale_id'])
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_short_sharded_stock_rejects_only_that_sale(self):
+        products = self.make_products(2, stock=5)
+        enable_sharding(products[0], 2)
+        # current_stock is a snapshot; the shards have already sold out
+        products[0].shards.update(stock=0)
+
+        resp = self.sync([self.entry('k1', products[1:]), self.entry('k2', products)])
+
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual([r['status'] for r in data['results']], ['created', 'error'])
+        self.assertIn('Insufficient stock', data['results'][1]['errors'][0])
+        self.assertEqual(Sale.objects.count(), 1)
+        products[1].refresh_from_db()
+        self.assertEqual(products[1].current_stock, 4)
+
+    def test_query_count_independent_of_batch_size(self):
+        products = self.make_products(3)
+        with CaptureQueriesContext(connection) as small:
+            self.sync([self.entry(f's{i}', products) for i in range(2)])
+        with CaptureQueriesContext(connection) as large:
+            self.sync([self.entry(f'l{i}', products) for i in range(30)])
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+class SaleListPaginationTest(SalesTestMixin, TestCase):
+    def test_cursor_pages_cover_every_sale_once(self):
+        products = self.make_products(1)
+        for _ in range(5):
+            self.client.post('/api/sales/', {
+                'shop_id': self.shop.id, 'payment_method': 'cash',
+                'items': self.basket(products),
+            }, format='json')
+
+        seen, url = [], '/api/sales/?page_size=2'
+        while url:
+            data = self.client.get(url).json()
+            self.assertNotIn('count', data)
+            seen.extend(sale['id'] for sale in data['results'])
+            url = data['next']
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(set(seen), set(str(pk) for pk in Sale.objects.values_list('id', flat=True)))
+
+    def test_count_is_opt_in(self):
+        data = self.client.get('/api/sales/?count=exact').json()
+        self.assertEqual(data['count'], 0)
+
+
+class SaleReadQueryCountTest(SalesTestMixin, TestCase):
+    def make_sales(self, count, lines):
+        products = self.make_products(lines)
+        for _ in range(count):
+            with transaction.atomic():
+                engine = CheckoutEngine(self.shop, self.user)
+                engine.checkout(
+                    engine.prepare(self.basket(products)), payment_method='cash', status='completed'
+                )
+
+    def test_list_query_count_is_constant(self):
+        self.make_sales(20, lines=3)
+        # sales page with annotated items_count; no per-row queries
+        with self.assertNumQueries(1):
+            resp = self.client.get('/api/sales/')
+        self.assertEqual(len(resp.json()['results']), 20)
+        self.assertEqual(resp.json()['results'][0]['items_count'], 3)
+
+    def test_detail_query_count_is_constant(self):
+        self.make_sales(1, lines=10)
+        sale = Sale.objects.get()
+        # sale with shop and cashier, then items joined to products
+        with self.assertNumQueries(2):
+            resp = self.client.get(f'/api/sales/{sale.id}/')
+        self.assertEqual(resp.json()['items_count'], 10)
+        self.assertEqual(resp.json()['items'][0]['product_name'], 'Product 0')
+
+
+class ReceiptCacheTest(SalesTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        storage = override_settings(RECEIPT_CACHE_STORAGE={
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': self.media},
+        })
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+        with transaction.atomic():
+            engine = CheckoutEngine(self.shop, self.user)
+            self.sale = engine.checkout(
+                engine.prepare(self.basket(self.make_products(2))),
+                payment_method='cash', status='completed'
+            )
+        self.url = f'/api/sales/{self.sale.id}/print-receipt/'
+
+    def test_reprint_is_served_from_cache(self):
+        with mock.patch.object(
+            ReceiptGenerator, 'generate_pdf', autospec=True,
+            side_effect=ReceiptGenerator.generate_pdf
+        ) as render:
+            first = self.client.get(self.url)
+            second = self.client.get(self.url)
+
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first.content, second.content)
+        self.assertTrue(first.content.startswith(b'%PDF'))
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertIn('Last-Modified', first)
+
+    def test_conditional_and_range_requests(self):
+        full = self.client.get(self.url)
+
+        cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=full['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        part = self.client.get(self.url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(part.status_code, 206)
+        self.assertEqual(part.content, full.content[:10])
+        self.assertEqual(part['Content-Range'], f'bytes 0-9/{len(full.content)}')
+
+        tail = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(tail.content, full.content[-5:])
+
+        beyond = self.client.get(self.url, HTTP_RANGE=f'bytes={len(full.content)}-')
+        self.assertEqual(beyond.status_code, 416)
+
+    def test_escpos_format_returns_printer_commands(self):
+        resp = self.client.get(self.url + '?format=escpos')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/octet-stream')
+        payload = resp.content
+        self.assertTrue(payload.startswith(b'\x1b@'))
+        self.assertIn(b'Product 1', payload)
+        self.assertIn(f'/receipts/{self.sale.id}'.encode(), payload)  # native QR data
+        self.assertTrue(payload.endswith(b'\x1dVB\x00'))
+        self.assertLess(len(payload), 4096)
+        self.assertNotEqual(resp['ETag'], self.client.get(self.url)['ETag'])
+
+    def test_combined_pdf_embeds_shop_header_once(self):
+        pdf = ReceiptGenerator.generate_combined_pdf([self.sale] * 3).getvalue()
+        # One form each for the shop header and the footer, shared by 3 pages
+        self.assertEqual(pdf.count(b'/Subtype /Form'), 2)
+        self.assertEqual(pdf.count(b'/Type /Page\n'), 3)
+
+    def test_refund_invalidates_cached_pdf(self):
+        self.client.get(self.url)
+        cache = ReceiptCache()
+        self.assertEqual(len(cache.storage.listdir(str(self.sale.id))[1]), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sale.status = 'refunded'
+            self.sale.save()
+
+        self.assertEqual(cache.storage.listdir(str(self.sale.id))[1], [])
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+    def test_other_edits_leave_storage_to_the_sweep(self):
+        first = self.client.get(self.url)
+        with mock.patch.object(ReceiptCache, 'invalidate') as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.sale.notes = 'Edited'
+                self.sale.save()
+        invalidate.assert_not_called()
+
+        # The edit re-renders under a new name; the sweep drops old renderings
+        self.assertNotEqual(self.client.get(self.url)['ETag'], first['ETag'])
+        cache = ReceiptCache()
+        self.assertEqual(len(cache.storage.listdir(str(self.sale.id))[1]), 2)
+        self.assertEqual(sweep_receipt_cache(max_age=3600), 0)
+        self.assertEqual(sweep_receipt_cache(max_age=-1), 2)
+        self.assertEqual(cache.storage.listdir(str(self.sale.id))[1], [])
+
+
+class ReceiptExportTest(SalesTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        products = self.make_products(2)
+        for _ in range(3):
+            with transaction.atomic():
+                engine = CheckoutEngine(self.shop, self.user)
+                engine.checkout(
+                    engine.prepare(self.basket(products)), payment_method='cash', status='completed'
+                )
+        self.today = timezone.now().date().isoformat()
+        self.url = (
+            f'/api/sales/export-receipts/?shop={self.shop.id}'
+            f'&start_date={self.today}&end_date={self.today}'
+        )
+
+    def read_zip(self, data):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            return {name: archive.read(name) for name in archive.namelist()}
+
+    @override_settings(RECEIPT_EXPORT_CHUNK_SIZE=2, RECEIPT_EXPORT_WORKERS=2)
+    def test_streams_zip_rendered_in_process_pool(self):
+        resp = self.client.get(self.url)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/zip')
+        pieces = list(resp.streaming_content)
+        # One piece per receipt plus the central directory
+        self.assertEqual(len(pieces), 4)
+        entries = self.read_zip(b''.join(pieces))
+        self.assertEqual(
+            {name.split('/receipt_')[1][:-4] for name in entries},
+            {str(pk) for pk in Sale.objects.values_list('id', flat=True)}
+        )
+        self.assertTrue(all(pdf.startswith(b'%PDF') for pdf in entries.values()))
+
+    def test_sales_are_read_in_chunks(self):
+        exporter = ReceiptExporter(self.shop, timezone.now().date(), timezone.now().date(),
+                                   chunk_size=2, workers=1)
+        # one sales cursor fetched in chunks, plus one items query per chunk
+        with self.assertNumQueries(3):
+            archive = b''.join(exporter.stream())
+        self.assertEqual(len(self.read_zip(archive)), 3)
+
+    def test_large_ranges_are_built_by_celery(self):
+        with mock.patch('sales.tasks.export_receipts_archive.delay') as delay:
+            delay.return_value.id = 'task-1'
+            resp = self.client.get(self.url + '&deliver=email')
+        self.assertEqual(resp.status_code, 202)
+        delay.assert_called_once_with(self.user.id, self.shop.id, self.today, self.today)
+
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        # Archives hold customer details; they are not kept under public media
+        self.assertFalse(
+            settings.RECEIPT_EXPORT_STORAGE['OPTIONS']['location'].startswith(settings.MEDIA_ROOT)
+        )
+        with override_settings(API_URL='http://api.test', RECEIPT_EXPORT_STORAGE={
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': media},
+        }):
+            name = export_receipts_archive(self.user.id, self.shop.id, self.today, self.today)
+
+        # The email carries an absolute, signed link to the download endpoint
+        link = re.search(r'https?://\S+', mail.outbox[0].body).group()
+        self.assertTrue(link.startswith('http://api.test/api/sales/download-receipts/?token='))
+        path = link.removeprefix('http://api.test')
+        anonymous = APIClient()
+        with override_settings(RECEIPT_EXPORT_STORAGE={
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': media},
+        }):
+            resp = anonymous.get(path)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(len(self.read_zip(b''.join(resp.streaming_content))), 3)
+            self.assertIn(name.split('/')[-1], resp['Content-Disposition'])
+
+            self.assertEqual(anonymous.get(path[:-2]).status_code, 403)
+            with override_settings(RECEIPT_EXPORT_LINK_MAX_AGE=-1):
+                self.assertEqual(anonymous.get(path).status_code, 410)
+            self.user.is_active = False
+            self.user.save()
+            self.assertEqual(anonymous.get(path).status_code, 403)
@@ -3,33 +3,59 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+from django.conf import settings
 from django.db import transaction
-from django.db.models import Sum, Count, F
+from django.core import signing
+from django.core.files.storage import storages
+from django.http import FileResponse, StreamingHttpResponse
+from django.db.models import Sum, Count, F, Prefetch, prefetch_related_objects
+from django.utils.dateparse import parse_date
 from .models import Sale, SaleItem
 from .serializers import (
-    SaleSerializer, CreateSaleSerializer, SaleListSerializer
+    SaleSerializer, CreateSaleSerializer, SaleListSerializer, SaleSyncSerializer
+)
+from .checkout import CheckoutEngine
+from .receipt_cache import ReceiptCache, receipt_response
+from .receipt_export import ReceiptExporter, read_download_token
+from .receipt_generator import ReceiptGenerator
+from .renderers import EscPosRenderer
+from .idempotency import (
+    get_idempotency_key, request_fingerprint, claim_idempotency_key, store_response
 )
 from users.permissions import HasShopAccess
-from products.models import Product, InventoryMovement
-import uuid
+from shops.models import Shop
+from shops.dates import local_window_q, shop_timezones
+from Apps.pagination import KeysetPagination
 
 
 class SaleViewSet(viewsets.ModelViewSet):
     """Sales management"""
     permission_classes = [IsAuthenticated, HasShopAccess]
+    pagination_class = KeysetPagination
     
     def get_serializer_class(self):
         if self.action == 'create':
             return CreateSaleSerializer
+        elif self.action == 'sync':
+            return SaleSyncSerializer
         elif self.action == 'list':
             return SaleListSerializer
         return SaleSerializer
     
     def get_queryset(self):
         user = self.request.user
-        queryset = Sale.objects.select_related(
-            'shop', 'cashier'
-        ).prefetch_related('items')
+        queryset = Sale.objects.select_related('shop', 'cashier')
+        
+        if self.action == 'list':
+            # List rows only need the count, computed in SQL
+            queryset = queryset.annotate(items_count=Sale.items_count_subquery())
+        elif self.action != 'print_receipt':
+            # Detail reads every item with its product; receipts only do on a cache miss
+            queryset = queryset.prefetch_related(
+                Prefetch('items', queryset=SaleItem.objects.select_related('product'))
+            )
         
         # Filter by shop access
         if user.role != 'admin':
@@ -40,142 +66,309 @@ class SaleViewSet(viewsets.ModelViewSet):
         if shop_id:
             queryset = queryset.filter(shop_id=shop_id)
         
-        # Filter by date range
+        # Filter by date range (shop-local days, as timestamp bounds)
         start_date = self.request.query_params.get('start_date')
         end_date = self.request.query_params.get('end_date')
-        if start_date:
-            queryset = queryset.filter(created_at__date__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(created_at__date__lte=end_date)
+        if start_date or end_date:
+            first_day = parse_date(start_date) if start_date else None
+            last_day = parse_date(end_date) if end_date else None
+            if (start_date and not first_day) or (end_date and not last_day):
+                raise ValidationError({'detail': 'Dates must be in YYYY-MM-DD format'})
+            
+            if shop_id:
+                shops = Shop.objects.filter(id=shop_id)
+            elif user.role == 'admin':
+                shops = Shop.objects.all()
+            else:
+                shops = user.assigned_shops.all()
+            queryset = queryset.filter(local_window_q(
+                shop_timezones(shops), lambda today: (first_day, last_day)
+            ))
         
         # Filter by status
         sale_status = self.request.query_params.get('status')
         if sale_status:
             queryset = queryset.filter(status=sale_status)
         
-        return queryset.order_by('-created_at')
+        return queryset.order_by('-created_at', '-id')
     
-    @transaction.atomic
     def create(self, request):
         """Create a sale with items and handle payment"""
-        serializer = CreateSaleSerializer(
-            data=request.data,
-            context={'request': request}
-        )
-        serializer.is_valid(raise_exception=True)
-        
-        data = serializer.validated_data
-        
-        # Calculate total
-        total_amount = sum(
-            (item['unit_price'] * item['quantity']) - item.get('discount', 0)
-            for item in data['items']
-        )
+        from payments.models import PaymentOutbox
         
-        # Create sale
-        from shops.models import Shop
-        shop = Shop.objects.get(id=data['shop_id'])
-        
-        sale = Sale.objects.create(
-            shop=shop,
-            cashier=request.user,
-            total_amount=total_amount,
-            payment_method=data['payment_method'],
-            customer_name=data.get('customer_name', ''),
-            customer_phone=data.get('customer_phone', ''),
-            customer_email=data.get('customer_email', ''),
-            notes=data.get('notes', ''),
-            status='pending'
-        )
+        key = get_idempotency_key(request)
+        record = None
         
-        # Create sale items and update stock
-        for item_data in data['items']:
-            product = Product.objects.select_for_update().get(
-                id=item_data['product_id']
+        # Stock phase: locks are held only for the duration of this block
+        with transaction.atomic():
+            if key:
+                fingerprint = request_fingerprint(request.data)
+                record, created = claim_idempotency_key(request.user, key, fingerprint)
+                if not created:
+                    return self._replay(record, fingerprint)
+            
+            serializer = CreateSaleSerializer(
+                data=request.data,
+                context={'request': request}
             )
+            serializer.is_valid(raise_exception=True)
             
-            # Deduct stock
-            product.current_stock -= item_data['quantity']
-            product.save()
+            data = serializer.validated_data
             
-            # Create sale item
-            SaleItem.objects.create(
-                sale=sale,
-                product=product,
-                quantity=item_data['quantity'],
-                unit_price=item_data['unit_price'],
-                discount=item_data.get('discount', 0)
-            )
+            basket = data['basket']
+            shop = basket.shop
             
-            # Record inventory movement
-            InventoryMovement.objects.create(
-                product=product,
-                quantity=-item_data['quantity'],
-                movement_type='sale',
-                reference_id=str(sale.id),
-                notes=f"Sale transaction",
-                created_by=request.user
+            # Products are already locked and checked by the serializer
+            engine = CheckoutEngine(shop, request.user)
+            sale = engine.checkout(
+                basket,
+                payment_method=data['payment_method'],
+                status='completed' if data['payment_method'] == 'cash' else 'pending',
+                customer_name=data.get('customer_name', ''),
+                customer_phone=data.get('customer_phone', ''),
+                customer_email=data.get('customer_email', ''),
+                notes=data.get('notes', ''),
             )
-        
-        # Handle payment based on method
-        if data['payment_method'] == 'cash':
-            # Cash payment - mark as completed immediately
-            sale.status = 'completed'
-            sale.save()
             
+            # Mobile money or card - queue the Paystack initialization in
+            # the same transaction; the HTTP call happens after commit
+            outbox = None
+            if data['payment_method'] != 'cash':
+                outbox = PaymentOutbox.objects.create(
+                    sale=sale,
+                    payload={
+                        'email': data.get('customer_email') or request.user.email,
+                        'amount': int(sale.total_amount * 100),  # Convert to kobo
+                        'reference': str(sale.id),
+                        'callback_url': request.build_absolute_uri('/api/payments/paystack/callback/'),
+                        'metadata': {
+                            'sale_id': str(sale.id),
+                            'shop_id': shop.id,
+                            'cashier_id': request.user.id
+                        }
+                    }
+                )
+            
+            if record is not None:
+                record.sale = sale
+                record.save(update_fields=['sale'])
+        
+        # Load items with their products in one query for the response
+        prefetch_related_objects(
+            [sale], Prefetch('items', queryset=SaleItem.objects.select_related('product'))
+        )
+        
+        response = self._sale_response(sale, outbox)
+        if record is not None:
+            store_response(record, response)
+        return response
+    
+    def _sale_response(self, sale, outbox):
+        """Build the create response, initializing payment if needed"""
+        from payments.models import PaymentOutbox
+        from payments.tasks import initialize_sale_payment
+        
+        if outbox is None:
+            # Cash payment - completed at checkout
             return Response(
                 SaleSerializer(sale).data,
                 status=status.HTTP_201_CREATED
             )
         
-        else:
-            # Mobile money or card - initiate Paystack payment
-            from payments.paystack import PaystackClient
-            
-            paystack = PaystackClient()
-            
-            payment_data = paystack.initialize_transaction(
-                email=data.get('customer_email', request.user.email),
-                amount=int(total_amount * 100),  # Convert to kobo
-                reference=str(sale.id),
-                callback_url=f"{request.build_absolute_uri('/api/payments/paystack/callback/')}",
-                metadata={
-                    'sale_id': str(sale.id),
-                    'shop_id': shop.id,
-                    'cashier_id': request.user.id
+        if settings.PAYSTACK_OUTBOX_ASYNC:
+            # A worker initializes the payment; the till polls payment-status
+            initialize_sale_payment.delay(outbox.id)
+            return Response({
+                'sale': SaleSerializer(sale).data,
+                'payment': outbox.as_payment_data(),
+            }, status=status.HTTP_202_ACCEPTED)
+        
+        # Post-commit phase: no product rows are locked during this call
+        initialize_sale_payment(outbox.id)
+        outbox.refresh_from_db()
+        sale.refresh_from_db(fields=['status', 'paystack_reference', 'updated_at'])
+        
+        if outbox.status == PaymentOutbox.STATUS_SENT:
+            return Response({
+                'sale': SaleSerializer(sale).data,
+                'payment': {
+                    'authorization_url': outbox.response['authorization_url'],
+                    'access_code': outbox.response['access_code'],
+                    'reference': outbox.response['reference']
                 }
+            }, status=status.HTTP_201_CREATED)
+        
+        if outbox.status == PaymentOutbox.STATUS_FAILED:
+            return Response(
+                {'error': 'Payment initialization failed'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            
-            if payment_data:
-                sale.paystack_reference = payment_data['reference']
-                sale.save()
-                
-                return Response({
-                    'sale': SaleSerializer(sale).data,
-                    'payment': {
-                        'authorization_url': payment_data['authorization_url'],
-                        'access_code': payment_data['access_code'],
-                        'reference': payment_data['reference']
-                    }
-                }, status=status.HTTP_201_CREATED)
+        
+        # Another worker holds the entry; the till can poll for the result
+        return Response({
+            'sale': SaleSerializer(sale).data,
+            'payment': outbox.as_payment_data(),
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    def _replay(self, record, fingerprint):
+        """Answer a retried submission from its stored outcome"""
+        if record.fingerprint != fingerprint:
+            return Response(
+                {'error': 'Idempotency-Key was already used for a different sale'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        
+        if record.response_status is not None:
+            response = Response(record.response_body, status=record.response_status)
+        elif record.sale is None:
+            # The sale was deleted (or archived) after committing
+            response = Response(
+                {'error': 'The sale created with this Idempotency-Key no longer exists'},
+                status=status.HTTP_410_GONE
+            )
+        else:
+            # The sale committed but its response was never stored
+            sale = record.sale
+            if sale.payment_method == 'cash':
+                response = Response(SaleSerializer(sale).data, status=status.HTTP_201_CREATED)
             else:
-                # Payment initialization failed
-                sale.status = 'failed'
-                sale.save()
-                
-                return Response(
-                    {'error': 'Payment initialization failed'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+                payment = getattr(sale, 'payment_outbox', None)
+                response = Response({
+                    'sale': SaleSerializer(sale).data,
+                    'payment': payment.as_payment_data() if payment else None,
+                }, status=status.HTTP_202_ACCEPTED)
+        
+        response['Idempotent-Replayed'] = 'true'
+        return response
     
-    @action(detail=True, methods=['get'], url_path='print-receipt')
-    def print_receipt(self, request, pk=None):
-        """Generate and download PDF receipt for a sale"""
-        from django.http import FileResponse
-        from .receipt_generator import ReceiptGenerator
+    @action(detail=False, methods=['post'])
+    def sync(self, request):
+        """Upload a batch of sales queued while a till was offline"""
+        from .sync import OfflineSyncEngine
+        
+        serializer = SaleSyncSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        results = OfflineSyncEngine(request.user).sync(
+            serializer.validated_data['sales']
+        )
+        
+        counts = {'created': 0, 'duplicate': 0, 'error': 0}
+        for result in results:
+            counts[result['status']] += 1
+        
+        return Response({
+            'created': counts['created'],
+            'duplicates': counts['duplicate'],
+            'failed': counts['error'],
+            'results': results,
+        })
+    
+    @action(detail=True, methods=['get'], url_path='payment-status')
+    def payment_status(self, request, pk=None):
+        """Poll the Paystack initialization state of a sale"""
+        from payments.models import PaymentOutbox
         
         sale = self.get_object()
         
+        try:
+            payment = sale.payment_outbox.as_payment_data()
+        except PaymentOutbox.DoesNotExist:
+            payment = None
+        
+        return Response({
+            'sale_id': str(sale.id),
+            'sale_status': sale.status,
+            'payment': payment,
+        })
+    
+    @action(detail=False, methods=['get'], url_path='export-receipts')
+    def export_receipts(self, request):
+        """Stream a ZIP of every completed sale receipt for a shop and date range"""
+        from .tasks import export_receipts_archive
+        
+        shop_id = request.query_params.get('shop')
+        start_date = request.query_params.get('start_date')
+        end_date = request.query_params.get('end_date')
+        if not (shop_id and start_date and end_date):
+            return Response(
+                {'error': 'shop, start_date and end_date are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        first_day, last_day = parse_date(start_date), parse_date(end_date)
+        if not (first_day and last_day) or first_day > last_day:
+            raise ValidationError({'detail': 'Dates must be in YYYY-MM-DD format, start first'})
+        
+        shops = Shop.objects.all()
+        if request.user.role != 'admin':
+            shops = request.user.assigned_shops.all()
+        shop = shops.filter(id=shop_id).first()
+        if shop is None:
+            return Response({'error': 'Shop not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        exporter = ReceiptExporter(shop, first_day, last_day)
+        if (
+            request.query_params.get('deliver') == 'email'
+            or exporter.get_queryset().count() > settings.RECEIPT_EXPORT_STREAM_MAX
+        ):
+            task = export_receipts_archive.delay(
+                request.user.id, shop.id, first_day.isoformat(), last_day.isoformat()
+            )
+            return Response({
+                'detail': 'The export is being prepared; a download link will be emailed to you',
+                'task_id': task.id,
+            }, status=status.HTTP_202_ACCEPTED)
+        
+        response = StreamingHttpResponse(exporter.stream(), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{exporter.filename}"'
+        return response
+    
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path='download-receipts',
+        authentication_classes=[],
+        permission_classes=[]
+    )
+    def download_receipts(self, request):
+        """Serve an emailed receipt export; the signed token is the credential"""
+        from users.models import User
+        
+        try:
+            grant = read_download_token(request.query_params.get('token', ''))
+        except signing.SignatureExpired:
+            return Response({'error': 'This download link has expired'}, status=status.HTTP_410_GONE)
+        except signing.BadSignature:
+            return Response({'error': 'Invalid download link'}, status=status.HTTP_403_FORBIDDEN)
+        
+        # The link only works while its owner can still see the shop
+        user = User.objects.filter(id=grant['user'], is_active=True).first()
+        if user is None or (
+            user.role != 'admin' and not user.assigned_shops.filter(id=grant['shop']).exists()
+        ):
+            return Response({'error': 'Invalid download link'}, status=status.HTTP_403_FORBIDDEN)
+        
+        storage = storages.create_storage(settings.RECEIPT_EXPORT_STORAGE)
+        if not storage.exists(grant['name']):
+            return Response({'error': 'Export not found'}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(
+            storage.open(grant['name'], 'rb'),
+            as_attachment=True,
+            filename=grant['name'].rsplit('/', 1)[-1],
+            content_type='application/zip'
+        )
+    
+    @action(
+        detail=True,
+        methods=['get'],
+        url_path='print-receipt',
+        renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, EscPosRenderer]
+    )
+    def print_receipt(self, request, pk=None):
+        """Download the receipt for a sale: a cached PDF, or ESC/POS bytes with ?format=escpos"""
+        sale = self.get_object()
+        
         # Only allow receipt printing for completed sales
         if sale.status != 'completed':
             return Response(
@@ -183,16 +376,29 @@ class SaleViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Generate PDF receipt
-        generator = ReceiptGenerator(sale)
-        pdf_buffer = generator.generate_pdf()
+        last_modified = max(sale.updated_at, sale.shop.updated_at)
+        receipt_name = f'receipt_{sale.receipt_number}'
         
-        # Return PDF as downloadable file
-        response = FileResponse(
-            pdf_buffer,
-            content_type='application/pdf',
-            as_attachment=True,
-            filename=f'receipt_{str(sale.id)[:8]}.pdf'
-        )
+        if request.query_params.get('format') == EscPosRenderer.format:
+            # Raw printer commands render in well under a millisecond; no cache needed
+            prefetch_related_objects(
+                [sale], Prefetch('items', queryset=SaleItem.objects.select_related('product'))
+            )
+            return receipt_response(
+                request,
+                ReceiptGenerator(sale).generate_escpos(),
+                f'{ReceiptCache.digest(sale)}-escpos',
+                last_modified=last_modified,
+                filename=f'{receipt_name}.bin',
+                content_type=EscPosRenderer.media_type
+            )
         
-        return response
\ No newline at end of file
+        pdf, digest = ReceiptCache().get_or_render(sale)
+        
+        return receipt_response(
+            request,
+            pdf,
+            digest,
+            last_modified=last_modified,
+            filename=f'{receipt_name}.pdf'
+        )
@@ -7,12 +7,14 @@ from django.db import transaction
 from .models import Shift, ShiftActivity
 from .serializers import ShiftSerializer, ShiftActivitySerializer
 from users.permissions import IsManagerOrAdmin
+from Apps.pagination import ShiftPagination
 
 
 class ShiftViewSet(viewsets.ReadOnlyModelViewSet):
     """Shift management"""
     serializer_class = ShiftSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ShiftPagination
     
     def get_queryset(self):
         user = self.request.user
@@ -39,7 +41,7 @@ class ShiftViewSet(viewsets.ReadOnlyModelViewSet):
         if shift_status:
             queryset = queryset.filter(status=shift_status)
         
-        return queryset.order_by('-start_time')
+        return queryset.order_by('-start_time', '-id')
     
     @action(detail=True, methods=['get'])
     def report(self, request, pk=None):
@@ -0,0 +1,89 @@
+# apps/shops/dates.py
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.db.models import Q
+from django.utils import timezone
+
+
+def get_zone(name):
+    """ZoneInfo for a shop's timezone name, falling back to UTC"""
+    try:
+        return ZoneInfo(name or 'UTC')
+    except (ZoneInfoNotFoundError, ValueError):
+        return dt_timezone.utc
+
+
+def shop_zone(shop):
+    return get_zone(shop.timezone)
+
+
+def local_today(zone):
+    """Today's date on the shop's wall clock"""
+    return timezone.now().astimezone(zone).date()
+
+
+def day_range_bounds(first_day, last_day, zone):
+    """Half-open UTC bounds ``[start, end)`` covering local days first..last.
+
+    Filtering ``created_at >= start AND created_at < end`` keeps the
+    column bare, so the ``(shop, -created_at)`` index is range-scanned.
+    Either day may be None for an open-ended range.
+    """
+    start = end = None
+    if first_day is not None:
+        start = datetime.combine(first_day, time.min, tzinfo=zone).astimezone(dt_timezone.utc)
+    if last_day is not None:
+        end = datetime.combine(
+            last_day + timedelta(days=1), time.min, tzinfo=zone
+        ).astimezone(dt_timezone.utc)
+    return start, end
+
+
+def window_q(first_day, last_day, zone, field='created_at'):
+    """Q for the local days first..last in a single timezone"""
+    start, end = day_range_bounds(first_day, last_day, zone)
+    q = Q()
+    if start is not None:
+        q &= Q(**{f'{field}__gte': start})
+    if end is not None:
+        q &= Q(**{f'{field}__lt': end})
+    return q
+
+
+def shop_timezones(shops):
+    """Group shop ids by timezone name: ``{'Africa/Accra': [1, 2], ...}``"""
+    groups = defaultdict(list)
+    for shop_id, name in shops.values_list('id', 'timezone'):
+        groups[name or 'UTC'].append(shop_id)
+    return dict(groups)
+
+
+def primary_zone(timezones):
+    """Zone shared by most shops in a set, used to bucket mixed-zone series"""
+    if not timezones:
+        return dt_timezone.utc
+    counts = Counter({name: len(ids) for name, ids in timezones.items()})
+    return get_zone(counts.most_common(1)[0][0])
+
+
+def local_window_q(timezones, days, field='created_at', shop_field='shop_id'):
+    """Q selecting rows inside a shop-local date window for a set of shops.
+
+    ``timezones`` comes from ``shop_timezones``. ``days`` is called with
+    each zone's local today and returns ``(first_day, last_day)``, e.g.
+    ``lambda today: (today - timedelta(days=7), today)``. Shops sharing a
+    zone share one range predicate.
+    """
+    if len(timezones) == 1:
+        zone = get_zone(next(iter(timezones)))
+        return window_q(*days(local_today(zone)), zone, field=field)
+
+    q = Q(pk__in=[])
+    for name, shop_ids in timezones.items():
+        zone = get_zone(name)
+        q |= Q(**{f'{shop_field}__in': shop_ids}) & window_q(
+            *days(local_today(zone)), zone, field=field
+        )
+    return q
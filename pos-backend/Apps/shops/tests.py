@@ -1,3 +1,35 @@
+from datetime import date, datetime, timezone as dt_timezone
+
 from django.test import TestCase
 
-# Create your tests here.
+from sales.models import Sale
+from .dates import day_range_bounds, get_zone, local_window_q, shop_timezones
+from .models import Shop
+
+
+class DateWindowTest(TestCase):
+    def test_local_day_maps_to_half_open_utc_bounds(self):
+        start, end = day_range_bounds(
+            date(2026, 3, 1), date(2026, 3, 1), get_zone('Africa/Lagos')
+        )
+        self.assertEqual(start, datetime(2026, 2, 28, 23, 0, tzinfo=dt_timezone.utc))
+        self.assertEqual(end, datetime(2026, 3, 1, 23, 0, tzinfo=dt_timezone.utc))
+
+    def test_open_ended_range(self):
+        start, end = day_range_bounds(date(2026, 3, 1), None, get_zone('UTC'))
+        self.assertEqual(start, datetime(2026, 3, 1, tzinfo=dt_timezone.utc))
+        self.assertIsNone(end)
+
+    def test_unknown_zone_falls_back_to_utc(self):
+        self.assertEqual(get_zone('Not/AZone'), dt_timezone.utc)
+
+    def test_mixed_zones_get_one_predicate_each(self):
+        accra = Shop.objects.create(name='Accra', address='-', phone='0', timezone='Africa/Accra')
+        lagos = Shop.objects.create(name='Lagos', address='-', phone='0', timezone='Africa/Lagos')
+        timezones = shop_timezones(Shop.objects.all())
+        self.assertEqual(timezones, {'Africa/Accra': [accra.id], 'Africa/Lagos': [lagos.id]})
+
+        q = local_window_q(timezones, lambda today: (today, today))
+        sql = str(Sale.objects.filter(q).query)
+        self.assertNotIn('::date', sql)
+        self.assertIn('"created_at" >=', sql)
@@ -5,9 +5,9 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.db.models import Count, Sum, Q, F
-from django.utils import timezone
 from datetime import timedelta
 from .models import Shop
+from .dates import local_today, shop_zone, window_q
 from .serializers import ShopSerializer
 from users.permissions import IsAdmin, HasShopAccess
 
@@ -61,7 +61,16 @@ class ShopViewSet(viewsets.ModelViewSet):
     def kpis(self, request, pk=None):
         """Get shop KPIs"""
         shop = self.get_object()
-        today = timezone.now().date()
+        from reports.cache import ReportCache
+
+        data = ReportCache('kpis', {shop.timezone or 'UTC': [shop.id]}).get_or_compute(
+            lambda: self.compute_kpis(shop)
+        )
+        return Response(data)
+
+    def compute_kpis(self, shop):
+        zone = shop_zone(shop)
+        today = local_today(zone)
         yesterday = today - timedelta(days=1)
         last_7_days = today - timedelta(days=7)
         
@@ -70,9 +79,9 @@ class ShopViewSet(viewsets.ModelViewSet):
         
         # Today's sales
         today_sales = Sale.objects.filter(
+            window_q(today, today, zone),
             shop=shop,
-            status='completed',
-            created_at__date=today
+            status='completed'
         ).aggregate(
             total=Sum('total_amount'),
             count=Count('id')
@@ -80,9 +89,9 @@ class ShopViewSet(viewsets.ModelViewSet):
         
         # Yesterday's sales
         yesterday_sales = Sale.objects.filter(
+            window_q(yesterday, yesterday, zone),
             shop=shop,
-            status='completed',
-            created_at__date=yesterday
+            status='completed'
         ).aggregate(
             total=Sum('total_amount'),
             count=Count('id')
@@ -90,9 +99,9 @@ class ShopViewSet(viewsets.ModelViewSet):
         
         # Last 7 days
         week_sales = Sale.objects.filter(
+            window_q(last_7_days, today, zone),
             shop=shop,
-            status='completed',
-            created_at__date__gte=last_7_days
+            status='completed'
         ).aggregate(
             total=Sum('total_amount'),
             count=Count('id')
@@ -105,7 +114,7 @@ class ShopViewSet(viewsets.ModelViewSet):
             current_stock__lte=F('reorder_level')
         ).count()
         
-        return Response({
+        return {
             'today': {
                 'revenue': today_sales['total'] or 0,
                 'transactions': today_sales['count'] or 0
@@ -119,4 +128,4 @@ class ShopViewSet(viewsets.ModelViewSet):
                 'transactions': week_sales['count'] or 0
             },
             'low_stock_count': low_stock
-        })
\ No newline at end of file
+        }